@@ -7,149 +7,262 @@ This script demonstrates:
 - YOLOv12 object detection
 - OpenCV visualization
 - FPS monitoring (24+ FPS optimized)
+- Pipelined capture / inference / render threads
 
 Classes detected: CT, CT_head, T, T_head
 """
 
+import argparse
 import cv2
-import numpy as np
-import mss
+import os
 from pathlib import Path
-from ultralytics import YOLO
 import time
 import sys
-import psutil
-import win32gui
-import win32process
+import threading
 
-def find_cs2_process():
-    """Find CS2.exe process and return PID"""
-    for proc in psutil.process_iter(['pid', 'name']):
-        try:
-            if proc.info['name'].lower() == 'cs2.exe':
-                return proc.info['pid']
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    return None
+# Shared pipeline helpers live in python/
+python_path = Path(__file__).parent / "python"
+if python_path.exists():
+    sys.path.insert(0, str(python_path))
 
-def find_window_by_pid(pid):
-    """Find window handle by process ID"""
-    result = []
-    
-    def callback(hwnd, _):
-        if win32gui.IsWindowVisible(hwnd):
-            _, window_pid = win32process.GetWindowThreadProcessId(hwnd)
-            if window_pid == pid:
-                result.append(hwnd)
-        return True
-    
-    win32gui.EnumWindows(callback, None)
-    
-    # Return the main window (usually the first visible one)
-    return result[0] if result else None
+from pipeline import LatestQueue, StageWorker, QueueClosed, format_queue_stats
+from frame_sources import SourceError, open_source
+from frame_pool import FramePool, as_bgr, format_pool_stats
+from preprocess import Letterbox, restore_boxes
+from change_gate import FrameChangeGate, format_gate_stats
+from detections import Detections
+from roi import CenterRoi
+from tiling import TiledDetector, format_tile_stats
+from overlay import OverlayRenderer
+from hud import LayerCache
+from result_sink import FORMATS, ResultSink, SinkError, format_sink_stats
+from instrumentation import Instrumentation, format_latency_stats
+from tracing import NULL_TRACER, Tracer, format_trace_stats
+from recorder import FORMATS as RECORD_FORMATS, FrameRecorder, format_recorder_stats
+from detection_service import DEFAULT_ADDRESS, DetectionClient, ServiceError, format_service_info
+from tracker import DetectionScheduler, KalmanBoxTracker, TrackingDetector, format_track_stats
+from model_registry import RegistryError, resolve_weights
+from onnx_backend import BACKENDS, BackendError, OnnxDetector
 
-def get_window_rect_for_mss(hwnd):
-    """Get window rectangle for MSS capture - captures full client area"""
-    try:
-        # Get window position
-        rect = win32gui.GetWindowRect(hwnd)
-        left, top, right, bottom = rect
-        
-        # Get client area size (actual game rendering area)
-        client_rect = win32gui.GetClientRect(hwnd)
-        client_width = client_rect[2] - client_rect[0]
-        client_height = client_rect[3] - client_rect[1]
-        
-        # Calculate window borders
-        window_width = right - left
-        window_height = bottom - top
-        
-        border_left = (window_width - client_width) // 2
-        border_top = window_height - client_height - border_left
-        
-        return {
-            'left': left + border_left,
-            'top': top + border_top,
-            'width': client_width,
-            'height': client_height
-        }
-    except Exception as e:
-        print(f"[WARNING] Failed to get window rect: {e}")
-        return None
+# Timed pipeline stages, in HUD / console order
+LATENCY_STAGES = ('capture', 'preprocess', 'inference', 'postprocess',
+                  'draw', 'display', 'end_to_end')
+
+def parse_args(argv=None):
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="CS2 YOLOv12 detection demo")
+    parser.add_argument('--source', default='cs2',
+                        help="cs2 (default), a video file, an image directory, "
+                             "a camera index or synthetic[:WxH[@FPS]]")
+    parser.add_argument('--loop', action='store_true',
+                        help="restart video / image sources when they run out")
+    parser.add_argument('--realtime', action='store_true',
+                        help="pace video files at their native FPS")
+    parser.add_argument('--max-frames', type=int, default=0,
+                        help="stop after this many captured frames (0 = no limit)")
+    parser.add_argument('--preprocess', choices=['fused', 'ultralytics'], default='fused',
+                        help="fused: BGRA capture -> letterboxed tensor in one resize "
+                             "(default); ultralytics: BGR frame through YOLO's own letterbox")
+    parser.add_argument('--change-threshold', type=float, default=0,
+                        help="reuse the previous detections when the frame changed by at "
+                             "most this many grey levels per block, e.g. 2 (default 0: off, "
+                             "always infer)")
+    parser.add_argument('--max-skip', type=int, default=30,
+                        help="with --change-threshold, force inference after this many "
+                             "consecutive skipped frames")
+    parser.add_argument('--roi', type=int, default=0,
+                        help="run the model on a native-resolution SIZE x SIZE window around "
+                             "the crosshair instead of the whole frame (0 = off)")
+    parser.add_argument('--roi-full-every', type=int, default=10,
+                        help="in ROI mode, also run a full-frame pass every N frames to "
+                             "refresh the periphery (0 = never)")
+    parser.add_argument('--tiles', action='store_true',
+                        help="sliced inference: overlapping native-resolution tiles run as "
+                             "batched forward passes (for 1440p/4K and recordings)")
+    parser.add_argument('--tile-size', type=int, default=640, help="tile edge in pixels")
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help="fractional tile overlap")
+    parser.add_argument('--tile-batch', type=int, default=8, help="tiles per forward pass")
+    parser.add_argument('--track', action='store_true',
+                        help="run the model only every few frames and propagate boxes with "
+                             "a Kalman/IoU tracker in between (adds track IDs)")
+    parser.add_argument('--detect-every', type=int, default=6,
+                        help="in tracking mode, the longest gap in frames between model passes; "
+                             "the actual gap adapts to motion")
+    parser.add_argument('--track-min-conf', type=float, default=0.25,
+                        help="in tracking mode, run the model early once a tracked box's "
+                             "confidence, lowered as its predicted position grows uncertain, "
+                             "drops below this")
+    parser.add_argument('--headless', action='store_true',
+                        help="no window: stream detections to --output instead of displaying")
+    parser.add_argument('--output', default=None,
+                        help="write per-frame detections to a file, named pipe, '-' (stdout), "
+                             "tcp://HOST:PORT or unix:///PATH")
+    parser.add_argument('--format', choices=FORMATS, default='ndjson',
+                        help="result encoding: ndjson (default) or compact binary records")
+    parser.add_argument('--lossless', action='store_true',
+                        help="process every frame: capture waits for inference instead of "
+                             "dropping frames (for recorded sessions)")
+    parser.add_argument('--latency-json', default='demo_latency.json',
+                        help="write per-stage latency percentiles here on exit ('' = off)")
+    parser.add_argument('--weights', default=None, metavar='PATH|latest|fastest|accurate',
+                        help="model to load: a path, or picked from the model registry "
+                             "(default: latest run's best.pt)")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="torch: Ultralytics / PyTorch (GPU if available); onnx: the exported "
+                             "best.onnx on ONNX Runtime, CPU only, without importing torch")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="with --backend onnx, ONNX Runtime intra-op threads (default: automatic)")
+    parser.add_argument('--service', nargs='?', const=DEFAULT_ADDRESS, default=None,
+                        metavar='ADDRESS',
+                        help="send frames to a running detection_service.py instead of loading "
+                             f"the model here (default address {DEFAULT_ADDRESS})")
+    parser.add_argument('--trace', default=None, metavar='FILE',
+                        help="record a per-frame timeline of every stage and save it as Chrome "
+                             "trace JSON (chrome://tracing, ui.perfetto.dev) on exit and on 't'")
+    parser.add_argument('--trace-buffer', type=int, default=200_000,
+                        help="trace ring buffer size in events (oldest are overwritten)")
+    parser.add_argument('--record', action='store_true',
+                        help="record the session from the start (toggle with 'v'); the window "
+                             "view with overlay, or raw frames when headless")
+    parser.add_argument('--record-dir', default='recordings',
+                        help="where recordings (one folder per session) are written")
+    parser.add_argument('--record-format', choices=RECORD_FORMATS, default='video',
+                        help="video: MP4 segments; jpeg: folders of JPEG frames")
+    parser.add_argument('--record-fps', type=float, default=30.0,
+                        help="recorded frame rate (extra frames are skipped before copying)")
+    parser.add_argument('--record-segment', type=float, default=60.0,
+                        help="start a new segment every this many seconds")
+    parser.add_argument('--record-workers', type=int, default=2,
+                        help="JPEG encoder threads (video segments use one)")
+    args = parser.parse_args(argv)
+    if args.tiles and args.roi:
+        parser.error("--tiles and --roi are mutually exclusive")
+    if args.tiles and args.service:
+        parser.error("--tiles needs the model in this process (not available with --service)")
+    if args.tiles and args.backend == 'onnx':
+        parser.error("--tiles needs the PyTorch backend (not available with --backend onnx)")
+    if args.headless and not args.output:
+        parser.error("--headless needs --output")
+    return args
 
-def main():
+def main(args=None):
     """Main detection demo function"""
+    if args is None:
+        args = parse_args()
+    if args.output == '-':
+        # stdout carries the results; console messages go to stderr
+        sys.stdout = sys.stderr
     
-    # Load YOLOv12 model
-    model_path = Path("runs/train/weights/best.pt")
-    
-    if not model_path.exists():
-        print(f"[ERROR] Model not found: {model_path}")
-        print("Please train the model first using start_training.bat")
-        input("\nPress Enter to exit...")
-        sys.exit(1)
-    
-    print(f"[INFO] Loading YOLOv12 model...")
-    model = YOLO(str(model_path))
-    
-    # Force GPU if available
-    import torch
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    model.to(device)
-    print(f"[INFO] Model loaded successfully on {device.upper()}!")
-    
-    # Find CS2.exe process
-    print("[INFO] Searching for CS2.exe process...")
-    cs2_pid = find_cs2_process()
-    
-    if not cs2_pid:
-        print("[ERROR] CS2.exe process not found!")
-        print("[INFO] Please start Counter-Strike 2 and try again.")
-        input("\nPress Enter to exit...")
-        sys.exit(1)
-    
-    print(f"[INFO] CS2.exe found! (PID: {cs2_pid})")
-    
-    # Find CS2 window
-    print("[INFO] Locating CS2 window...")
-    hwnd = find_window_by_pid(cs2_pid)
+    client = None
+    onnx = None
+    if args.service:
+        # The model stays loaded and warm in the service process
+        try:
+            client = DetectionClient(args.service).connect()
+        except ServiceError as e:
+            print(f"[ERROR] {e}")
+            print("Start the service first: python python/detection_service.py")
+            if not args.headless:
+                input("\nPress Enter to exit...")
+            sys.exit(1)
+        model, names, device = None, client.names, client.device
+        print(f"[INFO] Using detection service: {format_service_info(client)}")
+    else:
+        # Load YOLOv12 model (newest run's best.pt unless --weights says otherwise)
+        fmt = 'onnx' if args.backend == 'onnx' else 'pt'
+        try:
+            model_path = resolve_weights(args.weights, fmt)
+        except RegistryError as e:
+            print(f"[ERROR] {e}")
+            model_path = None
+        
+        if not model_path:
+            print(f"[ERROR] Model not found: {args.weights or f'no best.{fmt} under runs/'}")
+            if fmt == 'onnx':
+                print("Please export the model first: python python/export_model.py (ONNX)")
+            else:
+                print("Please train the model first using start_training.bat")
+            if not args.headless:
+                input("\nPress Enter to exit...")
+            sys.exit(1)
+        
+        print(f"[INFO] Loading YOLOv12 model...")
+        print(f"[INFO] Weights: {model_path}")
+        if args.backend == 'onnx':
+            # CPU inference through ONNX Runtime; torch is never imported
+            try:
+                onnx = OnnxDetector(model_path, intra_threads=args.threads)
+            except BackendError as e:
+                print(f"[ERROR] {e}")
+                if not args.headless:
+                    input("\nPress Enter to exit...")
+                sys.exit(1)
+            onnx.warmup()
+            model, names, device = None, onnx.names, 'cpu'
+            print(f"[INFO] Model loaded: {onnx.describe()}")
+        else:
+            from ultralytics import YOLO
+            
+            model = YOLO(str(model_path))
+            names = model.names
+            
+            # Force GPU if available
+            import torch
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            model.to(device)
+            print(f"[INFO] Model loaded successfully on {device.upper()}!")
     
-    if not hwnd:
-        print("[ERROR] CS2 window not found!")
-        print("[INFO] Make sure CS2 is not minimized.")
-        input("\nPress Enter to exit...")
+    # Open frame source (CS2 window by default)
+    try:
+        source = open_source(args.source, loop=args.loop, realtime=args.realtime)
+        source.open()
+    except SourceError as e:
+        print(f"[ERROR] {e}")
+        if not args.headless:
+            input("\nPress Enter to exit...")
         sys.exit(1)
     
-    print(f"[INFO] CS2 window found! (Handle: {hwnd})")
-    
-    # Get window capture region
-    capture_region = get_window_rect_for_mss(hwnd)
-    
-    if not capture_region:
-        print("[ERROR] Failed to get CS2 window region!")
-        input("\nPress Enter to exit...")
-        sys.exit(1)
+    window_width = source.width
+    window_height = source.height
+    print(f"[INFO] Source resolution: {window_width}x{window_height}")
     
-    window_width = capture_region['width']
-    window_height = capture_region['height']
-    print(f"[INFO] CS2 resolution: {window_width}x{window_height}")
+    # Per-frame results for downstream consumers (written off-thread)
+    sink = None
+    if args.output:
+        try:
+            sink = ResultSink(args.output, args.format, header={
+                'names': names,
+                'source': source.describe(),
+                'width': window_width,
+                'height': window_height,
+            }).open()
+        except SinkError as e:
+            print(f"[ERROR] {e}")
+            source.close()
+            sys.exit(1)
+        print(f"[INFO] Writing {args.format} results to {args.output}")
     
     # Calculate display size (half of game resolution)
     display_width = window_width // 2
     display_height = window_height // 2
-    print(f"[INFO] Display window: {display_width}x{display_height} (50% scale)")
-    print("\n[INFO] Starting detection demo...")
-    print("[INFO] Controls:")
-    print("  - Press 'q' to quit")
-    print("  - Press 's' to save screenshot")
-    print("  - Press 'c' to toggle class names")
-    print("  - Press 'r' to reconnect to CS2 window")
-    print("\n")
-    
-    # Create window with fixed size
     window_name = 'CS2 YOLOv12 Detection Demo'
-    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.resizeWindow(window_name, display_width, display_height)
+    if args.headless:
+        print("\n[INFO] Starting headless detection (Ctrl+C to stop)...")
+    else:
+        print(f"[INFO] Display window: {display_width}x{display_height} (50% scale)")
+        print("\n[INFO] Starting detection demo...")
+        print("[INFO] Controls:")
+        print("  - Press 'q' to quit")
+        print("  - Press 's' to save screenshot")
+        print("  - Press 'v' to start/stop recording")
+        print("  - Press 'c' to toggle class names")
+        print("  - Press 'r' to reconnect to the source (CS2 window)")
+        print("  - Press 't' to save a trace snapshot (with --trace)")
+        print("\n")
+        
+        # Create window with fixed size
+        cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(window_name, display_width, display_height)
     
     # FPS tracking
     fps = 0
@@ -158,6 +271,14 @@ def main():
     show_class_names = True
     screenshot_count = 0
     
+    # Screenshots and recordings are encoded and written off the render thread
+    recorder = FrameRecorder(args.record_dir, args.record_format, fps=args.record_fps,
+                             segment_seconds=args.record_segment,
+                             workers=args.record_workers).open()
+    if args.record:
+        print(f"[INFO] Recording to {recorder.start()}")
+    trace_count = 0
+    
     # Performance optimization: use smaller inference size
     inference_size = 640  # Reduced from default for speed
     
@@ -169,196 +290,493 @@ def main():
         'T_head': (0, 128, 255),  # Orange for T head
     }
     
+    renderer = OverlayRenderer(names, colors)
+    
     print("[DEMO] Running... (displaying detections)")
-    print(f"[INFO] Capturing CS2.exe window (PID: {cs2_pid})")
+    print(f"[INFO] Capturing from {source.describe()}")
     print(f"[INFO] Inference size: {inference_size}x{inference_size} for speed")
+    print(f"[INFO] Preprocessing: {args.preprocess}")
+    if args.change_threshold > 0:
+        print(f"[INFO] Change gating: skip frames with change <= {args.change_threshold:g}")
+    roi = CenterRoi(args.roi, args.roi_full_every) if args.roi > 0 else None
+    if roi is not None:
+        refresh = f"full frame every {roi.full_every}" if roi.full_every > 0 else "no full-frame pass"
+        print(f"[INFO] ROI mode: {roi.size}x{roi.size} around crosshair, {refresh}")
     
-    # MSS instance
-    sct = mss.mss()
+    # Pipeline: capture -> inference -> render run on separate threads,
+    # connected by bounded drop-oldest queues so inference always sees the
+    # freshest frame and capture/drawing overlap with the model.
+    stop_event = threading.Event()
+    reconnect_event = threading.Event()
     
-    try:
-        while True:
-            loop_start = time.time()
-            
-            # Check if CS2 process still exists
-            if not psutil.pid_exists(cs2_pid):
-                print("\n[WARNING] CS2 process terminated!")
-                break
-            
-            # Fast CS2 window capture with MSS (full resolution)
-            try:
-                screenshot = sct.grab(capture_region)
-                frame = np.asarray(screenshot, dtype=np.uint8)
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-                
-                # Verify captured size matches expected
-                if frame.shape[1] != window_width or frame.shape[0] != window_height:
-                    print(f"[WARNING] Captured size mismatch: {frame.shape[1]}x{frame.shape[0]} vs {window_width}x{window_height}")
-                    # Update capture region
-                    capture_region = get_window_rect_for_mss(hwnd)
-                    if capture_region:
-                        window_width = capture_region['width']
-                        window_height = capture_region['height']
-                        display_width = window_width // 2
-                        display_height = window_height // 2
-                        cv2.resizeWindow(window_name, display_width, display_height)
-                    continue
-                    
-            except Exception as e:
-                print(f"[WARNING] Capture failed: {e}")
-                print("[INFO] Trying to reconnect to CS2 window...")
-                capture_region = get_window_rect_for_mss(hwnd)
-                if not capture_region:
-                    print("[ERROR] Failed to reconnect!")
-                    break
-                continue
-            
-            # OPTIMIZED: Run inference on full frame at reduced size for speed
-            # YOLOv12 with imgsz=640, half precision if possible, low conf threshold
-            results = model(
-                frame, 
-                imgsz=inference_size,
-                conf=0.4,  # Lower threshold for better recall
-                iou=0.5,
-                half=True if device == 'cuda' else False,  # FP16 on GPU
-                verbose=False,
-                device=device
-            )
-            
-            # Process detections and draw on frame
-            detection_count = 0
-            if len(results) > 0 and results[0].boxes is not None:
-                boxes = results[0].boxes
-                detection_count = len(boxes)
-                
-                for box in boxes:
-                    # Get box coordinates (already scaled by YOLO)
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    
-                    # Get class info
-                    conf = float(box.conf[0].cpu().numpy())
-                    cls = int(box.cls[0].cpu().numpy())
-                    class_name = model.names[cls]
-                    
-                    # Get color
-                    color = colors.get(class_name, (0, 255, 0))
-                    
-                    # Draw box
-                    thickness = 3 if 'head' in class_name.lower() else 2
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
-                    
-                    # Draw label (optimized)
-                    if show_class_names:
-                        label = f"{class_name} {conf:.2f}"
-                        font_scale = 0.5
-                        cv2.putText(frame, label, (x1 + 5, y1 - 5),
-                                   cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
-                    
-                    # Draw center point
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-                    cv2.circle(frame, (center_x, center_y), 4, color, -1)
-            
-            # Draw crosshair (simplified)
-            center_x = window_width // 2
-            center_y = window_height // 2
-            cv2.drawMarker(frame, (center_x, center_y), (0, 255, 0),
-                          cv2.MARKER_CROSS, 20, 2)
-            
-            # Draw compact info overlay
-            font_scale = 0.6
-            cv2.rectangle(frame, (0, 0), (320, 140), (0, 0, 0), -1)
-            cv2.putText(frame, f"FPS: {fps:.1f}", (10, 25),
-                       cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), 2)
-            cv2.putText(frame, f"Detections: {detection_count}", (10, 55),
-                       cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), 2)
-            cv2.putText(frame, f"Resolution: {window_width}x{window_height}", (10, 85),
+    # Frames live in a small pool of preallocated buffers: one per queue slot
+    # plus one each being captured, inferred on and rendered. Dropped frames
+    # go straight back to the pool.
+    pool = FramePool(count=6, name="frames")
+    
+    def release_item(item):
+        pool.release(item[0])
+    
+    frame_queue = LatestQueue(maxsize=1, name="capture", on_drop=release_item)
+    result_queue = LatestQueue(maxsize=2, name="inference", on_drop=release_item)
+    queues = (frame_queue, result_queue)
+    letterboxes = {}
+    bgr_buffers = {}
+    
+    # Unchanged frames (menus, pauses, freeze time) reuse the last detections
+    gate = None
+    if args.change_threshold > 0:
+        gate = FrameChangeGate(args.change_threshold, max_skip=args.max_skip)
+    last_detections = None
+    
+    # OPTIMIZED: Run inference on full frame at reduced size for speed
+    # YOLOv12 with imgsz=640, half precision if possible, low conf threshold
+    predict_kwargs = dict(
+        imgsz=inference_size,
+        conf=0.4,  # Lower threshold for better recall
+        iou=0.5,
+        half=True if device == 'cuda' else False,  # FP16 on GPU
+        verbose=False,
+        device=device
+    )
+    
+    tensor_kwargs = {k: v for k, v in predict_kwargs.items() if k != 'imgsz'}
+    if onnx is not None:
+        # Same thresholds as the PyTorch path
+        onnx.conf, onnx.iou = predict_kwargs['conf'], predict_kwargs['iou']
+    if roi is not None:
+        # ROI / periphery duplicates are merged at the model's NMS threshold
+        roi.iou = predict_kwargs['iou']
+    
+    # Per-stage latencies (monotonic clock) for the HUD, console and exit summary;
+    # with --trace every span also lands on a per-frame timeline
+    tracer = Tracer(args.trace_buffer, "demo_detection") if args.trace else NULL_TRACER
+    instr = Instrumentation(LATENCY_STAGES, tracer=tracer, overlapping=('end_to_end',))
+    if tracer.enabled:
+        print(f"[INFO] Tracing to {args.trace} ({tracer.capacity} event ring)")
+    inference_index = None
+    
+    tiler = None
+    if args.tiles:
+        tiler = TiledDetector(model, tile=args.tile_size, overlap=args.tile_overlap,
+                              batch=args.tile_batch, **predict_kwargs)
+        print(f"[INFO] Tiled inference: {tiler.tile}px tiles, {args.tile_overlap:.0%} overlap, "
+              f"batch {tiler.batch}")
+    
+    def capture_step():
+        """Read one frame from the source and publish it"""
+        if reconnect_event.is_set():
+            reconnect_event.clear()
+            source.reconnect()
+            if gate is not None:
+                # The new source's first frame must not be compared with the old one
+                gate.reset()
+        
+        # Check if the producer (e.g. CS2 process) still exists
+        with tracer.span('is_alive'):
+            alive = source.is_alive()
+        if not alive:
+            print(f"\n[WARNING] Source closed: {source.describe()}")
+            return False
+        
+        with instr.span('capture', frame=source.frames_read):
+            frame = source.read_into(pool)
+        if frame is None:
+            print(f"\n[INFO] Source exhausted: {source.describe()}")
+            return False
+        
+        frame_queue.put((frame, time.perf_counter(), source.frames_read - 1), block=args.lossless)
+        return not (args.max_frames and source.frames_read >= args.max_frames)
+    
+    def detect(image, imgsz=None):
+        """Run the model on a frame (or a crop view of one) and return Detections"""
+        imgsz = imgsz or inference_size
+        start = time.perf_counter()
+        if client is not None:
+            # Letterbox, model and NMS all run in the service: one round trip,
+            # at the demo's own thresholds rather than the service defaults
+            detections = client.detect(image, imgsz, predict_kwargs['conf'], predict_kwargs['iou'])
+            instr.since('inference', start, inference_index)
+            return detections
+        if onnx is not None:
+            # NumPy letterbox and NMS around the ONNX Runtime session
+            tensor, meta = onnx.preprocess(image, imgsz)
+            prepared = time.perf_counter()
+            output = onnx.infer(tensor)
+            predicted = time.perf_counter()
+            detections = onnx.postprocess(output[0], meta)
+            finished = time.perf_counter()
+            for stage, begin, end in (('preprocess', start, prepared),
+                                      ('inference', prepared, predicted),
+                                      ('postprocess', predicted, finished)):
+                instr.record(stage, (end - begin) * 1000)
+                tracer.add(stage, begin, end, inference_index)
+            return detections
+        if args.preprocess == 'fused':
+            # Fused path: raw BGRA frame -> letterboxed tensor in one resize,
+            # boxes mapped back to capture coordinates
+            letterbox = letterboxes.get(imgsz)
+            if letterbox is None:
+                letterbox = letterboxes[imgsz] = Letterbox(imgsz)
+            tensor, meta = letterbox(image)
+            model_input, model_kwargs = torch.from_numpy(tensor), tensor_kwargs
+        else:
+            # BGRA captures are converted into a reused buffer; the pooled
+            # BGRA frame itself travels on to the render stage untouched
+            bgr = as_bgr(image, bgr_buffers.get(imgsz))
+            if bgr is not image:
+                bgr_buffers[imgsz] = bgr
+            model_input, model_kwargs = bgr, dict(predict_kwargs, imgsz=imgsz)
+        prepared = time.perf_counter()
+        results = model(model_input, **model_kwargs)
+        predicted = time.perf_counter()
+        if args.preprocess == 'fused':
+            restore_boxes(results, meta)
+        detections = Detections.from_ultralytics(results[0])
+        
+        # Ultralytics reports its own letterbox and NMS times inside model();
+        # move them to the preprocess / postprocess stages
+        speed = results[0].speed or {}
+        model_pre = speed.get('preprocess') or 0.0
+        model_nms = speed.get('postprocess') or 0.0
+        instr.record('preprocess', (prepared - start) * 1000 + model_pre)
+        instr.record('inference', (predicted - prepared) * 1000 - model_pre - model_nms)
+        finished = time.perf_counter()
+        instr.record('postprocess', (finished - predicted) * 1000 + model_nms)
+        # The timeline shows the raw phases as they ran
+        tracer.add('preprocess', start, prepared, inference_index)
+        tracer.add('inference', prepared, predicted, inference_index)
+        tracer.add('postprocess', predicted, finished, inference_index)
+        return detections
+    
+    def run_model(frame):
+        """One model pass over a frame in the selected mode (tiles, ROI or full)"""
+        if tiler is not None:
+            # Tiles are prepared and run as one batch: timed as a whole
+            with instr.span('inference', frame=inference_index):
+                return tiler(frame)
+        if roi is not None:
+            return roi.detect(frame, detect)
+        return detect(frame)
+    
+    tracking = None
+    if args.track:
+        tracking = TrackingDetector(run_model, KalmanBoxTracker(),
+                                    DetectionScheduler(max_interval=args.detect_every,
+                                                       min_conf=args.track_min_conf))
+        print(f"[INFO] Tracking: model every 1-{tracking.scheduler.max_interval} frames, "
+              f"tracker in between")
+    
+    def inference_step():
+        """Run the model on the freshest captured frame"""
+        nonlocal last_detections, inference_index
+        item = frame_queue.get_latest(timeout=0.1)
+        if item is None:
+            return True
+        frame, captured_at, index = item
+        inference_index = index
+        
+        with tracer.span('gate', index):
+            changed = gate is None or gate.should_infer(frame)
+        if not changed and last_detections is not None:
+            result_queue.put((frame, last_detections, captured_at, index), block=args.lossless)
+            return True
+        
+        if tracking is not None:
+            with tracer.span('track', index):
+                detections = tracking(frame)
+        else:
+            detections = run_model(frame)
+        last_detections = detections
+        result_queue.put((frame, detections, captured_at, index), block=args.lossless)
+        return True
+    
+    def pipeline_stats():
+        """Queue, pool and gate counters for the console [STATS] line"""
+        parts = [format_queue_stats(queues), format_pool_stats(pool)]
+        if gate is not None:
+            parts.append(format_gate_stats(gate))
+        if tiler is not None:
+            parts.append(format_tile_stats(tiler))
+        if tracking is not None:
+            parts.append(format_track_stats(tracking))
+        if sink is not None:
+            parts.append(format_sink_stats(sink))
+        if recorder.recording or recorder.sessions:
+            parts.append(format_recorder_stats(recorder))
+        return " | ".join(parts)
+    
+    workers = [
+        # Close the source on the capture thread (mss handles are thread-bound)
+        StageWorker("capture", capture_step, stop_event,
+                    output=frame_queue, on_exit=source.close),
+        StageWorker("inference", inference_step, stop_event,
+                    output=result_queue),
+    ]
+    for worker in workers:
+        worker.start()
+    
+    def build_static_layers(width, height):
+        """Draw functions for the overlay parts that only change with geometry"""
+        scale = width / window_width
+        
+        def hud_panel(canvas):
+            # Compact info panel; the live lines are drawn over it per frame
+            cv2.rectangle(canvas, (0, 0), (320, 190), (0, 0, 0), -1)
+            cv2.putText(canvas, f"Resolution: {window_width}x{window_height}", (10, 85),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, f"Device: {device.upper()}", (10, 110),
+            cv2.putText(canvas, f"Device: {device.upper()}", (10, 110),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, f"CS2 PID: {cs2_pid}", (10, 135),
+            cv2.putText(canvas, source.describe(), (10, 135),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # Draw compact legend
-            legend_y = window_height - 120
-            cv2.rectangle(frame, (0, legend_y), (200, window_height), (0, 0, 0), -1)
+        
+        def latency_panel(canvas):
+            # Per-stage percentile table; the numbers are drawn per frame
+            cv2.rectangle(canvas, (0, 195), (320, 215 + 18 * len(LATENCY_STAGES)), (0, 0, 0), -1)
+            cv2.putText(canvas, "Latency (ms)", (10, 212),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+            for x, label in zip((140, 200, 260), ("p50", "p95", "p99")):
+                cv2.putText(canvas, label, (x, 212),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+        
+        def legend(canvas):
+            legend_y = height - 120
+            cv2.rectangle(canvas, (0, legend_y), (200, height), (0, 0, 0), -1)
             legend_y += 20
             for class_name, color in colors.items():
-                cv2.rectangle(frame, (10, legend_y - 10), (25, legend_y), color, -1)
-                cv2.putText(frame, class_name, (35, legend_y),
+                cv2.rectangle(canvas, (10, legend_y - 10), (25, legend_y), color, -1)
+                cv2.putText(canvas, class_name, (35, legend_y),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
                 legend_y += 25
+        
+        def crosshair(canvas):
+            cv2.drawMarker(canvas, (width // 2, height // 2), (0, 255, 0),
+                          cv2.MARKER_CROSS, 20, 2)
+        
+        def roi_outline(canvas):
+            # Outline the ROI the model actually looked at
+            x0, y0, x1, y1 = (int(v * scale) for v in roi.window(window_width, window_height))
+            cv2.rectangle(canvas, (x0, y0), (x1, y1), (128, 128, 128), 1)
+        
+        layers = [hud_panel, latency_panel, legend, crosshair]
+        if roi is not None:
+            layers.insert(0, roi_outline)
+        return layers
+    
+    def draw_overlay(image, detections, scale, static_layers):
+        """Detections, cached static layers and live HUD text onto an image"""
+        renderer.draw(image, detections, show_labels=show_class_names, scale=scale)
+        static_layers.composite(image, key=(window_width, window_height, source.describe()))
+        cv2.putText(image, f"FPS: {fps:.1f}", (10, 25),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        cv2.putText(image, f"Detections: {len(detections)}", (10, 55),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        cv2.putText(image, f"Drops: cap {frame_queue.dropped} / inf {result_queue.dropped}",
+                   (10, 160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        if gate is not None:
+            cv2.putText(image, format_gate_stats(gate), (10, 185),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        for row, name in enumerate(LATENCY_STAGES):
+            y = 232 + 18 * row
+            cv2.putText(image, name, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+            for x, value in zip((140, 200, 260), latency.get(name, ())):
+                cv2.putText(image, f"{value:.1f}", (x, y),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+        if recorder.recording:
+            cv2.putText(image, "REC", (image.shape[1] - 70, 30),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        return image
+    
+    # Static overlay parts are rasterized once per geometry and composited;
+    # screenshots are full resolution, so they keep their own cache
+    layers = LayerCache(build_static_layers)
+    screenshot_layers = LayerCache(build_static_layers)
+    display_frame = None
+    # Live percentiles, refreshed once a second rather than every frame
+    latency = {}
+    
+    def emit(detections, captured_at, index):
+        """Queue one frame's results on the sink, stamped with wall-clock capture time"""
+        if sink is not None:
+            timestamp = time.time() - (time.perf_counter() - captured_at)
+            sink.write(index, timestamp, detections, block=args.lossless)
+    
+    def next_result():
+        """Result queued behind the one being rendered, without waiting (None if none)"""
+        try:
+            return result_queue.get(timeout=0)
+        except QueueClosed:
+            return None
+    
+    def save_trace_snapshot(filename):
+        """Export the trace ring as it is now (runs on a helper thread)"""
+        events = tracer.export(filename)
+        print(f"[INFO] Trace snapshot saved: {filename} ({events} events)")
+    
+    def update_fps(detection_count):
+        """Count one output frame; refresh FPS and print stats once a second"""
+        nonlocal fps, frame_count, fps_time
+        frame_count += 1
+        current_time = time.time()
+        if current_time - fps_time >= 1.0:
+            fps = frame_count / (current_time - fps_time)
+            frame_count = 0
+            fps_time = current_time
+            print(f"[STATS] FPS: {fps:.1f} | Detections: {detection_count} | {pipeline_stats()}")
+            latency.clear()
+            latency.update(instr.recent())
+            print(f"[STATS] Latency p50/p95/p99 ms: {format_latency_stats(instr)}")
+    
+    try:
+        while not stop_event.is_set():
+            if args.headless:
+                # No GUI: take every result in order and stream it out
+                try:
+                    item = result_queue.get(timeout=0.1)
+                except QueueClosed:
+                    break
+                if item is None:
+                    continue
+                frame, detections, captured_at, index = item
+                with tracer.span('emit', index):
+                    emit(detections, captured_at, index)
+                recorder.record(frame)
+                pool.release(frame)
+                instr.since('end_to_end', captured_at, index)
+                if sink.error is not None:
+                    print(f"[ERROR] Result sink failed: {sink.error}")
+                    break
+                update_fps(len(detections))
+                continue
             
-            # Resize frame to display size (50% of game resolution)
-            display_frame = cv2.resize(frame, (display_width, display_height), 
-                                      interpolation=cv2.INTER_LINEAR)
-            
-            # Show resized frame
-            cv2.imshow(window_name, display_frame)
+            # Render stage (main thread: OpenCV GUI calls must stay here)
+            try:
+                if sink is None:
+                    item = result_queue.get_latest(timeout=0.01)
+                else:
+                    item = result_queue.get(timeout=0.01)
+            except QueueClosed:
+                break
+            if sink is not None and item is not None:
+                # Every result reaches the sink, in order; only the newest is drawn
+                newer = next_result()
+                while newer is not None:
+                    with tracer.span('emit', item[3]):
+                        emit(*item[1:])
+                    release_item(item)
+                    item, newer = newer, next_result()
             
-            # FPS calculation
-            frame_count += 1
-            current_time = time.time()
-            if current_time - fps_time >= 1.0:
-                fps = frame_count / (current_time - fps_time)
-                frame_count = 0
-                fps_time = current_time
-                print(f"[STATS] FPS: {fps:.1f} | Detections: {detection_count}")
+            if item is not None:
+                frame, detections, captured_at, index = item
+                with tracer.span('emit', index):
+                    emit(detections, captured_at, index)
+                window_height, window_width = frame.shape[:2]
+                if (window_width // 2, window_height // 2) != (display_width, display_height):
+                    display_width = window_width // 2
+                    display_height = window_height // 2
+                    cv2.resizeWindow(window_name, display_width, display_height)
+                
+                # Downscale first, then draw at display resolution: 4x fewer
+                # pixels per drawing call than annotating the full frame
+                with instr.span('draw', frame=index):
+                    display_frame = cv2.resize(frame, (display_width, display_height),
+                                               dst=display_frame, interpolation=cv2.INTER_LINEAR)
+                    detection_count = len(detections)
+                    draw_overlay(display_frame, detections, display_width / window_width, layers)
+                # Recording copies what is on screen into the recorder's own buffers
+                with tracer.span('record', index):
+                    recorder.record(display_frame)
+                
+                # Show resized frame
+                display_start = time.perf_counter()
+                cv2.imshow(window_name, display_frame)
             
             # Handle keyboard input
-            key = cv2.waitKey(1) & 0xFF
+            with tracer.span('waitKey'):
+                key = cv2.waitKey(1) & 0xFF
+            if item is not None:
+                instr.since('display', display_start, index)
+                instr.since('end_to_end', captured_at, index)
             if key == ord('q'):
                 print("\n[INFO] Quitting demo...")
                 break
-            elif key == ord('s'):
+            elif key == ord('s') and item is not None:
                 screenshot_count += 1
                 filename = f"demo_screenshot_{screenshot_count}.jpg"
-                # Save full resolution frame, not display frame
-                cv2.imwrite(filename, frame)
-                print(f"[INFO] Screenshot saved: {filename} ({window_width}x{window_height})")
+                # Save full resolution frame, not display frame; the overlay is
+                # drawn and the JPEG encoded on the recorder's thread
+                recorder.screenshot(frame, filename, render=lambda image, shown=detections:
+                                    draw_overlay(image, shown, 1.0, screenshot_layers))
+            elif key == ord('v'):
+                if recorder.recording:
+                    recorder.stop()
+                    print(f"[INFO] Recording stopped ({format_recorder_stats(recorder)})")
+                else:
+                    print(f"[INFO] Recording to {recorder.start()}")
             elif key == ord('c'):
                 show_class_names = not show_class_names
                 print(f"[INFO] Class names: {'ON' if show_class_names else 'OFF'}")
             elif key == ord('r'):
-                # Reconnect to CS2 window
-                print("[INFO] Reconnecting to CS2 window...")
-                cs2_pid = find_cs2_process()
-                if cs2_pid:
-                    hwnd = find_window_by_pid(cs2_pid)
-                    if hwnd:
-                        capture_region = get_window_rect_for_mss(hwnd)
-                        if capture_region:
-                            window_width = capture_region['width']
-                            window_height = capture_region['height']
-                            display_width = window_width // 2
-                            display_height = window_height // 2
-                            cv2.resizeWindow(window_name, display_width, display_height)
-                            print(f"[INFO] Reconnected! Game: {window_width}x{window_height}, Display: {display_width}x{display_height}")
-                        else:
-                            print("[WARNING] Failed to get window region")
-                    else:
-                        print("[WARNING] Window not found")
+                # Reconnect source (handled by the capture thread)
+                reconnect_event.set()
+            elif key == ord('t'):
+                if tracer.enabled:
+                    trace_count += 1
+                    root, ext = os.path.splitext(args.trace)
+                    filename = f"{root}_{trace_count}{ext or '.json'}"
+                    # A full ring takes ~2 s to serialize; keep the display running
+                    threading.Thread(target=save_trace_snapshot, args=(filename,),
+                                     name="trace-export", daemon=True).start()
                 else:
-                    print("[WARNING] CS2 process not found")
+                    print("[INFO] Tracing is off (start with --trace FILE)")
             
             # No sleep - maximize FPS
             
-            # FPS calculation
-            frame_count += 1
-            current_time = time.time()
-            if current_time - fps_time >= 1.0:
-                fps = frame_count / (current_time - fps_time)
-                frame_count = 0
-                fps_time = current_time
-                print(f"[STATS] FPS: {fps:.1f} | Detections: {detection_count}")
+            if item is None:
+                continue
+            pool.release(frame)
+            
+            # FPS calculation (once per displayed frame)
+            update_fps(detection_count)
     
     finally:
-        sct.close()
-        cv2.destroyAllWindows()
+        stop_event.set()
+        for queue in queues:
+            queue.close()
+        for worker in workers:
+            worker.join(timeout=2.0)
+        for queue in queues:
+            queue.drain()
+        source.close()
+        if sink is not None:
+            sink.close()
+        if client is not None:
+            client.close()
+        recorder.close()
+        if not args.headless:
+            cv2.destroyAllWindows()
     print("\n[INFO] Demo finished!")
     print(f"[STATS] Final FPS: {fps:.1f}")
-    print(f"[STATS] Screenshots saved: {screenshot_count}")
+    print(f"[STATS] Screenshots saved: {recorder.screenshots}/{screenshot_count}")
+    if recorder.sessions:
+        print(f"[STATS] {format_recorder_stats(recorder)}")
+    print(f"[STATS] Queues: {format_queue_stats(queues)}")
+    print(f"[STATS] Frame pool: {format_pool_stats(pool)}")
+    if gate is not None:
+        print(f"[STATS] Change gate: {format_gate_stats(gate)}")
+    if tracking is not None:
+        print(f"[STATS] Tracking: {format_track_stats(tracking)}")
+    if sink is not None:
+        print(f"[STATS] Results: {format_sink_stats(sink)}")
+    print(f"[STATS] Latency p50/p95/p99 ms: {format_latency_stats(instr)}")
+    if args.latency_json:
+        instr.dump(args.latency_json, source=source.describe(), device=device,
+                   resolution=[window_width, window_height], final_fps=fps)
+        print(f"[INFO] Latency summary saved: {args.latency_json}")
+    if tracer.enabled:
+        events = tracer.export(args.trace)
+        print(f"[INFO] Trace saved: {args.trace} ({events} events) - open in ui.perfetto.dev")
+        print(f"[STATS] {format_trace_stats(tracer)}")
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,147 @@
+"""
+Dynamic request batching
+Frames submitted concurrently (by service connections, streams or worker
+threads) are grouped into one batched forward pass, bounded by a maximum
+batch size and a maximum queueing delay, and each caller gets its own
+result back
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from instrumentation import LatencyStats
+
+class BatchScheduler:
+    """Collects requests and runs them through run_batch(items) in groups
+
+    run_batch receives a list of submitted items and must return one
+    result per item, in order. A batch is dispatched once `max_batch`
+    compatible items are queued or the oldest has waited `max_delay`
+    seconds; with max_delay=0 only requests that queued up while the
+    previous batch ran are grouped, so an idle scheduler adds no latency.
+    Items whose key(item) differs (e.g. another input size) never share a
+    batch. Queue wait, batch run time and the batch-size histogram are kept
+    for tuning.
+    """
+
+    def __init__(self, run_batch, max_batch=8, max_delay=0.0, key=None, name="batcher"):
+        if max_batch < 1:
+            raise ValueError("max_batch must be >= 1")
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.key = key
+        self.name = name
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.wait = LatencyStats()
+        self.run_time = LatencyStats()
+        self.sizes = np.zeros(max_batch + 1, dtype=np.int64)
+        self.submitted = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue an item; returns a Future for its result"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            self._pending.append((item, future, time.perf_counter()))
+            self.submitted += 1
+            self._cond.notify()
+        return future
+
+    def __call__(self, item):
+        """Submit and wait: a drop-in for a single-item function"""
+        return self.submit(item).result()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            first_key = self.key(self._pending[0][0]) if self.key else None
+            deadline = self._pending[0][2] + self.max_delay
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, rest = [], deque()
+            while self._pending and len(batch) < self.max_batch:
+                entry = self._pending.popleft()
+                if self.key is None or self.key(entry[0]) == first_key:
+                    batch.append(entry)
+                else:
+                    rest.append(entry)
+            # Requests that could not join keep their place at the front
+            rest.extend(self._pending)
+            self._pending = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            for _, _, queued in batch:
+                self.wait.add((start - queued) * 1000)
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"run_batch returned {len(results)} results "
+                                       f"for {len(batch)} items")
+            except Exception as e:
+                self.failed += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.run_time.add((time.perf_counter() - start) * 1000)
+            self.sizes[len(batch)] += 1
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self, timeout=5.0):
+        """Finish queued requests, then stop the scheduler thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        """Snapshot of batching counters"""
+        batches = int(self.sizes.sum())
+        wait_p50, wait_p95, wait_p99 = self.wait.overall()
+        return {
+            'max_batch': self.max_batch,
+            'max_delay_ms': self.max_delay * 1000,
+            'submitted': self.submitted,
+            'failed': self.failed,
+            'pending': len(self._pending),
+            'batches': batches,
+            'mean_batch': float((self.sizes * np.arange(len(self.sizes))).sum() / batches)
+                          if batches else 0.0,
+            'batch_sizes': {size: int(n) for size, n in enumerate(self.sizes) if n},
+            'wait_ms': {'p50': wait_p50, 'p95': wait_p95, 'p99': wait_p99},
+            'batch_ms': self.run_time.summary(),
+        }
+
+def format_batch_stats(scheduler):
+    """One-line batching summary (from a scheduler or its stats() dict, e.g. over the wire)"""
+    stats = scheduler if isinstance(scheduler, dict) else scheduler.stats()
+    wait = stats['wait_ms']
+    return (f"Batches: {stats['batches']} (mean {stats['mean_batch']:.2f}/{stats['max_batch']}), "
+            f"wait p50/p95/p99 {wait['p50']:.2f}/{wait['p95']:.2f}/{wait['p99']:.2f}ms, "
+            f"batch {stats['batch_ms']['mean_ms']:.1f}ms")
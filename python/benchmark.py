@@ -3,72 +3,245 @@ Benchmark trained model performance
 Tests: Speed, FPS, Memory usage
 """
 import sys
+import argparse
+import threading
 import time
-import torch
 import cv2
 import numpy as np
 from pathlib import Path
-import yaml
 
 # Add YOLOv12 to path
 yolov12_path = Path(__file__).parent / "yolov12"
 if yolov12_path.exists():
     sys.path.insert(0, str(yolov12_path))
 
-from ultralytics import YOLO
+from detection_service import DEFAULT_ADDRESS, DetectionClient, ServiceError, format_service_info
+from batching import format_batch_stats
+from model_registry import ModelRegistry, RegistryError, resolve_weights
+from onnx_backend import BACKENDS, BackendError, OnnxDetector, measure_backends
 
-def load_config():
-    """Load configuration from config.yaml"""
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Benchmark YOLOv12 inference speed")
+    parser.add_argument('--service', nargs='?', const=DEFAULT_ADDRESS, metavar='ADDRESS',
+                        help="benchmark a running detection_service.py (round trip per frame) "
+                             "instead of loading the model here")
+    parser.add_argument('--weights', metavar='PATH|latest|fastest|accurate',
+                        help="model to benchmark (default: latest run's best.pt); results are "
+                             "recorded in the model registry")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="torch: Ultralytics / PyTorch; onnx: the exported best.onnx on "
+                             "ONNX Runtime (CPU)")
+    parser.add_argument('--threads', type=int,
+                        help="CPU inference threads (torch intra-op / ONNX Runtime intra-op)")
+    parser.add_argument('--compare-backends', action='store_true',
+                        help="cold start, peak RSS and per-frame latency of torch vs onnx on the "
+                             "CPU, each measured in a fresh process")
+    parser.add_argument('--clients', type=int, default=1,
+                        help="with --service, also measure throughput with this many concurrent "
+                             "clients (exercises the service's request batching)")
+    return parser.parse_args()
 
-def find_best_weights():
-    """Find the best trained model weights"""
-    config = load_config()
-    runs_dir = Path(config['paths']['runs']) / "detect"
+def benchmark_concurrency(service, clients, num_runs=100, imgsz=640):
+    """Aggregate service throughput with several clients sending at once"""
+    print(f"📊 Concurrent clients: {clients} x {num_runs} frames ({imgsz}x{imgsz})")
+    print("-" * 50)
     
-    if not runs_dir.exists():
-        return None
+    connections = [DetectionClient(service).connect() for _ in range(clients)]
+    dummy_image = np.random.randint(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    before = connections[0].stats().get('batching')
+    latencies = [[] for _ in connections]
     
-    train_dirs = sorted(runs_dir.glob("train*"))
-    if not train_dirs:
-        return None
+    def send(client, times):
+        for _ in range(num_runs):
+            start = time.perf_counter()
+            client.detect(dummy_image)
+            times.append(time.perf_counter() - start)
     
-    latest_run = train_dirs[-1]
-    best_weights = latest_run / "weights" / "best.pt"
+    threads = [threading.Thread(target=send, args=(client, times))
+               for client, times in zip(connections, latencies)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
     
-    if best_weights.exists():
-        return str(best_weights)
-    
-    return None
+    times = np.concatenate(latencies) * 1000
+    print(f"   Throughput: {clients * num_runs / elapsed:.1f} FPS total")
+    print(f"   Latency per request: p50 {np.percentile(times, 50):.2f}ms, "
+          f"p95 {np.percentile(times, 95):.2f}ms")
+    batching = connections[0].stats().get('batching')
+    if batching is None:
+        print("   Service batching is off (start it with --max-batch > 1)")
+    else:
+        # Wait / batch-time percentiles are service-wide since start-up
+        print(f"   {format_batch_stats(batching)}")
+        sizes = {int(size): count - before['batch_sizes'].get(size, 0)
+                 for size, count in batching['batch_sizes'].items()}
+        print(f"   Batch sizes in this run: {dict(sorted((k, v) for k, v in sizes.items() if v))}")
+    print()
+    for client in connections:
+        client.close()
 
-def benchmark_model():
-    """Benchmark model performance"""
+def compare_backends(weights=None, threads=None, imgsz=640, runs=50):
+    """Cold start, memory and CPU latency of the PyTorch and ONNX Runtime paths"""
     print("=" * 70)
-    print("YOLOv12 Model Benchmark")
+    print("Backend Comparison (CPU): PyTorch vs ONNX Runtime")
     print("=" * 70)
     print()
     
-    # Find model
-    weights_path = find_best_weights()
-    if not weights_path:
+    registry = ModelRegistry.from_config().scan()
+    try:
+        pt_path = resolve_weights(weights, 'pt', registry=registry)
+    except RegistryError as e:
+        print(f"❌ {e}")
+        return
+    if not pt_path:
         print("❌ No trained model found!")
         return
+    # The export next to the weights, as written by export_model.py
+    onnx_path = Path(pt_path).with_suffix('.onnx')
+    if not onnx_path.exists():
+        print(f"❌ No ONNX export next to {pt_path}")
+        print("   Export one first: python export_model.py (ONNX)")
+        return
+    
+    print(f"🤖 PyTorch: {pt_path}")
+    print(f"🤖 ONNX:    {onnx_path}")
+    print(f"   {runs} frames of 1280x720 at {imgsz}, {threads or 'automatic'} threads, "
+          f"each backend in a fresh process")
+    print()
+    
+    try:
+        results = measure_backends({'torch': pt_path, 'onnx': onnx_path}, imgsz, runs, threads)
+    except BackendError as e:
+        print(f"❌ {e}")
+        return
+    
+    print(f"{'Backend':<10} {'Load (s)':<10} {'First (s)':<11} {'Peak RSS':<12} "
+          f"{'Mean (ms)':<11} {'p95 (ms)':<10} {'FPS':<8}")
+    print("-" * 70)
+    for result in results:
+        rss = f"{result['rss_mb']:.0f} MB" if result['rss_mb'] is not None else "n/a"
+        print(f"{result['backend']:<10} {result['load_s']:<10.2f} {result['first_s']:<11.2f} "
+              f"{rss:<12} {result['mean_ms']:<11.2f} {result['p95_ms']:<10.2f} "
+              f"{1000 / result['mean_ms']:<8.1f}")
+        registry.record_benchmark(result['weights'], result['backend'], imgsz, result['mean_ms'],
+                                  'cpu', p95_ms=result['p95_ms'], threads=threads,
+                                  cold_start_s=result['first_s'], rss_mb=result['rss_mb'])
+    print()
+    
+    torch_result, onnx_result = results
+    print("💡 ONNX Runtime vs PyTorch:")
+    print(f"   Startup to first result: {onnx_result['first_s']:.2f}s vs "
+          f"{torch_result['first_s']:.2f}s ({torch_result['first_s'] / onnx_result['first_s']:.1f}x)")
+    if torch_result['rss_mb'] and onnx_result['rss_mb']:
+        print(f"   Peak memory: {onnx_result['rss_mb']:.0f} MB vs {torch_result['rss_mb']:.0f} MB "
+              f"({onnx_result['rss_mb'] - torch_result['rss_mb']:+.0f} MB)")
+    print(f"   Per frame: {onnx_result['mean_ms']:.2f}ms vs {torch_result['mean_ms']:.2f}ms "
+          f"({torch_result['mean_ms'] / onnx_result['mean_ms']:.2f}x)")
+    print()
+
+def benchmark_model(service=None, clients=1, weights=None, backend='torch', threads=None):
+    """Benchmark model performance"""
+    print("=" * 70)
+    print("YOLOv12 Model Benchmark")
+    print("=" * 70)
+    print()
     
-    print(f"🤖 Loading model: {weights_path}")
-    model = YOLO(weights_path)
-    print("✅ Model loaded successfully!")
+    startup = time.perf_counter()
+    stages = None
+    if service:
+        try:
+            client = DetectionClient(service).connect()
+        except ServiceError as e:
+            print(f"❌ {e}")
+            return
+        print(f"🔌 Detection service: {format_service_info(client)}")
+        run = client.detect
+        # Timings are full round trips; the service synchronizes its own GPU
+        device = client.device
+        image_sizes = [640, 512, 416, 320]
+    elif backend == 'onnx':
+        try:
+            weights_path = resolve_weights(weights, 'onnx')
+        except RegistryError as e:
+            print(f"❌ {e}")
+            return
+        if not weights_path:
+            print("❌ No ONNX export found! Export one first: python export_model.py")
+            return
+        
+        print(f"🤖 Loading model: {weights_path}")
+        try:
+            detector = OnnxDetector(weights_path, intra_threads=threads)
+        except BackendError as e:
+            print(f"❌ {e}")
+            return
+        print(f"✅ Model loaded: {detector.describe()}")
+        registry = ModelRegistry.from_config().load()
+        
+        stages = {'letterbox': [], 'session': [], 'decode + NMS': []}
+        
+        def run(image):
+            # Full frame -> Detections: letterbox, session and NumPy NMS
+            # (a dynamic export runs at the test image's size)
+            start = time.perf_counter()
+            tensor, meta = detector.preprocess(image, image.shape[0])
+            prepared = time.perf_counter()
+            output = detector.infer(tensor)
+            predicted = time.perf_counter()
+            detections = detector.postprocess(output[0], meta)
+            finished = time.perf_counter()
+            for stage, elapsed in zip(stages, (prepared - start, predicted - prepared,
+                                               finished - predicted)):
+                stages[stage].append(elapsed * 1000)
+            return detections
+        
+        device = 'cpu'
+        # A static export only runs at the size it was exported with
+        image_sizes = [640, 512, 416, 320] if detector.dynamic else [detector.imgsz]
+    else:
+        # Find model
+        try:
+            weights_path = resolve_weights(weights)
+        except RegistryError as e:
+            print(f"❌ {e}")
+            return
+        if not weights_path:
+            print("❌ No trained model found!")
+            return
+        
+        print(f"🤖 Loading model: {weights_path}")
+        import torch
+        from ultralytics import YOLO
+        
+        if threads:
+            torch.set_num_threads(threads)
+        model = YOLO(weights_path)
+        print("✅ Model loaded successfully!")
+        registry = ModelRegistry.from_config().load()
+        
+        def run(image):
+            return model(image, verbose=False)
+        
+        # Check CUDA
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        image_sizes = [640, 512, 416, 320]
     print()
     
-    # Check CUDA
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
     print(f"🎮 Device: {device.upper()}")
-    if device == 'cuda':
+    if device == 'cuda' and not service:
         print(f"   GPU: {torch.cuda.get_device_name(0)}")
     print()
     
+    # Cost a one-off script pays before its first result
+    run(np.zeros((640, 640, 3), dtype=np.uint8))
+    print(f"⏱️  Startup to first result: {time.perf_counter() - startup:.2f}s")
+    print()
+    
     # Test parameters
-    image_sizes = [640, 512, 416, 320]
     num_warmup = 10
     num_runs = 100
     
@@ -90,9 +263,9 @@ def benchmark_model():
         # Warmup
         print(f"   Warming up...")
         for _ in range(num_warmup):
-            _ = model(dummy_image, verbose=False)
+            _ = run(dummy_image)
         
-        if device == 'cuda':
+        if device == 'cuda' and not service:
             torch.cuda.synchronize()
         
         # Benchmark
@@ -101,9 +274,9 @@ def benchmark_model():
         
         for i in range(num_runs):
             start = time.time()
-            _ = model(dummy_image, verbose=False)
+            _ = run(dummy_image)
             
-            if device == 'cuda':
+            if device == 'cuda' and not service:
                 torch.cuda.synchronize()
             
             end = time.time()
@@ -134,7 +307,17 @@ def benchmark_model():
         print(f"   Min time: {min_time:.2f}ms")
         print(f"   Max time: {max_time:.2f}ms")
         print(f"   FPS: {fps:.1f}")
+        if stages is not None:
+            # Warmup included: the split is what matters
+            print("   Stages: " + " | ".join(f"{stage} {np.mean(stage_times):.2f}ms"
+                                              for stage, stage_times in stages.items()))
+            for stage_times in stages.values():
+                stage_times.clear()
         print()
+        
+        if not service:
+            registry.record_benchmark(weights_path, backend, imgsz, mean_time, device,
+                                      p95_ms=float(np.percentile(times, 95)))
     
     # Summary
     print("=" * 70)
@@ -165,12 +348,19 @@ def benchmark_model():
     print(f"   Accuracy: {accurate['size']}x{accurate['size']} ({accurate['fps']:.1f} FPS)")
     print()
     
+    if service and clients > 1:
+        benchmark_concurrency(service, clients, num_runs)
+    
     # Memory info
-    if device == 'cuda':
+    if device == 'cuda' and not service:
         print("💾 GPU Memory:")
         print(f"   Allocated: {torch.cuda.memory_allocated() / 1024**2:.1f} MB")
         print(f"   Reserved: {torch.cuda.memory_reserved() / 1024**2:.1f} MB")
         print()
 
 if __name__ == "__main__":
-    benchmark_model()
+    args = parse_args()
+    if args.compare_backends:
+        compare_backends(args.weights, args.threads)
+    else:
+        benchmark_model(args.service, args.clients, args.weights, args.backend, args.threads)
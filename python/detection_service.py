@@ -0,0 +1,456 @@
+"""
+Local detection service
+Loads and warms the YOLO model once, then serves detections to any number
+of clients over a Unix domain socket or localhost TCP. Frames travel as raw
+pixels in a small binary envelope (no image encoding) and results come
+back as packed detection rows
+
+Usage:
+    python detection_service.py                          # default socket
+    python detection_service.py --address tcp://127.0.0.1:7878 --imgsz 640
+    python inference.py --service --source match.mp4     # any client script
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from batching import BatchScheduler, format_batch_stats
+from detections import Detections
+from model_registry import RegistryError, resolve_weights
+from result_sink import DETECTION_DTYPE
+
+PROTOCOL_VERSION = 1
+MAGIC = b'CS2S'
+HEADER_LENGTH = struct.Struct('<I')
+# request id, height, width, channels, op, imgsz (0 = server default),
+# conf, iou (0 = server default); followed by height*width*channels bytes
+REQUEST = struct.Struct('<IHHBBHff')
+# request id, status, payload count, server-side milliseconds; followed by
+# `count` DETECTION_DTYPE rows (OK) or `count` bytes of UTF-8 / JSON text
+RESPONSE = struct.Struct('<IBxHf')
+
+OP_DETECT = 0
+OP_STATS = 1
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+if hasattr(socket, 'AF_UNIX'):
+    DEFAULT_ADDRESS = 'unix:///tmp/cs2-detect.sock'
+else:
+    DEFAULT_ADDRESS = 'tcp://127.0.0.1:7878'
+
+class ServiceError(Exception):
+    """Raised when the detection service cannot be reached or a request fails"""
+
+def parse_address(spec):
+    """Split 'unix:///PATH' or 'tcp://HOST:PORT' into (family, address)"""
+    if spec.startswith('unix://'):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ServiceError("Unix sockets are not available on this platform")
+        return socket.AF_UNIX, spec[len('unix://'):]
+    if spec.startswith('tcp://'):
+        host, _, port = spec[len('tcp://'):].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    raise ServiceError(f"Unknown service address: {spec} (use unix:///PATH or tcp://HOST:PORT)")
+
+def recv_exact(sock, view):
+    """Fill a writable memoryview from the socket"""
+    while len(view):
+        received = sock.recv_into(view)
+        if received == 0:
+            raise ConnectionError("connection closed")
+        view = view[received:]
+
+def _recv_bytes(sock, size):
+    data = bytearray(size)
+    recv_exact(sock, memoryview(data))
+    return bytes(data)
+
+class ModelRunner:
+    """The service's model: fused letterbox, forward pass, boxes restored
+
+    prepare() letterboxes a frame into a tensor owned by the calling
+    thread (so connections preprocess in parallel); run() takes one or
+    more prepared tensors through a single, serialized forward pass.
+    """
+
+    def __init__(self, model, imgsz=640, conf=0.25, iou=0.7, device='cpu'):
+        self.model = model
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.device = device
+        self.half = device == 'cuda'
+        self._local = threading.local()
+        self._batch = None
+        self._lock = threading.Lock()
+
+    def prepare(self, frame, imgsz=0):
+        """(tensor, meta) for a BGR/BGRA frame; valid until this thread's next call"""
+        from preprocess import Letterbox
+
+        imgsz = imgsz or self.imgsz
+        letterboxes = self._local.__dict__.setdefault('letterboxes', {})
+        letterbox = letterboxes.get(imgsz)
+        if letterbox is None:
+            letterbox = letterboxes[imgsz] = Letterbox(imgsz)
+        return letterbox(frame)
+
+    def run(self, prepared, conf=0.0, iou=0.0):
+        """Detections for a list of same-size (tensor, meta) pairs, in one forward pass"""
+        import torch
+
+        from preprocess import restore_boxes
+
+        with self._lock:
+            if len(prepared) == 1:
+                tensor = prepared[0][0]
+            else:
+                tensor = self._batch_buffer(len(prepared), prepared[0][0].shape[1:])
+                for i, (single, _) in enumerate(prepared):
+                    tensor[i] = single[0]
+            results = self.model(torch.from_numpy(tensor), conf=conf or self.conf,
+                                 iou=iou or self.iou, half=self.half, device=self.device,
+                                 verbose=False)
+            return [Detections.from_ultralytics(restore_boxes([result], meta)[0])
+                    for result, (_, meta) in zip(results, prepared)]
+
+    def detect(self, frame, imgsz=0, conf=0.0, iou=0.0):
+        """Detections for one BGR/BGRA frame in its own pixel coordinates"""
+        return self.run([self.prepare(frame, imgsz)], conf, iou)[0]
+
+    def run_batch(self, items):
+        """BatchScheduler entry: items are (tensor, meta, imgsz, conf, iou)"""
+        _, _, _, conf, iou = items[0]
+        return self.run([(tensor, meta) for tensor, meta, *_ in items], conf, iou)
+
+    def _batch_buffer(self, count, shape):
+        if self._batch is None or self._batch.shape[1:] != shape or len(self._batch) < count:
+            self._batch = np.empty((count,) + shape, dtype=np.float32)
+        return self._batch[:count]
+
+    def warmup(self, runs=5):
+        """Run dummy frames so CUDA kernels and buffers exist before the first client"""
+        frame = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.detect(frame)
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.service.serve_connection(self.request)
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+class DetectionService:
+    """Serves a warm ModelRunner to local clients
+
+    Each connection gets a thread and a receive buffer that is reused for
+    every frame it sends, so a request costs one socket read into NumPy
+    memory plus the model itself. With max_batch > 1, frames from
+    concurrent connections go through a BatchScheduler and share forward
+    passes.
+    """
+
+    def __init__(self, runner, address=DEFAULT_ADDRESS, info=None, max_batch=1, max_delay=0.0):
+        self.runner = runner
+        self.address = address
+        self.info = dict(info or {})
+        self.batcher = None
+        if max_batch > 1:
+            # Requests with different imgsz / thresholds cannot share a pass
+            self.batcher = BatchScheduler(runner.run_batch, max_batch, max_delay,
+                                          key=lambda item: item[2:], name="batcher")
+        self._server = None
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.clients = 0
+        self.connected = 0
+        self.requests = 0
+        self.errors = 0
+        self.busy_ms = 0.0
+
+    def hello(self):
+        """Greeting sent to every client after it connects"""
+        return dict(self.info, protocol=PROTOCOL_VERSION, names=self.runner.model.names,
+                    imgsz=self.runner.imgsz, conf=self.runner.conf, iou=self.runner.iou,
+                    device=self.runner.device, pid=os.getpid())
+
+    def serve_forever(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_INET:
+            self._server = _TCPServer(address, _Handler)
+        else:
+            if os.path.exists(address):
+                # Stale socket from a previous run (bind would fail)
+                os.unlink(address)
+            self._server = _UnixServer(address, _Handler)
+        self._server.service = self
+        print(f"✅ Detection service listening on {self.address}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if family != socket.AF_INET and os.path.exists(address):
+                os.unlink(address)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def serve_connection(self, sock):
+        if sock.family != getattr(socket, 'AF_UNIX', None):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.clients += 1
+            self.connected += 1
+        buffer = np.empty(0, dtype=np.uint8)
+        head = bytearray(REQUEST.size)
+        try:
+            hello = json.dumps(self.hello()).encode()
+            sock.sendall(MAGIC + HEADER_LENGTH.pack(len(hello)) + hello)
+            while True:
+                try:
+                    recv_exact(sock, memoryview(head))
+                except ConnectionError:
+                    return
+                request_id, height, width, channels, op, imgsz, conf, iou = REQUEST.unpack(head)
+                size = height * width * channels
+                if buffer.size < size:
+                    buffer = np.empty(size, dtype=np.uint8)
+                recv_exact(sock, memoryview(buffer)[:size])
+                if op == OP_STATS:
+                    payload = json.dumps(self.stats()).encode()
+                    sock.sendall(RESPONSE.pack(request_id, STATUS_OK, len(payload), 0.0) + payload)
+                    continue
+                start = time.perf_counter()
+                try:
+                    frame = buffer[:size].reshape(height, width, channels)
+                    if self.batcher is not None:
+                        # Letterbox here, on the connection's thread; only the
+                        # forward pass is shared
+                        tensor, meta = self.runner.prepare(frame, imgsz)
+                        detections = self.batcher((tensor, meta, imgsz, conf, iou))
+                    else:
+                        detections = self.runner.detect(frame, imgsz, conf, iou)
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    message = str(e).encode()[:65535]
+                    sock.sendall(RESPONSE.pack(request_id, STATUS_ERROR, len(message), 0.0) + message)
+                    continue
+                ms = (time.perf_counter() - start) * 1000
+                rows = np.empty(len(detections), dtype=DETECTION_DTYPE)
+                rows['xyxy'] = detections.xyxy
+                rows['conf'] = detections.conf
+                rows['cls'] = detections.cls
+                rows['id'] = -1
+                sock.sendall(RESPONSE.pack(request_id, STATUS_OK, len(rows), ms) + rows.tobytes())
+                with self._lock:
+                    self.requests += 1
+                    self.busy_ms += ms
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.connected -= 1
+
+    def stats(self):
+        """Snapshot of service counters"""
+        return {
+            'uptime_s': time.time() - self.started,
+            'clients': self.clients,
+            'connected': self.connected,
+            'requests': self.requests,
+            'errors': self.errors,
+            'mean_ms': self.busy_ms / self.requests if self.requests else 0.0,
+            'batching': self.batcher.stats() if self.batcher is not None else None,
+        }
+
+class DetectionClient:
+    """Thin client for a running DetectionService
+
+    detect() sends the frame's raw pixels and returns Detections in the
+    frame's coordinates. With downscale=True frames larger than the model
+    input are shrunk to it on the client first: the server would resize
+    them to that size anyway, and the socket then carries ~10x fewer bytes
+    for a 1440p capture.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=30.0, downscale=True):
+        self.address = address
+        self.timeout = timeout
+        self.downscale = downscale
+        self._sock = None
+        self._next_id = 0
+        self._small = None
+        self.info = {}
+        self.names = {}
+        self.imgsz = 640
+        self.device = 'service'
+        self.last_server_ms = 0.0
+
+    def connect(self):
+        family, address = parse_address(self.address)
+        try:
+            self._sock = socket.socket(family, socket.SOCK_STREAM)
+            self._sock.settimeout(self.timeout)
+            self._sock.connect(address)
+            if family == socket.AF_INET:
+                self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if _recv_bytes(self._sock, len(MAGIC)) != MAGIC:
+                raise ServiceError(f"{self.address} is not a detection service")
+            (length,) = HEADER_LENGTH.unpack(_recv_bytes(self._sock, HEADER_LENGTH.size))
+            self.info = json.loads(_recv_bytes(self._sock, length))
+        except (OSError, ConnectionError) as e:
+            self.close()
+            raise ServiceError(f"Cannot reach detection service at {self.address}: {e}") from e
+        if self.info.get('protocol') != PROTOCOL_VERSION:
+            raise ServiceError(f"Service protocol {self.info.get('protocol')} "
+                               f"(client speaks {PROTOCOL_VERSION})")
+        # JSON turns the class-id keys into strings
+        self.names = {int(k): v for k, v in self.info['names'].items()}
+        self.imgsz = self.info['imgsz']
+        self.device = self.info['device']
+        return self
+
+    def _request(self, op, frame, imgsz=0, conf=0.0, iou=0.0):
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        height, width, channels = frame.shape
+        try:
+            self._sock.sendall(REQUEST.pack(self._next_id, height, width, channels, op,
+                                            imgsz, conf, iou))
+            if frame.size:
+                self._sock.sendall(memoryview(np.ascontiguousarray(frame)).cast('B'))
+            request_id, status, count, ms = RESPONSE.unpack(_recv_bytes(self._sock, RESPONSE.size))
+            if op == OP_DETECT and status == STATUS_OK:
+                payload = _recv_bytes(self._sock, count * DETECTION_DTYPE.itemsize)
+            else:
+                payload = _recv_bytes(self._sock, count)
+        except (OSError, ConnectionError) as e:
+            raise ServiceError(f"Detection service connection lost: {e}") from e
+        if status != STATUS_OK:
+            raise ServiceError(f"Service error: {payload.decode(errors='replace')}")
+        return payload, ms
+
+    def detect(self, frame, imgsz=None, conf=0.0, iou=0.0):
+        """Detections for one BGR/BGRA uint8 frame"""
+        imgsz = imgsz or self.imgsz
+        height, width = frame.shape[:2]
+        scale = min(imgsz / max(height, width), 1.0) if self.downscale else 1.0
+        if scale < 1.0:
+            size = (int(round(width * scale)), int(round(height * scale)))
+            if self._small is None or self._small.shape[1::-1] != size or \
+                    self._small.shape[2] != frame.shape[2]:
+                self._small = np.empty((size[1], size[0], frame.shape[2]), dtype=np.uint8)
+            frame = cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_LINEAR)
+        payload, self.last_server_ms = self._request(OP_DETECT, frame, imgsz, conf, iou)
+        rows = np.frombuffer(payload, dtype=DETECTION_DTYPE)
+        xyxy = rows['xyxy'] / np.float32(scale) if scale < 1.0 else rows['xyxy']
+        return Detections(xyxy, rows['conf'], rows['cls'])
+
+    def stats(self):
+        """The service's counters"""
+        payload, _ = self._request(OP_STATS, np.empty((0, 0, 1), dtype=np.uint8))
+        return json.loads(payload)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def format_service_info(client):
+    """One-line description of the connected service for console output"""
+    return (f"{client.address} ({client.device.upper()}, imgsz {client.imgsz}, "
+            f"{len(client.names)} classes, pid {client.info.get('pid')})")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a warm YOLOv12 model to local clients")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS,
+                        help="unix:///PATH or tcp://HOST:PORT (keep TCP on localhost)")
+    parser.add_argument('--weights', default=None, help="model weights: a path, or latest / fastest / accurate from the model "
+                             "registry (default: latest best.pt)")
+    parser.add_argument('--imgsz', type=int, default=640, help="default model input size")
+    # Ultralytics' predict defaults, as in-process inference.py / benchmark.py and OnnxDetector use
+    parser.add_argument('--conf', type=float, default=0.25, help="default confidence threshold")
+    parser.add_argument('--iou', type=float, default=0.7, help="default NMS IoU threshold")
+    parser.add_argument('--device', default=None, help="cuda or cpu (default: cuda if available)")
+    parser.add_argument('--warmup', type=int, default=5, help="warm-up passes before serving")
+    parser.add_argument('--max-batch', type=int, default=8,
+                        help="frames from concurrent clients per forward pass (1 = no batching)")
+    parser.add_argument('--max-delay-ms', type=float, default=0.0,
+                        help="how long the first queued frame may wait for others to join its "
+                             "batch (0 = only batch frames that queued during the last pass)")
+    return parser.parse_args()
+
+def main():
+    """Load the model once and serve it until interrupted"""
+    args = parse_args()
+
+    print("=" * 70)
+    print("YOLOv12 Detection Service")
+    print("=" * 70)
+    print()
+
+    try:
+        weights_path = resolve_weights(args.weights)
+    except RegistryError as e:
+        print(f"❌ {e}")
+        return 1
+    if not weights_path:
+        print("❌ No trained model found!")
+        return 1
+
+    import torch
+    from ultralytics import YOLO
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"🤖 Loading model: {weights_path}")
+    start = time.perf_counter()
+    model = YOLO(weights_path)
+    model.to(device)
+    runner = ModelRunner(model, args.imgsz, args.conf, args.iou, device)
+    runner.warmup(args.warmup)
+    print(f"✅ Model ready on {device.upper()} in {time.perf_counter() - start:.1f}s "
+          f"({args.warmup} warm-up passes)")
+
+    service = DetectionService(runner, args.address, info={'weights': str(weights_path)},
+                               max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000)
+    if service.batcher is not None:
+        print(f"📦 Batching: up to {args.max_batch} frames, {args.max_delay_ms:g}ms max delay")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Service stopped")
+    stats = service.stats()
+    print(f"   {stats['requests']} requests from {stats['clients']} clients, "
+          f"{stats['mean_ms']:.1f}ms mean, {stats['errors']} errors")
+    if service.batcher is not None:
+        print(f"   {format_batch_stats(service.batcher)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
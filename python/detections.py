@@ -0,0 +1,83 @@
+"""
+Compact detection container
+Plain NumPy arrays (boxes, confidences, classes) that can be offset,
+filtered and concatenated when merging several inference passes
+"""
+import numpy as np
+
+class Detections:
+    """Detections for one frame in screen coordinates
+
+    xyxy: (N, 4) float32, conf: (N,) float32, cls: (N,) int32,
+    ids: (N,) int64 track IDs, or None when the boxes are not tracked
+    """
+
+    __slots__ = ('xyxy', 'conf', 'cls', 'ids')
+
+    def __init__(self, xyxy, conf, cls, ids=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.int32).reshape(-1)
+        self.ids = None if ids is None else np.asarray(ids, dtype=np.int64).reshape(-1)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+
+    @classmethod
+    def from_data(cls, data):
+        """Split an Ultralytics-style (N, 6) [xyxy, conf, cls] array
+
+        (N, 7) arrays from tracked results ([xyxy, id, conf, cls]) keep their IDs.
+        """
+        ids = data[:, 4] if data.shape[1] == 7 else None
+        return cls(data[:, :4], data[:, -2], data[:, -1], ids)
+
+    @classmethod
+    def from_ultralytics(cls, result):
+        """Copy an Ultralytics Results' boxes to NumPy in one transfer"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+        # One device sync and copy for boxes, confidences and classes together
+        return cls.from_data(boxes.data.cpu().numpy())
+
+    def __len__(self):
+        return len(self.conf)
+
+    def offset(self, dx, dy):
+        """Return a copy shifted by (dx, dy), e.g. from crop to frame space"""
+        return Detections(self.xyxy + np.array([dx, dy, dx, dy], dtype=np.float32),
+                          self.conf, self.cls, self.ids)
+
+    def select(self, mask):
+        """Return the subset picked by a boolean mask or index array"""
+        ids = None if self.ids is None else self.ids[mask]
+        return Detections(self.xyxy[mask], self.conf[mask], self.cls[mask], ids)
+
+    def centers(self):
+        """(N, 2) box centres"""
+        return (self.xyxy[:, :2] + self.xyxy[:, 2:]) / 2
+
+    def to_supervision(self, names=None):
+        """Convert to supervision.Detections (class names attached if given)"""
+        import supervision as sv
+
+        data = {}
+        if names is not None:
+            data['class_name'] = np.array([names[int(c)] for c in self.cls])
+        return sv.Detections(xyxy=self.xyxy, confidence=self.conf, class_id=self.cls,
+                             tracker_id=self.ids, data=data)
+
+    @staticmethod
+    def concat(items):
+        """Concatenate several Detections into one (IDs kept only if all have them)"""
+        items = [d for d in items if d is not None]
+        if not items:
+            return Detections.empty()
+        ids = None
+        if all(d.ids is not None for d in items):
+            ids = np.concatenate([d.ids for d in items])
+        return Detections(np.concatenate([d.xyxy for d in items]),
+                          np.concatenate([d.conf for d in items]),
+                          np.concatenate([d.cls for d in items]), ids)
@@ -1,10 +1,15 @@
 """
 Export trained YOLOv12 model to different formats
-Supports: ONNX, TensorRT, CoreML, TFLite, etc.
+Supports: ONNX, TensorRT, CoreML, TFLite, etc., and INT8-quantized ONNX
+for CPU deployment, validated and benchmarked against the FP32 export
+
+Usage:
+    python export_model.py                             # pick a format
+    python export_model.py --int8 both --calib-images 200
 """
+import argparse
 import sys
 from pathlib import Path
-import yaml
 
 # Add YOLOv12 to path
 yolov12_path = Path(__file__).parent / "yolov12"
@@ -12,41 +17,137 @@ if yolov12_path.exists():
     sys.path.insert(0, str(yolov12_path))
 
 from ultralytics import YOLO
+from image_batch import dataset_images
+from model_registry import ModelRegistry, RegistryError, resolve_weights
+from onnx_backend import BackendError
+from quantize import (CALIBRATION_METHODS, QUANT_MODES, QuantizationError, calibration_images,
+                      format_comparison, measure_latency, quantize_onnx, recommend)
+from validate import get_dataset_path, run_validation
 
-def load_config():
-    """Load configuration from config.yaml"""
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Export the trained model to other formats")
+    parser.add_argument('--weights', metavar='PATH|latest',
+                        help="model to export (default: latest run's best.pt)")
+    parser.add_argument('--int8', choices=QUANT_MODES + ('both',),
+                        help="skip the menu: export ONNX, quantize it to INT8 (static is "
+                             "calibrated, dynamic is the fallback), then validate and "
+                             "benchmark every model against FP32")
+    parser.add_argument('--calib-images', type=int, default=200, metavar='N',
+                        help="training images sampled for static calibration (0: all)")
+    parser.add_argument('--calib-method', choices=CALIBRATION_METHODS, default='minmax',
+                        help="how activation ranges are derived from the calibration images")
+    parser.add_argument('--imgsz', type=int, help="export image size (default: training size)")
+    parser.add_argument('--runs', type=int, default=50,
+                        help="timed CPU inferences per model for the INT8 comparison")
+    parser.add_argument('--threads', type=int,
+                        help="ONNX Runtime intra-op threads for the benchmark (default: automatic)")
+    parser.add_argument('--max-map-drop', type=float, default=0.01, metavar='MAP50',
+                        help="largest mAP50 loss (absolute, 0.01 = 1 point) INT8 may cost "
+                             "and still be recommended")
+    return parser.parse_args()
 
-def find_best_weights():
-    """Find the best trained model weights"""
-    config = load_config()
-    runs_dir = Path(config['paths']['runs']) / "detect"
+def export_int8(model, args):
+    """Export FP32 ONNX, quantize it, and compare accuracy and CPU latency"""
+    data_path = get_dataset_path()
+    if not data_path:
+        print("❌ No dataset found! INT8 calibration and validation need one")
+        return
     
-    if not runs_dir.exists():
-        return None
+    print("🔄 Exporting FP32 ONNX...")
+    export_args = {'imgsz': args.imgsz} if args.imgsz else {}
+    onnx_path = Path(model.export(format='onnx', simplify=True, **export_args))
+    print()
     
-    train_dirs = sorted(runs_dir.glob("train*"))
-    if not train_dirs:
-        return None
+    modes = list(QUANT_MODES) if args.int8 == 'both' else [args.int8]
+    try:
+        images = calibration_images(data_path, args.calib_images) if 'static' in modes else []
+    except QuantizationError as e:
+        print(f"⚠️  {e}; falling back to dynamic quantization")
+        modes, images = ['dynamic'], []
     
-    latest_run = train_dirs[-1]
-    best_weights = latest_run / "weights" / "best.pt"
+    registry = ModelRegistry.from_config().scan()
+    models = [('fp32', onnx_path)]
+    while modes:
+        mode = modes.pop(0)
+        if mode == 'static':
+            print(f"🔬 Calibrating static INT8 on {len(images)} training images "
+                  f"({args.calib_method})...")
+        else:
+            print("🔬 Quantizing dynamic INT8 (weights only, no calibration)...")
+        try:
+            path = quantize_onnx(onnx_path, mode, images, method=args.calib_method)
+        except QuantizationError as e:
+            print(f"⚠️  {e}")
+            if mode == 'static' and not modes:
+                print("   Falling back to dynamic quantization")
+                modes.append('dynamic')
+            continue
+        registry.register(path, source=onnx_path)
+        models.append((mode, path))
+        print(f"✅ {path.name} ({path.stat().st_size / (1024 * 1024):.1f} MB)")
+    registry.save()
+    print()
+    if len(models) == 1:
+        print("❌ No INT8 model could be produced")
+        return
     
-    if best_weights.exists():
-        return str(best_weights)
+    # Latency on validation images (training images if there are none)
+    try:
+        bench_images = dataset_images(data_path, 'val') or calibration_images(data_path, args.runs)
+    except QuantizationError as e:
+        print(f"❌ {e}; nothing to benchmark on")
+        return
+    results = []
+    for label, path in models:
+        try:
+            latency = measure_latency(path, bench_images, args.runs, args.threads)
+        except (BackendError, QuantizationError) as e:
+            print(f"⚠️  {path.name} cannot run on ONNX Runtime: {e}")
+            continue
+        print(f"🔍 Validating {path.name}...")
+        metrics = run_validation(YOLO(str(path), task='detect'), data_path,
+                                 imgsz=latency['imgsz'])
+        registry.record_metrics(path, dict(metrics, data=data_path))
+        registry.record_benchmark(path, 'onnx', latency['imgsz'], latency['mean_ms'], 'cpu',
+                                  p50_ms=latency['p50_ms'], p95_ms=latency['p95_ms'],
+                                  threads=args.threads, quantization=label)
+        results.append(dict(metrics, **latency, name=path.name, quantization=label, path=str(path),
+                            size_mb=path.stat().st_size / (1024 * 1024)))
+        print()
+    if not results or results[0]['path'] != str(onnx_path):
+        print("❌ The FP32 export could not be measured, so there is nothing to compare with")
+        return
     
-    return None
+    print("=" * 70)
+    print("📊 INT8 vs FP32 (ONNX Runtime, CPU"
+          f"{f', {args.threads} threads' if args.threads else ''})")
+    print("=" * 70)
+    print()
+    for line in format_comparison(results):
+        print(line)
+    print()
+    choice, reason = recommend(results, args.max_map_drop)
+    status = '⚠️ ' if choice is results[0] else '✅'
+    print(f"{status} Recommended: {Path(choice['path']).name}: {reason}")
+    print(f"   python python/inference.py --backend onnx --weights {choice['path']}")
+    print()
 
 def export_model():
     """Export model to different formats"""
+    args = parse_args()
+    
     print("=" * 70)
     print("YOLOv12 Model Export")
     print("=" * 70)
     print()
     
     # Find model
-    weights_path = find_best_weights()
+    try:
+        weights_path = resolve_weights(args.weights)
+    except RegistryError as e:
+        print(f"❌ {e}")
+        return
     if not weights_path:
         print("❌ No trained model found!")
         print("   Please train a model first: python train.py")
@@ -57,6 +158,10 @@ def export_model():
     print("✅ Model loaded successfully!")
     print()
     
+    if args.int8:
+        export_int8(model, args)
+        return
+    
     # Show export options
     print("📦 Export Formats:")
     print("   1. ONNX       - Universal format (CPU/GPU)")
@@ -66,11 +171,17 @@ def export_model():
     print("   5. TFLite     - Mobile devices (Android/iOS)")
     print("   6. TF         - TensorFlow SavedModel")
     print("   7. All        - Export all formats")
+    print("   8. ONNX INT8  - Quantized for CPU, compared with FP32")
     print()
     
-    choice = input("Select format (1-7): ").strip()
+    choice = input("Select format (1-8): ").strip()
     print()
     
+    if choice == '8':
+        args.int8 = 'both'
+        export_int8(model, args)
+        return
+    
     export_formats = {
         '1': ('onnx', 'ONNX'),
         '2': ('engine', 'TensorRT'),
@@ -113,6 +224,9 @@ def export_model():
         print("=" * 70)
         print()
         
+        # Index the new artifacts next to their source weights
+        ModelRegistry.from_config().scan()
+        
         # Show exported files
         weights_dir = Path(weights_path).parent
         print(f"📁 Exported files in: {weights_dir}")
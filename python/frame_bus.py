@@ -0,0 +1,639 @@
+"""
+Shared-memory frame bus
+One capture process publishes frames into a multiprocessing.shared_memory
+ring; detector, viewer, recorder and monitor processes subscribe and read
+them in place, each at its own rate, without pickling or copying frames
+between processes
+
+Usage:
+    python frame_bus.py --source cs2 --detect --view
+    python frame_bus.py --source synthetic:2560x1440@60 --detect --record --monitor --seconds 30
+    python demo_detection.py --source bus:cs2-frames     # demo as a subscriber
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from frame_sources import FrameSource, SourceError
+from model_registry import RegistryError, resolve_weights
+
+MAGIC = 0x5355424D41524643  # 'CFRAMBUS'
+VERSION = 1
+DEFAULT_NAME = "cs2-frames"
+
+# Layout: HEADER (uint64 words), one SLOT_DTYPE record per slot, then the
+# slot pixel buffers, each padded to a 4 KiB boundary
+_MAGIC, _VERSION, _SLOTS, _SLOT_BYTES, _PUBLISHED, _CLOSED, _PID = range(7)
+_HEADER_WORDS = 8
+SLOT_DTYPE = np.dtype([('seq', '<u8'), ('index', '<u8'), ('timestamp', '<f8'),
+                       ('height', '<u4'), ('width', '<u4'), ('channels', '<u4'),
+                       ('_pad', '<u4', (7,))])
+_ALIGN = 4096
+
+class BusError(Exception):
+    """Raised when a frame bus cannot be created or attached"""
+
+class BusClosed(Exception):
+    """Raised by FrameSubscriber.read() once the publisher has shut down"""
+
+def _align(n, to=_ALIGN):
+    return (n + to - 1) // to * to
+
+class FrameBus:
+    """A named shared-memory ring of frame slots
+
+    Every slot is guarded by a sequence number (a seqlock): while frame n
+    is being written its slot holds 2n+1, once complete 2n+2. Readers never
+    lock anything; they check the sequence before and after using a slot,
+    so a frame overwritten under them is detected rather than waited for.
+    The publisher owns the memory and unlinks it on close(). `slots` bounds
+    how long a reader may keep a frame: slot n is reused for frame
+    n + slots.
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self._header = np.ndarray((_HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        if self._header[_MAGIC] != MAGIC or self._header[_VERSION] != VERSION:
+            raise BusError(f"Shared memory '{shm.name}' is not a version {VERSION} frame bus")
+        self.slots = int(self._header[_SLOTS])
+        self.slot_bytes = int(self._header[_SLOT_BYTES])
+        meta_offset = _HEADER_WORDS * 8
+        self._meta = np.ndarray((self.slots,), dtype=SLOT_DTYPE, buffer=shm.buf,
+                                offset=meta_offset)
+        data_offset = _align(meta_offset + self.slots * SLOT_DTYPE.itemsize)
+        self._data = np.ndarray((self.slots, self.slot_bytes), dtype=np.uint8,
+                                buffer=shm.buf, offset=data_offset)
+
+    @classmethod
+    def create(cls, name, width, height, channels=4, slots=4):
+        """Allocate a bus for frames up to width x height x channels"""
+        slot_bytes = _align(width * height * channels)
+        meta_bytes = _HEADER_WORDS * 8 + slots * SLOT_DTYPE.itemsize
+        size = _align(meta_bytes) + slots * slot_bytes
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError as e:
+            raise BusError(f"Frame bus '{name}' already exists (another publisher running?)") from e
+        header = np.ndarray((_HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=_HEADER_WORDS * 8)[:] = 0
+        header[_SLOTS] = slots
+        header[_SLOT_BYTES] = slot_bytes
+        header[_PID] = os.getpid()
+        header[_VERSION] = VERSION
+        # Written last: attach() treats the bus as ready once MAGIC is set
+        header[_MAGIC] = MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, timeout=10.0, track=False):
+        """Open an existing bus, waiting up to timeout seconds for the publisher
+
+        An attached segment must not stay registered with this process's
+        resource tracker, which would unlink the publisher's memory when
+        this process exits. Processes spawned by main() share the
+        publisher's tracker and pass track=True instead.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise BusError(f"Frame bus '{name}' not found (is the publisher running?)")
+                time.sleep(0.05)
+        if os.name == 'posix' and not track:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        while np.ndarray((1,), dtype=np.uint64, buffer=shm.buf)[0] != MAGIC:
+            if time.monotonic() >= deadline:
+                raise BusError(f"Frame bus '{name}' was never initialised")
+            time.sleep(0.01)
+        return cls(shm, owner=False)
+
+    @property
+    def published(self):
+        """Frames published so far"""
+        return int(self._header[_PUBLISHED])
+
+    @property
+    def closed(self):
+        return bool(self._header[_CLOSED])
+
+    def shutdown(self):
+        """Tell every subscriber that no more frames are coming"""
+        self._header[_CLOSED] = 1
+
+    def slot_view(self, slot, shape):
+        return self._data[slot, :shape[0] * shape[1] * shape[2]].reshape(shape)
+
+    def close(self):
+        """Detach; the owner also shuts the bus down and frees the memory"""
+        if self._shm is None:
+            return
+        if self.owner:
+            self.shutdown()
+        self._header = self._meta = self._data = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping goes with the process
+            pass
+        if self.owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+class FramePublisher:
+    """Writes frames into a bus; also usable as the `pool` of read_into()
+
+    acquire(shape) hands out the next slot as a writable array (marking it
+    busy), so a FrameSource can capture straight into shared memory;
+    publish() then makes it visible to subscribers. release() abandons a
+    slot that was acquired but not filled.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._pending = None
+        self.frames = 0
+
+    def acquire(self, shape):
+        shape = tuple(shape)
+        if len(shape) != 3 or shape[0] * shape[1] * shape[2] > self.bus.slot_bytes:
+            raise BusError(f"Frame {shape} does not fit the bus ({self.bus.slot_bytes} bytes/slot)")
+        n = self.bus.published
+        slot = n % self.bus.slots
+        meta = self.bus._meta[slot]
+        meta['seq'] = 2 * n + 1
+        meta['height'], meta['width'], meta['channels'] = shape
+        self._pending = n
+        return self.bus.slot_view(slot, shape)
+
+    def release(self, buf):
+        # The slot keeps its odd "being written" sequence, which no reader accepts
+        self._pending = None
+
+    def publish(self, index=None, timestamp=None):
+        """Commit the acquired slot as the newest frame"""
+        n = self._pending
+        meta = self.bus._meta[n % self.bus.slots]
+        meta['index'] = n if index is None else index
+        meta['timestamp'] = time.perf_counter() if timestamp is None else timestamp
+        meta['seq'] = 2 * n + 2
+        self.bus._header[_PUBLISHED] = n + 1
+        self._pending = None
+        self.frames += 1
+
+    def write(self, frame, index=None, timestamp=None):
+        """Copy a frame in and publish it"""
+        np.copyto(self.acquire(frame.shape), frame)
+        self.publish(index, timestamp)
+
+class BusFrame:
+    """A frame read in place from the bus
+
+    `image` is a view into shared memory. It stays intact until the
+    publisher laps the ring; call valid() after using it (or copy() it
+    first) to know whether the result can be trusted.
+    """
+
+    __slots__ = ('image', 'index', 'timestamp', 'number', '_bus', '_slot')
+
+    def __init__(self, image, index, timestamp, number, bus, slot):
+        self.image = image
+        self.index = index
+        self.timestamp = timestamp
+        self.number = number
+        self._bus = bus
+        self._slot = slot
+
+    def valid(self):
+        """True if the slot has not been overwritten since this frame was read"""
+        return int(self._bus._meta['seq'][self._slot]) == 2 * self.number + 2
+
+    def copy(self):
+        """Detached copy of the image, or None if it was already overwritten"""
+        image = self.image.copy()
+        return image if self.valid() else None
+
+class FrameSubscriber:
+    """Reads frames from a bus at the consumer's own pace
+
+    latest=True (viewers, detectors) always jumps to the newest frame;
+    latest=False (recorders) walks frames in order and only skips the ones
+    the publisher has already overwritten. Skipped frames are counted in
+    `missed`, frames overwritten while being read in `torn`.
+    """
+
+    def __init__(self, bus, latest=True, poll_interval=0.0005):
+        self.bus = bus
+        self.latest = latest
+        self.poll_interval = poll_interval
+        self._next = bus.published if latest else max(0, bus.published - bus.slots + 1)
+        self.received = 0
+        self.missed = 0
+        self.torn = 0
+
+    def read(self, timeout=None):
+        """Return the next BusFrame, None on timeout; raises BusClosed at the end"""
+        bus = self.bus
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            published = bus.published
+            if published > self._next:
+                if self.latest:
+                    number = published - 1
+                else:
+                    # The slot of frame `published` - slots may be mid-write
+                    number = max(self._next, published - bus.slots + 1)
+                slot = number % bus.slots
+                meta = bus._meta[slot]
+                expected = 2 * number + 2
+                if int(meta['seq']) == expected:
+                    shape = (int(meta['height']), int(meta['width']), int(meta['channels']))
+                    index, timestamp = int(meta['index']), float(meta['timestamp'])
+                    # Re-check: the metadata above must belong to frame `number`
+                    if int(meta['seq']) == expected:
+                        self.missed += number - self._next
+                        self._next = number + 1
+                        self.received += 1
+                        return BusFrame(bus.slot_view(slot, shape), index, timestamp,
+                                        number, bus, slot)
+                # Lapped while looking: count it and try the newer frames
+                self.torn += 1
+                self._next = number + 1
+                continue
+            if bus.closed:
+                raise BusClosed(bus.name)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        """Snapshot of subscriber counters"""
+        return {
+            'received': self.received,
+            'missed': self.missed,
+            'torn': self.torn,
+            'lag': self.bus.published - self._next,
+        }
+
+class BusSource(FrameSource):
+    """FrameSource reading the newest frames from a bus another process publishes
+
+    Frames are copied out of shared memory into the caller's pool (one
+    memcpy), since the detection pipeline holds them across threads for
+    longer than the ring guarantees.
+    """
+
+    name = "bus"
+
+    def __init__(self, bus_name, timeout=10.0):
+        super().__init__()
+        self.bus_name = bus_name
+        self.timeout = timeout
+        self.bus = None
+        self.subscriber = None
+
+    def open(self):
+        try:
+            self.bus = FrameBus.attach(self.bus_name, self.timeout)
+        except BusError as e:
+            raise SourceError(str(e)) from e
+        self.subscriber = FrameSubscriber(self.bus, latest=True)
+        # Wait for the first frame to learn the resolution
+        frame = self.subscriber.read(self.timeout)
+        if frame is None:
+            raise SourceError(f"No frames on bus '{self.bus_name}'")
+        self.height, self.width, self.channels = frame.image.shape
+        self.subscriber = FrameSubscriber(self.bus, latest=True)
+
+    def read(self):
+        import cv2
+
+        while True:
+            try:
+                frame = self.subscriber.read()
+            except BusClosed:
+                return None
+            image = frame.copy()
+            if image is not None:
+                self.frames_read += 1
+                return image if image.shape[2] == 3 else cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+    def read_into(self, pool):
+        while True:
+            try:
+                frame = self.subscriber.read()
+            except BusClosed:
+                return None
+            buf = pool.acquire(frame.image.shape)
+            np.copyto(buf, frame.image)
+            if frame.valid():
+                self.frames_read += 1
+                return buf
+            pool.release(buf)
+
+    def is_alive(self):
+        return self.bus is not None and not self.bus.closed
+
+    def describe(self):
+        return f"Bus: {self.bus_name}"
+
+    def close(self):
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
+
+def format_subscriber_stats(name, subscriber):
+    """One-line summary of a subscriber's reads for console output"""
+    stats = subscriber.stats()
+    return (f"{name}: {stats['received']} frames, missed {stats['missed']}, "
+            f"torn {stats['torn']}")
+
+# Processes
+
+def _report(name, subscriber, last, interval=5.0):
+    now = time.monotonic()
+    if now - last >= interval:
+        print(f"[STATS] {format_subscriber_stats(name, subscriber)}", flush=True)
+        return now
+    return last
+
+def publish_source(bus_name, spec, slots=4, loop=False, realtime=False, max_frames=0, ready=None):
+    """Publisher process: read a FrameSource straight into the bus"""
+    from frame_sources import open_source
+
+    try:
+        source = open_source(spec, loop=loop, realtime=realtime)
+        source.open()
+    except SourceError as e:
+        print(f"[ERROR] {e}", flush=True)
+        if ready is not None:
+            ready.set()
+        return
+    bus = FrameBus.create(bus_name, source.width, source.height, source.channels, slots)
+    publisher = FramePublisher(bus)
+    print(f"[INFO] Publishing {source.describe()} on '{bus.name}' "
+          f"({slots} slots, {bus.slot_bytes * slots / (1024 * 1024):.0f} MB)", flush=True)
+    if ready is not None:
+        ready.set()
+    try:
+        while not bus.closed:
+            if not source.is_alive() and not source.reconnect():
+                time.sleep(1.0)
+                continue
+            frame = source.read_into(publisher)
+            if frame is None:
+                break
+            publisher.publish(source.frames_read - 1)
+            if max_frames and publisher.frames >= max_frames:
+                break
+    except BusError as e:
+        # e.g. the CS2 window was resized beyond the slot size
+        print(f"[ERROR] {e}", flush=True)
+    finally:
+        print(f"[INFO] Publisher: {publisher.frames} frames", flush=True)
+        source.close()
+        # Let subscribers finish with the last frames before the memory goes
+        bus.shutdown()
+        time.sleep(0.5)
+        bus.close()
+
+def detect_subscriber(bus_name, output, fmt='ndjson', imgsz=640, conf=0.4, weights=None,
+                      track=False):
+    """Detector process: YOLO on the newest frame, results to a ResultSink
+
+    `weights` is a resolved model path; main() looks it up in the model
+    registry before any process starts.
+    """
+    import torch
+    from ultralytics import YOLO
+
+    from preprocess import Letterbox, restore_boxes
+    from detections import Detections
+    from result_sink import ResultSink
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = YOLO(weights)
+    model.to(device)
+    letterbox = Letterbox(imgsz)
+    bus = FrameBus.attach(bus_name, track=track)
+    subscriber = FrameSubscriber(bus, latest=True)
+    sink = ResultSink(output, fmt, header={'names': model.names, 'source': f"bus:{bus_name}"}).open()
+    print(f"[INFO] Detector on {device.upper()}: results to {output}", flush=True)
+    last = time.monotonic()
+    try:
+        while True:
+            frame = subscriber.read()
+            tensor, meta = letterbox(frame.image)
+            # The letterbox copied the pixels; make sure they were not torn
+            if not frame.valid():
+                subscriber.torn += 1
+                continue
+            results = model(torch.from_numpy(tensor), conf=conf, device=device,
+                            half=device == 'cuda', verbose=False)
+            detections = Detections.from_ultralytics(restore_boxes(results, meta)[0])
+            timestamp = time.time() - (time.perf_counter() - frame.timestamp)
+            sink.write(frame.index, timestamp, detections)
+            last = _report("Detector", subscriber, last)
+    except BusClosed:
+        pass
+    finally:
+        sink.close()
+        print(f"[INFO] {format_subscriber_stats('Detector', subscriber)}", flush=True)
+        bus.close()
+
+def view_subscriber(bus_name, scale=0.5, track=False):
+    """Viewer process: show the newest frame in a window"""
+    import cv2
+
+    bus = FrameBus.attach(bus_name, track=track)
+    subscriber = FrameSubscriber(bus, latest=True)
+    window_name = f"Frame bus: {bus_name}"
+    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+    display = None
+    try:
+        while True:
+            frame = subscriber.read()
+            height, width = frame.image.shape[:2]
+            size = (int(width * scale), int(height * scale))
+            display = cv2.resize(frame.image, size, dst=display, interpolation=cv2.INTER_LINEAR)
+            cv2.imshow(window_name, display)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    except BusClosed:
+        pass
+    finally:
+        cv2.destroyAllWindows()
+        print(f"[INFO] {format_subscriber_stats('Viewer', subscriber)}", flush=True)
+        bus.close()
+
+def record_subscriber(bus_name, directory='recordings', fmt='video', fps=30.0,
+                      segment_seconds=60.0, track=False):
+    """Recorder process: every frame the ring still holds, to segmented files"""
+    from recorder import FrameRecorder, format_recorder_stats
+
+    bus = FrameBus.attach(bus_name, track=track)
+    subscriber = FrameSubscriber(bus, latest=False)
+    recorder = FrameRecorder(directory, fmt, fps=fps, segment_seconds=segment_seconds).open()
+    print(f"[INFO] Recording to {recorder.start()}", flush=True)
+    last = time.monotonic()
+    try:
+        while True:
+            frame = subscriber.read()
+            # record() copies the frame, so the slot is only needed this long
+            recorder.record(frame.image, frame.timestamp)
+            if not frame.valid():
+                subscriber.torn += 1
+            last = _report("Recorder", subscriber, last)
+    except BusClosed:
+        pass
+    finally:
+        recorder.close()
+        print(f"[INFO] {format_recorder_stats(recorder)}", flush=True)
+        print(f"[INFO] {format_subscriber_stats('Recorder', subscriber)}", flush=True)
+        bus.close()
+
+def monitor_subscriber(bus_name, interval=1.0, track=False):
+    """Analytics process: frame rate, capture-to-read latency and brightness"""
+    bus = FrameBus.attach(bus_name, track=track)
+    subscriber = FrameSubscriber(bus, latest=True)
+    count, latency, brightness = 0, 0.0, 0.0
+    started = time.monotonic()
+    try:
+        while True:
+            frame = subscriber.read()
+            latency += time.perf_counter() - frame.timestamp
+            # Sparse sample: analytics should not cost a full pass over 10 MB
+            brightness += float(frame.image[::16, ::16, :3].mean())
+            count += 1
+            elapsed = time.monotonic() - started
+            if elapsed >= interval:
+                print(f"[STATS] Monitor: {count / elapsed:.1f} FPS read, "
+                      f"publish->read {latency / count * 1000:.2f}ms, "
+                      f"brightness {brightness / count:.0f}, "
+                      f"published {bus.published}", flush=True)
+                count, latency, brightness = 0, 0.0, 0.0
+                started = time.monotonic()
+    except BusClosed:
+        pass
+    finally:
+        bus.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run capture and its consumers as separate processes "
+                                                 "connected by a shared-memory frame bus")
+    parser.add_argument('--source', default='cs2',
+                        help="frame source for the publisher (see demo_detection.py --source)")
+    parser.add_argument('--name', default=DEFAULT_NAME, help="shared memory name of the bus")
+    parser.add_argument('--slots', type=int, default=4,
+                        help="frames held in the ring (how far a slow reader may lag)")
+    parser.add_argument('--loop', action='store_true', help="restart video / image sources")
+    parser.add_argument('--realtime', action='store_true', help="pace video files at native FPS")
+    parser.add_argument('--max-frames', type=int, default=0, help="stop after N frames (0 = no limit)")
+    parser.add_argument('--seconds', type=float, default=0, help="stop after N seconds (0 = no limit)")
+    parser.add_argument('--detect', action='store_true', help="run a detector subscriber")
+    parser.add_argument('--output', default='bus_detections.ndjson',
+                        help="detector results: file, pipe, '-', tcp://HOST:PORT or unix:///PATH")
+    parser.add_argument('--imgsz', type=int, default=640, help="detector input size")
+    parser.add_argument('--weights', metavar='PATH|latest|fastest|accurate',
+                        help="detector model: a path, or picked from the model registry "
+                             "(default: latest run's best.pt)")
+    parser.add_argument('--min-map50', type=float,
+                        help="with a registry pick: only models validated at this mAP50 or better")
+    parser.add_argument('--view', action='store_true', help="run a viewer subscriber")
+    parser.add_argument('--record', action='store_true', help="run a recorder subscriber")
+    parser.add_argument('--record-dir', default='recordings')
+    parser.add_argument('--record-format', choices=['video', 'jpeg'], default='video')
+    parser.add_argument('--record-fps', type=float, default=30.0)
+    parser.add_argument('--monitor', action='store_true', help="run an analytics subscriber")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    weights = None
+    if args.detect:
+        # Resolved once here, so the detector process never scans the runs directory
+        try:
+            weights = resolve_weights(args.weights, min_map50=args.min_map50)
+        except RegistryError as e:
+            print(f"[ERROR] {e}")
+            return 1
+        if not weights:
+            print("[ERROR] No trained model found!")
+            return 1
+    # Spawn everywhere: the same behaviour as Windows, and no forked CUDA state
+    ctx = mp.get_context('spawn')
+    ready = ctx.Event()
+
+    publisher = ctx.Process(target=publish_source, name="publisher",
+                            args=(args.name, args.source, args.slots, args.loop, args.realtime,
+                                  args.max_frames, ready))
+    # Children share this process's resource tracker with the publisher
+    shared = {'track': True}
+    subscribers = []
+    if args.detect:
+        subscribers.append(ctx.Process(target=detect_subscriber, name="detector",
+                                       args=(args.name, args.output, 'ndjson', args.imgsz),
+                                       kwargs=dict(shared, weights=weights)))
+    if args.view:
+        subscribers.append(ctx.Process(target=view_subscriber, name="viewer", args=(args.name,),
+                                       kwargs=shared))
+    if args.record:
+        subscribers.append(ctx.Process(target=record_subscriber, name="recorder",
+                                       args=(args.name, args.record_dir, args.record_format,
+                                             args.record_fps),
+                                       kwargs=shared))
+    if args.monitor or not subscribers:
+        subscribers.append(ctx.Process(target=monitor_subscriber, name="monitor", args=(args.name,),
+                                       kwargs=shared))
+
+    print(f"[INFO] Frame bus '{args.name}': publisher + "
+          f"{', '.join(p.name for p in subscribers)}")
+    publisher.start()
+    ready.wait()
+    for process in subscribers:
+        process.start()
+
+    started = time.monotonic()
+    try:
+        while publisher.is_alive():
+            publisher.join(0.2)
+            if args.seconds and time.monotonic() - started >= args.seconds:
+                break
+    except KeyboardInterrupt:
+        print("\n[INFO] Stopping...")
+    finally:
+        if publisher.is_alive():
+            # Closing the bus ends the publisher loop and then every subscriber
+            try:
+                bus = FrameBus.attach(args.name, timeout=1.0, track=True)
+                bus.shutdown()
+                bus.close()
+            except BusError:
+                publisher.terminate()
+        publisher.join(5.0)
+        for process in subscribers:
+            process.join(10.0)
+            if process.is_alive():
+                process.terminate()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Reusable frame buffers for the capture path
+A small pool of preallocated arrays that sources write into, so a
+full-resolution frame does not cost fresh allocations every iteration
+"""
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+class FramePool:
+    """Fixed-size pool of preallocated frame buffers
+
+    Buffers are handed out with acquire() and must be given back with
+    release() once every consumer is done with them. If all buffers are in
+    flight a new one is allocated (and counted) rather than blocking, so
+    `allocations` staying flat after warm-up means the hot path is
+    allocation-free.
+    """
+
+    def __init__(self, count=6, dtype=np.uint8, name="frames"):
+        self.count = count
+        self.dtype = dtype
+        self.name = name
+        self._shape = None
+        self._free = deque()
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.acquired = 0
+        self.exhausted = 0
+
+    def _allocate(self, shape):
+        buf = np.empty(shape, dtype=self.dtype)
+        self.allocations += 1
+        self.allocated_bytes += buf.nbytes
+        return buf
+
+    def acquire(self, shape):
+        """Return a free buffer of the given shape (contents are undefined)"""
+        shape = tuple(shape)
+        with self._lock:
+            if shape != self._shape:
+                # Resolution changed: drop the old buffers and preallocate anew
+                self._shape = shape
+                self._free = deque(self._allocate(shape) for _ in range(self.count))
+            self.acquired += 1
+            if self._free:
+                return self._free.popleft()
+            self.exhausted += 1
+            return self._allocate(shape)
+
+    def release(self, buf):
+        """Give a buffer back to the pool (buffers of a stale shape are dropped)"""
+        if buf is None:
+            return
+        with self._lock:
+            if buf.shape == self._shape and len(self._free) < self.count:
+                self._free.append(buf)
+
+    @property
+    def available(self):
+        return len(self._free)
+
+    def stats(self):
+        """Snapshot of pool counters"""
+        return {
+            'name': self.name,
+            'count': self.count,
+            'available': len(self._free),
+            'acquired': self.acquired,
+            'allocations': self.allocations,
+            'allocated_mb': self.allocated_bytes / (1024 * 1024),
+            'exhausted': self.exhausted,
+        }
+
+def as_bgr(frame, out=None):
+    """Return a 3-channel BGR view of a frame
+
+    BGR frames are returned as-is; BGRA frames are converted into `out`
+    (reused when its shape matches) so no per-frame array is allocated.
+    """
+    if frame.ndim == 3 and frame.shape[2] == 3:
+        return frame
+    if out is None or out.shape[:2] != frame.shape[:2]:
+        out = np.empty(frame.shape[:2] + (3,), dtype=frame.dtype)
+    return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=out)
+
+def format_pool_stats(pool):
+    """One-line summary of pool usage for console output"""
+    return (f"{pool.name}: {pool.available}/{pool.count} free, "
+            f"{pool.allocations} allocs ({pool.exhausted} overflow)")
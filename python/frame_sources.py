@@ -0,0 +1,506 @@
+"""
+Frame sources for the detection loop
+The CS2 window grabber, video files, image directories and a synthetic
+generator all expose the same FrameSource interface so detection can run
+(and be benchmarked) headless on machines without the game or Windows
+"""
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Windows-only capture dependencies are optional so the other sources work
+# on Linux build boxes
+try:
+    import mss
+except ImportError:
+    mss = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import win32gui
+    import win32process
+except ImportError:
+    win32gui = None
+    win32process = None
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv']
+
+def find_cs2_process():
+    """Find CS2.exe process and return PID"""
+    for proc in psutil.process_iter(['pid', 'name']):
+        try:
+            if proc.info['name'].lower() == 'cs2.exe':
+                return proc.info['pid']
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return None
+
+def find_window_by_pid(pid):
+    """Find window handle by process ID"""
+    result = []
+
+    def callback(hwnd, _):
+        if win32gui.IsWindowVisible(hwnd):
+            _, window_pid = win32process.GetWindowThreadProcessId(hwnd)
+            if window_pid == pid:
+                result.append(hwnd)
+        return True
+
+    win32gui.EnumWindows(callback, None)
+
+    # Return the main window (usually the first visible one)
+    return result[0] if result else None
+
+def get_window_rect_for_mss(hwnd):
+    """Get window rectangle for MSS capture - captures full client area"""
+    try:
+        # Get window position
+        rect = win32gui.GetWindowRect(hwnd)
+        left, top, right, bottom = rect
+
+        # Get client area size (actual game rendering area)
+        client_rect = win32gui.GetClientRect(hwnd)
+        client_width = client_rect[2] - client_rect[0]
+        client_height = client_rect[3] - client_rect[1]
+
+        # Calculate window borders
+        window_width = right - left
+        window_height = bottom - top
+
+        border_left = (window_width - client_width) // 2
+        border_top = window_height - client_height - border_left
+
+        return {
+            'left': left + border_left,
+            'top': top + border_top,
+            'width': client_width,
+            'height': client_height
+        }
+    except Exception as e:
+        print(f"[WARNING] Failed to get window rect: {e}")
+        return None
+
+class SourceError(Exception):
+    """Raised when a frame source cannot be opened"""
+
+class FrameSource:
+    """Base class for anything the detection loop can read frames from
+
+    read() returns a freshly allocated BGR frame or None once the source is
+    exhausted. read_into() writes the next frame into a FramePool buffer in
+    the source's native channel order (`channels`: 3 = BGR, 4 = BGRA) and is
+    what the real-time loop uses. Sources may be opened on one thread and
+    read on another.
+    """
+
+    name = "source"
+    channels = 3
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.frames_read = 0
+
+    def open(self):
+        """Prepare the source; raises SourceError on failure"""
+
+    def read(self):
+        """Return the next BGR frame, or None when there are no more"""
+        raise NotImplementedError
+
+    def read_into(self, pool):
+        """Read the next frame into a buffer acquired from pool
+
+        The caller owns the returned buffer and must release() it back to
+        the pool. Returns None when the source is exhausted.
+        """
+        frame = self.read()
+        if frame is None:
+            return None
+        buf = pool.acquire(frame.shape)
+        np.copyto(buf, frame)
+        return buf
+
+    def is_alive(self):
+        """False once the underlying producer (game, stream) has gone away"""
+        return True
+
+    def reconnect(self):
+        """Try to re-acquire the underlying producer; returns True on success"""
+        return False
+
+    def describe(self):
+        """Short label for the HUD and console"""
+        return self.name
+
+    def close(self):
+        """Release any handles held by the source"""
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+class CS2WindowSource(FrameSource):
+    """Captures the CS2.exe client area with mss (Windows only)"""
+
+    name = "cs2"
+    channels = 4
+
+    def __init__(self):
+        super().__init__()
+        self.pid = None
+        self.hwnd = None
+        self.region = None
+        # mss handles are thread-bound, so each reading thread gets its own
+        self._local = threading.local()
+        self._handles = []
+
+    def open(self):
+        if mss is None or win32gui is None or psutil is None:
+            raise SourceError("CS2 capture needs mss, pywin32 and psutil (Windows only)")
+
+        print("[INFO] Searching for CS2.exe process...")
+        pid = find_cs2_process()
+        if not pid:
+            raise SourceError("CS2.exe process not found! Please start Counter-Strike 2 and try again.")
+        print(f"[INFO] CS2.exe found! (PID: {pid})")
+
+        print("[INFO] Locating CS2 window...")
+        hwnd = find_window_by_pid(pid)
+        if not hwnd:
+            raise SourceError("CS2 window not found! Make sure CS2 is not minimized.")
+        print(f"[INFO] CS2 window found! (Handle: {hwnd})")
+
+        region = get_window_rect_for_mss(hwnd)
+        if not region:
+            raise SourceError("Failed to get CS2 window region!")
+
+        self._set_target(pid, hwnd, region)
+
+    def _set_target(self, pid, hwnd, region):
+        self.pid = pid
+        self.hwnd = hwnd
+        self.region = region
+        self.width = region['width']
+        self.height = region['height']
+
+    def _sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+            self._handles.append(sct)
+        return sct
+
+    def _grab(self, retries=3):
+        """Grab the client area and return a zero-copy BGRA view of it"""
+        for _ in range(retries):
+            try:
+                screenshot = self._sct().grab(self.region)
+                # View over mss' pixel buffer - no copy, no conversion
+                frame = np.frombuffer(screenshot.raw, dtype=np.uint8)
+                frame = frame.reshape(screenshot.height, screenshot.width, 4)
+                break
+            except Exception as e:
+                print(f"[WARNING] Capture failed: {e}")
+                print("[INFO] Trying to reconnect to CS2 window...")
+                region = get_window_rect_for_mss(self.hwnd)
+                if not region:
+                    print("[ERROR] Failed to reconnect!")
+                    return None
+                self._set_target(self.pid, self.hwnd, region)
+        else:
+            return None
+
+        # Verify captured size matches expected
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            print(f"[WARNING] Captured size mismatch: {frame.shape[1]}x{frame.shape[0]} vs {self.width}x{self.height}")
+            # Update capture region and keep the frame that was grabbed
+            region = get_window_rect_for_mss(self.hwnd)
+            if region:
+                self._set_target(self.pid, self.hwnd, region)
+
+        self.frames_read += 1
+        return frame
+
+    def read(self):
+        frame = self._grab()
+        if frame is None:
+            return None
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+    def read_into(self, pool):
+        frame = self._grab()
+        if frame is None:
+            return None
+        buf = pool.acquire(frame.shape)
+        np.copyto(buf, frame)
+        return buf
+
+    def is_alive(self):
+        return self.pid is not None and psutil.pid_exists(self.pid)
+
+    def reconnect(self):
+        print("[INFO] Reconnecting to CS2 window...")
+        pid = find_cs2_process()
+        if not pid:
+            print("[WARNING] CS2 process not found")
+            return False
+        hwnd = find_window_by_pid(pid)
+        if not hwnd:
+            print("[WARNING] Window not found")
+            return False
+        region = get_window_rect_for_mss(hwnd)
+        if not region:
+            print("[WARNING] Failed to get window region")
+            return False
+        self._set_target(pid, hwnd, region)
+        print(f"[INFO] Reconnected! Game: {self.width}x{self.height}")
+        return True
+
+    def describe(self):
+        return f"CS2 PID: {self.pid}"
+
+    def close(self):
+        for sct in self._handles:
+            try:
+                sct.close()
+            except Exception:
+                pass
+        self._handles.clear()
+
+class VideoFileSource(FrameSource):
+    """Reads frames from a video file (or camera index) with cv2.VideoCapture
+
+    By default frames are delivered as fast as they decode; realtime=True
+    paces them at the file's native FPS to mimic a live capture.
+    """
+
+    name = "video"
+
+    def __init__(self, path, loop=False, realtime=False):
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+        self.fps = 0.0
+        self.total_frames = 0
+        self._cap = None
+        self._next_time = None
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.path if isinstance(self.path, int) else str(self.path))
+        if not self._cap.isOpened():
+            raise SourceError(f"Could not open video: {self.path}")
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def read(self, out=None):
+        ret, frame = self._cap.read(out)
+        if not ret and self.loop and self.frames_read > 0:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read(out)
+        if not ret:
+            return None
+        if self.realtime and self.fps > 0:
+            self._next_time = _pace(self._next_time, 1.0 / self.fps)
+        self.frames_read += 1
+        return frame
+
+    def read_into(self, pool):
+        # Let the decoder write straight into the pooled buffer
+        buf = pool.acquire((self.height, self.width, 3))
+        frame = self.read(buf)
+        if frame is None:
+            pool.release(buf)
+            return None
+        if frame is not buf:
+            # Stream changed resolution mid-file; hand back what was decoded
+            pool.release(buf)
+            buf = pool.acquire(frame.shape)
+            np.copyto(buf, frame)
+        return buf
+
+    def describe(self):
+        return f"Video: {Path(str(self.path)).name}"
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+class ImageDirectorySource(FrameSource):
+    """Reads image files from a directory in sorted order"""
+
+    name = "images"
+
+    def __init__(self, path, loop=False):
+        super().__init__()
+        self.path = Path(path)
+        self.loop = loop
+        self.files = []
+        self._index = 0
+
+    def open(self):
+        if self.path.is_file():
+            self.files = [self.path]
+        else:
+            self.files = sorted(p for p in self.path.iterdir()
+                                if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not self.files:
+            raise SourceError(f"No images found in: {self.path}")
+        first = cv2.imread(str(self.files[0]))
+        if first is None:
+            raise SourceError(f"Could not read image: {self.files[0]}")
+        self.height, self.width = first.shape[:2]
+
+    def read(self):
+        while True:
+            if self._index >= len(self.files):
+                if not self.loop:
+                    return None
+                self._index = 0
+            path = self.files[self._index]
+            self._index += 1
+            frame = cv2.imread(str(path))
+            if frame is not None:
+                self.frames_read += 1
+                return frame
+            print(f"[WARNING] Could not read image: {path}")
+
+    def describe(self):
+        return f"Images: {self.path.name} ({len(self.files)})"
+
+class SyntheticSource(FrameSource):
+    """Generates moving player-like boxes over a static background
+
+    Frames are BGRA like the live screen grabber; fps=0 produces frames as
+    fast as possible.
+    """
+
+    name = "synthetic"
+    channels = 4
+
+    def __init__(self, width=1920, height=1080, fps=0, targets=6, seed=0):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.targets = targets
+        self.seed = seed
+        self._next_time = None
+
+    def open(self):
+        rng = np.random.default_rng(self.seed)
+        # Vertical gradient plus low-amplitude noise as a cheap "map" backdrop
+        gradient = np.linspace(40, 160, self.height, dtype=np.float32)[:, None, None]
+        noise = rng.integers(0, 24, (self.height, self.width, 3), dtype=np.uint8)
+        background = (gradient + noise).clip(0, 255).astype(np.uint8)
+        self._background = cv2.cvtColor(background, cv2.COLOR_BGR2BGRA)
+
+        base = min(self.width, self.height)
+        self._sizes = rng.uniform(0.08, 0.25, (self.targets, 1)) * base * np.array([[0.4, 1.0]])
+        self._pos = rng.uniform(0, 1, (self.targets, 2)) * (
+            np.array([self.width, self.height]) - self._sizes)
+        self._vel = rng.uniform(-0.004, 0.004, (self.targets, 2)) * base
+        self._colors = rng.integers(60, 255, (self.targets, 3))
+
+    def _render(self, out):
+        if self.fps > 0:
+            self._next_time = _pace(self._next_time, 1.0 / self.fps)
+
+        # Advance targets and bounce them off the frame edges
+        limit = np.array([self.width, self.height]) - self._sizes
+        self._pos += self._vel
+        bounced = (self._pos < 0) | (self._pos > limit)
+        self._vel[bounced] *= -1
+        np.clip(self._pos, 0, limit, out=self._pos)
+
+        np.copyto(out, self._background)
+        for (x, y), (w, h), color in zip(self._pos.astype(int), self._sizes.astype(int), self._colors):
+            color = tuple(int(c) for c in color)
+            cv2.rectangle(out, (x, y), (x + w, y + h), color, -1)
+            cv2.circle(out, (x + w // 2, y + w // 2), max(w // 3, 2), (30, 30, 30), -1)
+
+        self.frames_read += 1
+        return out
+
+    def read(self):
+        frame = self._render(np.empty_like(self._background))
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+    def read_into(self, pool):
+        return self._render(pool.acquire(self._background.shape))
+
+    def describe(self):
+        rate = f"@{self.fps:g}" if self.fps else ""
+        return f"Synthetic {self.width}x{self.height}{rate}"
+
+def _pace(next_time, interval):
+    """Sleep until next_time and return the following deadline"""
+    now = time.perf_counter()
+    if next_time is None:
+        return now + interval
+    if next_time > now:
+        time.sleep(next_time - now)
+        return next_time + interval
+    # Running behind: don't try to catch up with a burst of frames
+    return now + interval
+
+def parse_resolution(text):
+    """Parse 'WIDTHxHEIGHT[@FPS]' into (width, height, fps)"""
+    size, _, fps = text.partition('@')
+    width, height = (int(v) for v in size.lower().split('x'))
+    return width, height, float(fps) if fps else 0
+
+def open_source(spec, loop=False, realtime=False):
+    """Create a FrameSource from a command-line spec
+
+    cs2                      - live CS2 window (default)
+    synthetic[:WxH[@FPS]]    - generated frames, e.g. synthetic:2560x1440@60
+    bus[:NAME]               - frames published by frame_bus.py in another process
+    <video file> | <camera>  - cv2.VideoCapture input
+    <directory> | <image>    - image files in sorted order
+    """
+    if spec == 'cs2':
+        return CS2WindowSource()
+
+    if spec.startswith('synthetic'):
+        _, _, params = spec.partition(':')
+        try:
+            width, height, fps = parse_resolution(params) if params else (1920, 1080, 0)
+        except ValueError:
+            width = height = 0
+        if width <= 0 or height <= 0:
+            raise SourceError(f"Bad synthetic source: {spec} (expected synthetic:WIDTHxHEIGHT[@FPS], "
+                              f"e.g. synthetic:2560x1440@60)")
+        return SyntheticSource(width, height, fps=fps)
+
+    if spec == 'bus' or spec.startswith('bus:'):
+        from frame_bus import DEFAULT_NAME, BusSource
+        _, _, name = spec.partition(':')
+        return BusSource(name or DEFAULT_NAME)
+
+    if spec.isdigit():
+        return VideoFileSource(int(spec), realtime=False)
+
+    path = Path(spec)
+    if path.is_dir() or path.suffix.lower() in IMAGE_EXTENSIONS:
+        return ImageDirectorySource(path, loop=loop)
+    if path.suffix.lower() in VIDEO_EXTENSIONS or path.exists():
+        return VideoFileSource(path, loop=loop, realtime=realtime)
+
+    raise SourceError(f"Unknown frame source: {spec}")
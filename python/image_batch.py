@@ -0,0 +1,302 @@
+"""
+Bulk image inference
+Scores whole screenshot folders non-interactively: a thread pool decodes
+images ahead of the model, the model runs on batches, and every detection
+goes into one table (CSV, JSON Lines or Parquet) with the image path
+"""
+import csv
+import glob
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from frame_sources import IMAGE_EXTENSIONS
+from result_cache import content_digest
+
+TABLE_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet'}
+COLUMNS = ['image', 'width', 'height', 'x1', 'y1', 'x2', 'y2', 'conf', 'cls', 'class_name']
+
+class TableError(Exception):
+    """Raised when a results table cannot be written"""
+
+def is_image_batch(spec):
+    """True if a --source names many images (directory, glob or .txt list)"""
+    return (Path(spec).is_dir() or Path(spec).suffix.lower() == '.txt'
+            or any(c in str(spec) for c in '*?['))
+
+def collect_images(spec):
+    """Sorted image paths for a directory (recursive), glob pattern or .txt list"""
+    path = Path(spec)
+    if path.is_dir():
+        paths = (p for p in path.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+    elif path.suffix.lower() == '.txt':
+        lines = path.read_text(encoding='utf-8').splitlines()
+        # Relative entries are relative to the list file
+        return [p if p.is_absolute() else path.parent / p
+                for p in (Path(line.strip()) for line in lines if line.strip())]
+    else:
+        paths = (Path(p) for p in glob.glob(str(spec), recursive=True)
+                 if Path(p).suffix.lower() in IMAGE_EXTENSIONS)
+    return sorted(paths)
+
+def dataset_images(data_path, split='val'):
+    """Sorted image paths of a split ('train', 'val', 'test') named in a YOLO data.yaml
+
+    Entries are resolved against the yaml's `path` (or its folder); the
+    '../train/images' form Roboflow writes is also tried inside the
+    dataset folder, as Ultralytics does.
+    """
+    import yaml
+
+    data_path = Path(data_path)
+    data = yaml.safe_load(data_path.read_text(encoding='utf-8')) or {}
+    root = Path(data.get('path') or data_path.parent)
+    if not root.is_absolute():
+        root = data_path.parent / root
+    entries = data.get(split) or []
+    paths = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        for candidate in (root / entry, data_path.parent / str(entry).replace('../', '', 1)):
+            if candidate.exists():
+                paths.extend(collect_images(candidate))
+                break
+    return sorted(paths)
+
+def read_image(path, lookup=None):
+    """(image, digest, cached) for an image file; image is None if unreadable
+
+    With a lookup(digest) callable (e.g. a result cache) the file's content
+    hash is computed and, on a hit, returned as `cached` without decoding.
+    np.fromfile + imdecode also works with non-ASCII paths on Windows.
+    """
+    try:
+        data = np.fromfile(str(path), dtype=np.uint8)
+    except OSError:
+        return None, None, None
+    digest = cached = None
+    if lookup is not None:
+        # The raw file bytes, hashed exactly as the single-image path does
+        digest = content_digest(memoryview(data))
+        cached = lookup(digest)
+        if cached is not None:
+            return None, digest, cached
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    return image, digest, None
+
+def load_images(paths, workers=4, prefetch=64, lookup=None):
+    """Yield (path, image, digest, cached) in order, read by a thread pool ahead of the caller
+
+    OpenCV releases the GIL while decoding, so threads scale with cores; at
+    most `prefetch` decoded images wait in memory.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode") as pool:
+        pending = deque()
+        paths = iter(paths)
+        for path in paths:
+            pending.append((path, pool.submit(read_image, path, lookup)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(read_image, next_path, lookup)))
+            yield (path,) + future.result()
+
+class DetectionTable:
+    """One-row-per-detection results table written in chunks
+
+    Rows are buffered column-wise and flushed every `chunk_rows` rows, so a
+    run over tens of thousands of images never holds all detections in
+    memory. The format follows the file suffix: .csv, .jsonl/.ndjson or
+    .parquet (needs pyarrow; each chunk becomes a row group).
+    """
+
+    def __init__(self, path, names=None, chunk_rows=50_000):
+        self.path = Path(path)
+        self.format = TABLE_FORMATS.get(self.path.suffix.lower())
+        if self.format is None:
+            raise TableError(f"Unknown results format: {self.path.suffix} "
+                             f"(use {', '.join(TABLE_FORMATS)})")
+        self.names = names or {}
+        self.chunk_rows = chunk_rows
+        self._chunk = []
+        self._buffered = 0
+        self._file = None
+        self._csv = None
+        self._parquet = None
+        self.rows = 0
+        self.images = 0
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+                import pyarrow.parquet  # noqa: F401
+            except ImportError as e:
+                raise TableError("Parquet output needs pyarrow: pip install pyarrow") from e
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8', newline='')
+            if self.format == 'csv':
+                self._csv = csv.writer(self._file)
+                self._csv.writerow(COLUMNS)
+        return self
+
+    def add(self, image_path, shape, detections):
+        """Append one image's Detections"""
+        self.images += 1
+        if len(detections) == 0:
+            return
+        self._chunk.append((str(image_path), shape[1], shape[0], detections))
+        self._buffered += len(detections)
+        if self._buffered >= self.chunk_rows:
+            self.flush()
+
+    def _columns(self):
+        """Concatenate the buffered chunk into column arrays"""
+        counts = [len(d) for _, _, _, d in self._chunk]
+        xyxy = np.concatenate([d.xyxy for _, _, _, d in self._chunk])
+        cls = np.concatenate([d.cls for _, _, _, d in self._chunk])
+        return {
+            'image': np.repeat([path for path, _, _, _ in self._chunk], counts),
+            'width': np.repeat([w for _, w, _, _ in self._chunk], counts).astype(np.int32),
+            'height': np.repeat([h for _, _, h, _ in self._chunk], counts).astype(np.int32),
+            'x1': xyxy[:, 0], 'y1': xyxy[:, 1], 'x2': xyxy[:, 2], 'y2': xyxy[:, 3],
+            'conf': np.concatenate([d.conf for _, _, _, d in self._chunk]),
+            'cls': cls,
+            'class_name': np.array([self.names.get(int(c), str(int(c))) for c in cls]),
+        }
+
+    def flush(self):
+        if not self._chunk:
+            return
+        columns = self._columns()
+        count = len(columns['cls'])
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.table(columns)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(str(self.path), table.schema)
+            self._parquet.write_table(table)
+        else:
+            # Boxes to 0.1 px and confidences to 3 places, like the result sink
+            boxes = np.round(np.stack([columns[c] for c in ('x1', 'y1', 'x2', 'y2')], axis=1)
+                             .astype(np.float64), 1).tolist()
+            conf = np.round(columns['conf'].astype(np.float64), 3).tolist()
+            rows = zip(columns['image'].tolist(), columns['width'].tolist(),
+                       columns['height'].tolist(), boxes, conf, columns['cls'].tolist(),
+                       columns['class_name'].tolist())
+            if self.format == 'csv':
+                self._csv.writerows([image, w, h, *box, c, k, name]
+                                    for image, w, h, box, c, k, name in rows)
+            else:
+                self._file.write(''.join(
+                    json.dumps(dict(zip(COLUMNS, [image, w, h, *box, c, k, name])),
+                               separators=(',', ':')) + '\n'
+                    for image, w, h, box, c, k, name in rows))
+        self.rows += count
+        self._chunk = []
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self.format == 'parquet':
+            # No detections at all: still leave a valid, empty table
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([('image', pa.string()), ('width', pa.int32()),
+                                ('height', pa.int32())]
+                               + [(c, pa.float32()) for c in ('x1', 'y1', 'x2', 'y2', 'conf')]
+                               + [('cls', pa.int32()), ('class_name', pa.string())])
+            pq.write_table(schema.empty_table(), str(self.path))
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def run_image_batch(paths, detect_batch, table, batch=8, workers=4, progress_interval=1.0,
+                    cache=None, namespace=None):
+    """Decode, detect and tabulate every image; returns a stats dict
+
+    detect_batch(images) must return one Detections per image. With a
+    ResultCache (and the namespace for this model and settings) images
+    already scored are looked up by content hash and not even decoded;
+    only the misses reach the model, and their results are stored.
+    Rows are written in input order either way.
+    """
+    total = len(paths)
+    started = time.perf_counter()
+    last_report = started
+    failed = []
+    detect_time = 0.0
+    done = 0
+    cached = 0
+    # (path, image, digest, detections, shape) in input order; misses wait for a batch
+    pending = []
+    misses = 0
+    lookup = (lambda digest: cache.get(namespace, digest)) if cache is not None else None
+
+    def run_pending():
+        nonlocal detect_time
+        todo = [i for i, entry in enumerate(pending) if entry[3] is None]
+        if todo:
+            start = time.perf_counter()
+            results = detect_batch([pending[i][1] for i in todo])
+            detect_time += time.perf_counter() - start
+            for i, detections in zip(todo, results):
+                path, image, digest, _, _ = pending[i]
+                pending[i] = (path, None, digest, detections, image.shape)
+            if cache is not None:
+                cache.put_many(namespace, [(pending[i][2], pending[i][3], pending[i][4])
+                                           for i in todo])
+        for path, _, _, detections, shape in pending:
+            table.add(path, shape, detections)
+        pending.clear()
+
+    for path, image, digest, hit in load_images(paths, workers, max(2 * batch, 4 * workers),
+                                                lookup):
+        done += 1
+        if hit is not None:
+            cached += 1
+            pending.append((path, None, digest, hit[0], hit[1]))
+        elif image is None:
+            failed.append(path)
+        else:
+            pending.append((path, image, digest, None, None))
+            misses += 1
+        if misses >= batch:
+            run_pending()
+            misses = 0
+        now = time.perf_counter()
+        if now - last_report >= progress_interval:
+            last_report = now
+            print(f"\r   Processed {done}/{total} images ({done / (now - started):.1f} images/s)",
+                  end="")
+    if pending:
+        run_pending()
+    elapsed = time.perf_counter() - started
+    print(f"\r   Processed {done}/{total} images ({done / max(elapsed, 1e-9):.1f} images/s)")
+    return {
+        'images': done,
+        'failed': failed,
+        'cached': cached,
+        'elapsed_s': elapsed,
+        'images_per_s': done / elapsed if elapsed > 0 else 0.0,
+        'detect_ms': detect_time * 1000 / max(1, done - len(failed) - cached),
+    }
@@ -3,8 +3,8 @@ YOLOv12 Inference Script
 Run inference on images or video with trained model
 """
 import sys
+import argparse
 import cv2
-import yaml
 from pathlib import Path
 import supervision as sv
 
@@ -13,64 +13,153 @@ yolov12_path = Path(__file__).parent / "yolov12"
 if yolov12_path.exists():
     sys.path.insert(0, str(yolov12_path))
 
-from ultralytics import YOLO
+from detections import Detections
+from image_batch import DetectionTable, TableError, collect_images, is_image_batch, run_image_batch
+from preprocess import Letterbox, predict_letterboxed
+from tiling import TiledDetector, format_tile_stats
+from model_registry import RegistryError, resolve_weights
+from onnx_backend import BACKENDS, BackendError, OnnxDetector
+from postprocess import MAX_NMS
+from result_cache import DEFAULT_PATH as CACHE_PATH, ResultCache, content_digest, format_cache_stats, settings_namespace
+from tracing import NULL_TRACER, Tracer, format_trace_stats
+from video_pipeline import BatchedDetector, VideoPipeline, format_video_pipeline_stats
+from video_segments import SegmentError, run_segments
+from detection_service import DEFAULT_ADDRESS, DetectionClient, ServiceError, format_service_info
 
-def load_config():
-    """Load configuration from config.yaml"""
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv']
 
-def find_best_weights():
-    """Find the best trained model weights"""
-    config = load_config()
-    runs_dir = Path(config['paths']['runs']) / "detect"
-    
-    if not runs_dir.exists():
-        print("❌ No trained model found!")
-        print("   Please train a model first: python train.py")
+def parse_args():
+    """Parse command-line options (all optional; prompts fill in the rest)"""
+    parser = argparse.ArgumentParser(description="YOLOv12 inference on images or video")
+    parser.add_argument('--source',
+                        help="image or video path, 0 for webcam, or many images: a directory, "
+                             "glob pattern (quoted) or .txt list of paths")
+    parser.add_argument('--output', help="where to save the annotated result")
+    parser.add_argument('--weights', metavar='PATH|latest|fastest|accurate',
+                        help="model to load: a path, or picked from the model registry "
+                             "(default: latest run's best.pt)")
+    parser.add_argument('--min-map50', type=float,
+                        help="with a registry pick: only models validated at this mAP50 or better")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="torch: Ultralytics / PyTorch; onnx: the exported best.onnx on "
+                             "ONNX Runtime (CPU, no torch import)")
+    parser.add_argument('--imgsz', type=int, default=640, help="model input size")
+    parser.add_argument('--agnostic-nms', action='store_true',
+                        help="--backend onnx: let boxes of different classes suppress each other")
+    parser.add_argument('--nms-top-k', type=int, default=MAX_NMS, metavar='K',
+                        help="--backend onnx: highest-confidence candidates kept before NMS "
+                             "(lower is faster on crowded frames)")
+    parser.add_argument('--fused-preprocess', action='store_true',
+                        help="letterbox frames with the fused single-resize preprocessor")
+    parser.add_argument('--tiles', action='store_true',
+                        help="sliced inference: overlapping native-resolution tiles in batched passes")
+    parser.add_argument('--tile-size', type=int, default=640, help="tile edge in pixels")
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help="fractional tile overlap")
+    parser.add_argument('--tile-batch', type=int, default=8, help="tiles per forward pass")
+    parser.add_argument('--tiling-report', action='store_true',
+                        help="with --tiles, time tiled vs single-pass inference on the image "
+                             "(or last video frame); runs 10 extra inferences")
+    parser.add_argument('--batch', type=int, metavar='N',
+                        help="video files: decode, inference and encode on separate threads, "
+                             "N frames per forward pass (image batches: N images, default 8)")
+    parser.add_argument('--prefetch', type=int, default=4,
+                        help="decoded batches queued ahead of the model (with --batch)")
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help="video files: split at keyframes and process N segments in parallel "
+                             "worker processes (each loads its own model)")
+    parser.add_argument('--threads', type=int,
+                        help="CPU threads per worker process (default: cores / workers); "
+                             "with --backend onnx, ONNX Runtime's intra-op threads")
+    parser.add_argument('--results', metavar='FILE',
+                        help="image batches: detections table (.csv, .jsonl or .parquet); "
+                             "--workers: detections in frame order (.ndjson, or .bin)")
+    parser.add_argument('--decode-workers', type=int, default=4,
+                        help="image batches: threads decoding images ahead of the model")
+    parser.add_argument('--cache', nargs='?', const=CACHE_PATH, metavar='PATH',
+                        help="reuse detections for images already scored with the same weights "
+                             f"and settings (SQLite, default {CACHE_PATH})")
+    parser.add_argument('--cache-size', type=float, default=1024, metavar='MB',
+                        help="cache size limit; least recently used entries are evicted")
+    parser.add_argument('--service', nargs='?', const=DEFAULT_ADDRESS, metavar='ADDRESS',
+                        help="use a running detection_service.py instead of loading the model "
+                             f"(default address {DEFAULT_ADDRESS})")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="save a per-frame stage timeline as Chrome trace JSON (ui.perfetto.dev)")
+    return parser.parse_args()
+
+def find_weights(args):
+    """Resolve --weights through the model registry, explaining a miss"""
+    fmt = 'onnx' if args.backend == 'onnx' else 'pt'
+    try:
+        weights_path = resolve_weights(args.weights, fmt, min_map50=args.min_map50)
+    except RegistryError as e:
+        print(f"❌ {e}")
         return None
-    
-    # Find all training runs
-    train_dirs = sorted(runs_dir.glob("train*"))
-    if not train_dirs:
+    if not weights_path:
         print("❌ No trained model found!")
+        if fmt == 'onnx':
+            print("   Please export one first: python export_model.py (ONNX)")
+        else:
+            print("   Please train a model first: python train.py")
+    elif fmt == 'onnx' and Path(weights_path).suffix.lower() != '.onnx':
+        print(f"❌ --backend onnx needs an exported .onnx model, not {weights_path}")
         return None
-    
-    # Get latest run
-    latest_run = train_dirs[-1]
-    
-    # Check for best.pt
-    best_weights = latest_run / "weights" / "best.pt"
-    if best_weights.exists():
-        return str(best_weights)
-    
-    print("❌ No best.pt found in training results!")
-    return None
+    return weights_path
+
+def predict(model, frame, letterbox=None, imgsz=640):
+    """Run the model on one BGR frame and return its Results"""
+    if letterbox is not None:
+        return predict_letterboxed(model, frame, letterbox, verbose=False)[0]
+    return model(frame, imgsz=imgsz, verbose=False)[0]
+
+def detect(model, frame, letterbox=None, tiler=None, imgsz=640):
+    """Run the model on one BGR frame and return supervision Detections"""
+    if isinstance(model, (DetectionClient, OnnxDetector)):
+        return model.detect(frame, imgsz).to_supervision(model.names)
+    if tiler is not None:
+        return tiler(frame).to_supervision(model.names)
+    return sv.Detections.from_ultralytics(predict(model, frame, letterbox, imgsz))
 
-def run_inference_image(model, image_path, output_path=None):
+def run_inference_image(model, image_path, output_path=None, letterbox=None, imgsz=640, tiler=None,
+                        tracer=NULL_TRACER, cache=None, namespace=None, tiling_report=False):
     """Run inference on a single image"""
     print(f"📸 Processing: {image_path}")
     
     # Read image
-    image = cv2.imread(str(image_path))
+    with tracer.span('decode', 0):
+        image = cv2.imread(str(image_path))
     if image is None:
         print(f"❌ Could not read image: {image_path}")
         return
     
-    # Run inference
-    results = model(image, verbose=False)[0]
-    detections = sv.Detections.from_ultralytics(results)
+    # Run inference (or reuse the cached result for identical file contents)
+    cached = None
+    if cache is not None:
+        digest = content_digest(Path(image_path).read_bytes())
+        cached = cache.get(namespace, digest)
+    if cached is not None:
+        detections = cached[0].to_supervision(model.names)
+        print("   ♻️  Cached result (same image, weights and settings)")
+    else:
+        with tracer.span('detect', 0):
+            detections = detect(model, image, letterbox, tiler, imgsz)
+        if cache is not None:
+            cache.put(namespace, digest, Detections(detections.xyxy, detections.confidence,
+                                                    detections.class_id), image.shape)
     
     # Annotate image
     box_annotator = sv.BoundingBoxAnnotator()
     label_annotator = sv.LabelAnnotator()
     
-    annotated_image = box_annotator.annotate(scene=image.copy(), detections=detections)
-    annotated_image = label_annotator.annotate(scene=annotated_image, detections=detections)
+    with tracer.span('annotate', 0):
+        annotated_image = box_annotator.annotate(scene=image.copy(), detections=detections)
+        annotated_image = label_annotator.annotate(scene=annotated_image, detections=detections)
     
     # Save or display
     if output_path:
-        cv2.imwrite(str(output_path), annotated_image)
+        with tracer.span('write', 0):
+            cv2.imwrite(str(output_path), annotated_image)
         print(f"✅ Saved to: {output_path}")
     else:
         # Display
@@ -83,9 +172,27 @@ def run_inference_image(model, image_path, output_path=None):
     print(f"   Detected {len(detections)} objects")
     for i, (bbox, class_id, confidence) in enumerate(zip(detections.xyxy, detections.class_id, detections.confidence)):
         print(f"   {i+1}. Class {class_id}: {confidence:.2%}")
+    
+    if tiler is not None and tiling_report:
+        print_tiling_report(tiler, image, imgsz)
 
-def run_inference_video(model, video_path, output_path=None):
+def print_tiling_report(tiler, frame, imgsz):
+    """Print tiled vs single-pass latency measured on one frame"""
+    tiled_ms, single_ms = tiler.compare_with_single_pass(frame, imgsz)
+    print()
+    print(f"🧩 Tiled inference: {tiler.tiles_per_frame} tiles of {tiler.tile}px, "
+          f"{tiler.passes_per_frame} forward pass(es) per frame")
+    print(f"   Tiled: {tiled_ms:.1f}ms/frame | Single pass ({imgsz}): {single_ms:.1f}ms/frame "
+          f"({tiled_ms / single_ms:.1f}x)")
+
+def run_inference_video(model, video_path, output_path=None, letterbox=None, imgsz=640, tiler=None,
+                        tracer=NULL_TRACER, batch=None, prefetch=4, tiling_report=False):
     """Run inference on video"""
+    if batch:
+        run_inference_video_batched(model, video_path, output_path, letterbox, imgsz, tiler,
+                                    tracer, batch, prefetch)
+        return
+    
     print(f"🎥 Processing video: {video_path}")
     
     # Open video
@@ -118,32 +225,43 @@ def run_inference_video(model, video_path, output_path=None):
     
     try:
         while True:
-            ret, frame = cap.read()
+            with tracer.span('decode', frame_count):
+                ret, frame = cap.read()
             if not ret:
                 break
             
             frame_count += 1
+            last_frame = frame
             
             # Run inference
-            results = model(frame, verbose=False)[0]
-            detections = sv.Detections.from_ultralytics(results)
+            with tracer.span('detect', frame_count):
+                detections = detect(model, frame, letterbox, tiler, imgsz)
             
             # Annotate
-            annotated_frame = box_annotator.annotate(scene=frame.copy(), detections=detections)
-            annotated_frame = label_annotator.annotate(scene=annotated_frame, detections=detections)
+            with tracer.span('annotate', frame_count):
+                annotated_frame = box_annotator.annotate(scene=frame.copy(), detections=detections)
+                annotated_frame = label_annotator.annotate(scene=annotated_frame, detections=detections)
             
             # Write or display
             if writer:
-                writer.write(annotated_frame)
+                with tracer.span('write', frame_count):
+                    writer.write(annotated_frame)
                 print(f"\r   Processing: {frame_count}/{total_frames} frames ({frame_count/total_frames*100:.1f}%)", end="")
             else:
-                cv2.imshow("YOLOv12 Inference", annotated_frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                with tracer.span('display', frame_count):
+                    cv2.imshow("YOLOv12 Inference", annotated_frame)
+                    key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
                     print("\n   Stopped by user")
                     break
         
         print()
         
+        if tiler is not None and tiler.frames > 0:
+            print(f"   {format_tile_stats(tiler)}")
+            if tiling_report:
+                print_tiling_report(tiler, last_frame, imgsz)
+        
     finally:
         cap.release()
         if writer:
@@ -151,39 +269,293 @@ def run_inference_video(model, video_path, output_path=None):
             print(f"✅ Saved to: {output_path}")
         cv2.destroyAllWindows()
 
+def run_inference_video_batched(model, video_path, output_path=None, letterbox=None, imgsz=640,
+                                tiler=None, tracer=NULL_TRACER, batch=8, prefetch=4):
+    """Run inference on a video file with pipelined decode / batched inference / encode"""
+    print(f"🎥 Processing video: {video_path} (batches of {batch})")
+    
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        print(f"❌ Could not open video: {video_path}")
+        return
+    
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    print(f"   Resolution: {width}x{height}")
+    print(f"   FPS: {fps}")
+    print(f"   Total Frames: {total_frames}")
+    
+    writer = None
+    if output_path:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+    
+    # The service, ONNX Runtime and the tiler run frame by frame (tiles are batched already)
+    if isinstance(model, (DetectionClient, OnnxDetector)) or tiler is not None:
+        prepare = None
+        detect_frames = lambda frames, _: [detect(model, frame, None, tiler, imgsz) for frame in frames]
+    else:
+        detector = BatchedDetector(model, imgsz, batch, fused=letterbox is not None,
+                                   buffers=prefetch + 2)
+        prepare = detector.prepare
+        detect_frames = lambda frames, inputs: [sv.Detections.from_ultralytics(result)
+                                                for result in detector(frames, inputs)]
+    
+    box_annotator = sv.BoundingBoxAnnotator()
+    label_annotator = sv.LabelAnnotator()
+    
+    def annotate(index, frame, detections):
+        with tracer.span('annotate', index):
+            annotated = box_annotator.annotate(scene=frame, detections=detections)
+            return label_annotator.annotate(scene=annotated, detections=detections)
+    
+    def encode(index, frame, detections):
+        annotated = annotate(index, frame, detections)
+        with tracer.span('write', index):
+            writer.write(annotated)
+    
+    def progress(pipeline):
+        print(f"\r   Processing: {pipeline.frames}/{total_frames} frames "
+              f"({pipeline.frames / max(1, total_frames) * 100:.1f}%)", end="")
+    
+    pipeline = VideoPipeline(cap, detect_frames, batch, prefetch, prepare,
+                             sink=encode if writer else None, tracer=tracer).start()
+    try:
+        if writer:
+            pipeline.wait(progress)
+        else:
+            # cv2.imshow has to run on this thread
+            for index, frame, detections in pipeline.results():
+                annotated = annotate(index, frame, detections)
+                with tracer.span('display', index):
+                    cv2.imshow("YOLOv12 Inference", annotated)
+                    key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    print("\n   Stopped by user")
+                    break
+        print()
+        if pipeline.error is not None:
+            print(f"❌ Video processing failed: {pipeline.error}")
+        print(f"   {format_video_pipeline_stats(pipeline)}")
+    finally:
+        pipeline.close()
+        cap.release()
+        if writer:
+            writer.release()
+            print(f"✅ Saved to: {output_path}")
+        cv2.destroyAllWindows()
+
 def main():
     """Main inference function"""
+    args = parse_args()
+    
     print("=" * 70)
     print("YOLOv12 Inference")
     print("=" * 70)
     print()
     
-    # Find best model
-    weights_path = find_best_weights()
-    if not weights_path:
+    if args.workers:
+        run_parallel(args)
         return
     
-    print(f"🤖 Loading model: {weights_path}")
-    model = YOLO(weights_path)
-    print("✅ Model loaded successfully!")
+    if args.service:
+        # Warm model in a long-running service: no load or warm-up here
+        if args.tiles:
+            print("❌ --tiles needs the model in this process (not available with --service)")
+            return
+        try:
+            model = DetectionClient(args.service).connect()
+        except ServiceError as e:
+            print(f"❌ {e}")
+            print("   Start it with: python detection_service.py")
+            return
+        print(f"🔌 Using detection service: {format_service_info(model)}")
+        print()
+        args.fused_preprocess = False
+        weights_path = model.info.get('weights')
+    else:
+        if args.backend == 'onnx' and args.tiles:
+            print("❌ --tiles needs the PyTorch backend (not available with --backend onnx)")
+            return
+        
+        # Find best model
+        weights_path = find_weights(args)
+        if not weights_path:
+            return
+        
+        print(f"🤖 Loading model: {weights_path}")
+        if args.backend == 'onnx':
+            # NumPy letterbox / NMS around ONNX Runtime: torch is never imported
+            try:
+                model = OnnxDetector(weights_path, args.imgsz, intra_threads=args.threads,
+                                     top_k=args.nms_top_k, agnostic=args.agnostic_nms)
+            except BackendError as e:
+                print(f"❌ {e}")
+                return
+            model.warmup()
+            args.fused_preprocess = False
+            print(f"✅ Model loaded successfully! {model.describe()}")
+        else:
+            from ultralytics import YOLO
+            
+            model = YOLO(weights_path)
+            print("✅ Model loaded successfully!")
+        print()
+    
+    letterbox = Letterbox(args.imgsz) if args.fused_preprocess else None
+    if letterbox is not None:
+        print(f"⚡ Fused preprocessing: {args.imgsz}x{args.imgsz}")
+        print()
+    
+    tiler = None
+    if args.tiles:
+        tiler = TiledDetector(model, tile=args.tile_size, overlap=args.tile_overlap,
+                              batch=args.tile_batch)
+        print(f"🧩 Tiled inference: {tiler.tile}px tiles, {args.tile_overlap:.0%} overlap, "
+              f"batch {tiler.batch}")
+        print()
+    
+    cache, namespace = open_result_cache(args, model, weights_path, letterbox, tiler)
+    
+    tracer = Tracer(process_name="inference") if args.trace else NULL_TRACER
+    try:
+        run(args, model, letterbox, tiler, tracer, cache, namespace)
+    finally:
+        if cache is not None:
+            print(f"   {format_cache_stats(cache)}")
+            cache.close()
+        if tracer.enabled:
+            events = tracer.export(args.trace)
+            print(f"🧭 Trace saved to: {args.trace} ({events} events)")
+            print(f"   {format_trace_stats(tracer)}")
+
+def open_result_cache(args, model, weights_path, letterbox=None, tiler=None):
+    """(cache, namespace) for --cache, or (None, None)"""
+    if not args.cache:
+        return None, None
+    if not weights_path or not Path(weights_path).exists():
+        print("⚠️  Result cache disabled: the model weights file is not available to hash")
+        return None, None
+    
+    cache = ResultCache(args.cache, int(args.cache_size * 1024 * 1024)).open()
+    settings = {
+        'imgsz': args.imgsz,
+        'half': False,
+        'backend': 'service' if isinstance(model, DetectionClient) else args.backend,
+        'fused_preprocess': letterbox is not None,
+        'tiles': (tiler.tile, tiler.overlap, tiler.merge_threshold) if tiler is not None else None,
+    }
+    if isinstance(model, DetectionClient):
+        settings.update(conf=model.info.get('conf'), iou=model.info.get('iou'))
+    elif isinstance(model, OnnxDetector):
+        settings.update(imgsz=model.imgsz if not model.dynamic else args.imgsz,
+                        conf=model.conf, iou=model.iou, top_k=model.top_k, agnostic=model.agnostic)
+    namespace = settings_namespace(cache.file_digest(weights_path), **settings)
+    print(f"♻️  Result cache: {args.cache}")
     print()
+    return cache, namespace
+
+def run_parallel(args):
+    """Process one video file in parallel segments across worker processes"""
+    if not args.source or Path(args.source).suffix.lower() not in VIDEO_EXTENSIONS:
+        print("❌ --workers needs --source pointing at a video file")
+        return
+    if args.service or args.tiles or args.backend != 'torch':
+        print("❌ --workers loads the PyTorch model in each worker "
+              "(not available with --service, --tiles or --backend onnx)")
+        return
+    if not args.output and not args.results:
+        print("❌ --workers needs --output and/or --results to write to")
+        return
+    if not Path(args.source).exists():
+        print(f"❌ File not found: {args.source}")
+        return
+    
+    weights_path = find_weights(args)
+    if not weights_path:
+        return
+    
+    print(f"🎥 Processing video: {args.source} ({args.workers} worker processes, model {weights_path})")
+    results_format = 'binary' if args.results and args.results.endswith('.bin') else 'ndjson'
+    try:
+        run_segments(args.source, weights_path, args.workers, args.output, args.results,
+                     args.threads, args.imgsz, args.batch or 8, args.prefetch,
+                     args.fused_preprocess, results_format)
+    except SegmentError as e:
+        print(f"❌ {e}")
+
+def run_inference_batch(model, source, args, letterbox=None, tiler=None, cache=None, namespace=None):
+    """Run inference on every image in a directory, glob or list and tabulate the detections"""
+    if not args.results:
+        print("❌ Image batches need --results FILE (.csv, .jsonl or .parquet)")
+        return
+    
+    paths = collect_images(source)
+    if not paths:
+        print(f"❌ No images found: {source}")
+        return
+    
+    batch = args.batch or 8
+    print(f"🗂️  Processing {len(paths)} images from {source} "
+          f"(batches of {batch}, {args.decode_workers} decode threads)")
+    
+    # The service and the tiler take one image at a time (tiles are batched already)
+    if isinstance(model, DetectionClient):
+        detect_batch = lambda images: [model.detect(image, args.imgsz) for image in images]
+    elif isinstance(model, OnnxDetector):
+        detect_batch = lambda images: model.detect_batch(images, args.imgsz)
+    elif tiler is not None:
+        detect_batch = lambda images: [tiler(image) for image in images]
+    else:
+        detector = BatchedDetector(model, args.imgsz, batch, fused=letterbox is not None)
+        detect_batch = lambda images: [Detections.from_ultralytics(result)
+                                       for result in detector(images, detector.prepare(images))]
+    
+    try:
+        with DetectionTable(args.results, model.names) as table:
+            stats = run_image_batch(paths, detect_batch, table, batch, args.decode_workers,
+                                    cache=cache, namespace=namespace)
+    except TableError as e:
+        print(f"❌ {e}")
+        return
     
+    print(f"✅ Saved {table.rows} detections from {table.images} images to: {args.results}")
+    if cache is not None:
+        print(f"   {stats['cached']} of {stats['images']} images served from the cache")
+    print(f"   {stats['images']} images in {stats['elapsed_s']:.1f}s "
+          f"({stats['images_per_s']:.1f} images/s, detect {stats['detect_ms']:.1f}ms/image)")
+    if stats['failed']:
+        print(f"⚠️  {len(stats['failed'])} unreadable image(s), e.g. {stats['failed'][0]}")
+
+def run(args, model, letterbox, tiler, tracer, cache=None, namespace=None):
+    """Prompt for (or take) the input and run inference on it"""
     # Get input
-    print("📁 Input Options:")
-    print("   1. Image file (jpg, png, etc.)")
-    print("   2. Video file (mp4, avi, etc.)")
-    print("   3. Webcam (0)")
-    print()
+    if args.source:
+        input_path = args.source
+    else:
+        print("📁 Input Options:")
+        print("   1. Image file (jpg, png, etc.)")
+        print("   2. Video file (mp4, avi, etc.)")
+        print("   3. Webcam (0)")
+        print()
+        
+        input_path = input("Enter path or option (0 for webcam): ").strip()
+        print()
     
-    input_path = input("Enter path or option (0 for webcam): ").strip()
-    print()
+    if is_image_batch(input_path):
+        run_inference_batch(model, input_path, args, letterbox, tiler, cache, namespace)
+        return
     
     # Check if webcam
     if input_path == "0":
         print("📹 Starting webcam inference...")
         print("   Press 'q' to quit")
         print()
-        run_inference_video(model, 0)
+        run_inference_video(model, 0, letterbox=letterbox, imgsz=args.imgsz, tiler=tiler,
+                            tracer=tracer, tiling_report=args.tiling_report)
         return
     
     input_path = Path(input_path)
@@ -194,32 +566,33 @@ def main():
         return
     
     # Check if image or video
-    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
-    video_extensions = ['.mp4', '.avi', '.mov', '.mkv']
-    
-    if input_path.suffix.lower() in image_extensions:
+    if input_path.suffix.lower() in IMAGE_EXTENSIONS:
         # Ask for output
-        save = input("Save annotated image? (y/n): ").lower() == 'y'
-        output_path = None
-        if save:
-            output_path = input_path.parent / f"{input_path.stem}_annotated{input_path.suffix}"
+        output_path = args.output
+        if not args.source:
+            save = input("Save annotated image? (y/n): ").lower() == 'y'
+            if save:
+                output_path = input_path.parent / f"{input_path.stem}_annotated{input_path.suffix}"
         
         print()
-        run_inference_image(model, input_path, output_path)
+        run_inference_image(model, input_path, output_path, letterbox, args.imgsz, tiler, tracer,
+                            cache, namespace, args.tiling_report)
         
-    elif input_path.suffix.lower() in video_extensions:
+    elif input_path.suffix.lower() in VIDEO_EXTENSIONS:
         # Ask for output
-        save = input("Save annotated video? (y/n): ").lower() == 'y'
-        output_path = None
-        if save:
-            output_path = input_path.parent / f"{input_path.stem}_annotated.mp4"
+        output_path = args.output
+        if not args.source:
+            save = input("Save annotated video? (y/n): ").lower() == 'y'
+            if save:
+                output_path = input_path.parent / f"{input_path.stem}_annotated.mp4"
         
         print()
-        run_inference_video(model, input_path, output_path)
+        run_inference_video(model, input_path, output_path, letterbox, args.imgsz, tiler, tracer,
+                            args.batch, args.prefetch, args.tiling_report)
         
     else:
         print(f"❌ Unsupported file format: {input_path.suffix}")
-        print(f"   Supported: {', '.join(image_extensions + video_extensions)}")
+        print(f"   Supported: {', '.join(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,158 @@
+"""
+Per-stage latency instrumentation
+Monotonic-clock timings for each pipeline stage, with rolling percentiles
+for live display and whole-run histograms for the exit summary
+"""
+import json
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Whole-run histogram: log-spaced buckets from 10 us to 100 s, 40 per
+# decade, so summary percentiles are accurate to ~6% at any run length
+_MIN_MS = 0.01
+_BUCKETS_PER_DECADE = 40
+_BUCKET_COUNT = 7 * _BUCKETS_PER_DECADE + 1
+
+PERCENTILES = (50, 95, 99)
+
+def _bucket_edge(index):
+    """Upper edge (ms) of a histogram bucket"""
+    return _MIN_MS * 10 ** ((index + 1) / _BUCKETS_PER_DECADE)
+
+class LatencyStats:
+    """Latencies (ms) of one stage: a rolling window plus a run histogram"""
+
+    def __init__(self, window=1000):
+        self._recent = deque(maxlen=window)
+        self._histogram = np.zeros(_BUCKET_COUNT, dtype=np.int64)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        if ms > _MIN_MS:
+            bucket = min(int(math.log10(ms / _MIN_MS) * _BUCKETS_PER_DECADE), _BUCKET_COUNT - 1)
+        else:
+            bucket = 0
+        with self._lock:
+            self._recent.append(ms)
+            self._histogram[bucket] += 1
+            self.count += 1
+            self.total += ms
+            if ms > self.max:
+                self.max = ms
+
+    def recent(self, percentiles=PERCENTILES):
+        """Percentiles over the rolling window (zeros if empty)"""
+        with self._lock:
+            values = np.array(self._recent)
+        if len(values) == 0:
+            return [0.0] * len(percentiles)
+        return np.percentile(values, percentiles).tolist()
+
+    def overall(self, percentiles=PERCENTILES):
+        """Percentiles over the whole run, from the histogram"""
+        with self._lock:
+            cumulative = np.cumsum(self._histogram)
+        if cumulative[-1] == 0:
+            return [0.0] * len(percentiles)
+        ranks = np.ceil(np.array(percentiles) / 100 * cumulative[-1])
+        indices = np.searchsorted(cumulative, ranks)
+        return [float(min(_bucket_edge(i), self.max)) for i in indices]
+
+    def summary(self):
+        p50, p95, p99 = self.overall()
+        return {
+            'count': self.count,
+            'mean_ms': float(self.total / self.count) if self.count else 0.0,
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'max_ms': float(self.max),
+        }
+
+class _Span:
+    __slots__ = ('instr', 'name', 'frame', 'start')
+
+    def __init__(self, instr, name, frame):
+        self.instr = instr
+        self.name = name
+        self.frame = frame
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instr.since(self.name, self.start, self.frame)
+        return False
+
+class Instrumentation:
+    """Named latency stages, fed from any pipeline thread
+
+    Time a block with `with instr.span('inference'):`, or record a
+    measured value with record() / since(). Stages listed up front keep
+    their order in the HUD and console; others are added on first use.
+    With an enabled tracing.Tracer attached, span() and since() also put
+    the span on the timeline; `overlapping` names stages whose spans
+    overlap on one thread (such as pipelined end-to-end latency).
+    """
+
+    def __init__(self, stages=(), window=1000, tracer=None, overlapping=()):
+        self.window = window
+        self.tracer = tracer if tracer is not None and tracer.enabled else None
+        self.overlapping = frozenset(overlapping)
+        self._stages = {name: LatencyStats(window) for name in stages}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def stage(self, name):
+        stats = self._stages.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stages.setdefault(name, LatencyStats(self.window))
+        return stats
+
+    def span(self, name, frame=None):
+        return _Span(self, name, frame)
+
+    def record(self, name, ms):
+        """Record a latency that is not a single span (stats only, not traced)"""
+        self.stage(name).add(ms)
+
+    def since(self, name, start, frame=None):
+        """Record the time elapsed since a time.perf_counter() value"""
+        end = time.perf_counter()
+        self.stage(name).add((end - start) * 1000)
+        if self.tracer is not None:
+            self.tracer.add(name, start, end, frame, name in self.overlapping)
+
+    @property
+    def names(self):
+        return list(self._stages)
+
+    def recent(self):
+        """{stage: [p50, p95, p99]} over each rolling window, for live display"""
+        return {name: stats.recent() for name, stats in self._stages.items() if stats.count}
+
+    def summary(self):
+        """Whole-run statistics per stage"""
+        return {name: stats.summary() for name, stats in self._stages.items() if stats.count}
+
+    def dump(self, path, **extra):
+        """Write the run summary (plus any extra fields) as JSON"""
+        data = dict(extra, started=self.started, duration_s=time.time() - self.started,
+                    stages=self.summary())
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return data
+
+def format_latency_stats(instr):
+    """One-line p50/p95/p99 summary of every stage for console output"""
+    return " | ".join(f"{name} {p50:.1f}/{p95:.1f}/{p99:.1f}"
+                      for name, (p50, p95, p99) in instr.recent().items())
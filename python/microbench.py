@@ -0,0 +1,451 @@
+"""
+Micro-benchmarks for the real-time detection hot path
+Model-free timings of individual stages, runnable on any machine
+
+Usage:
+    python microbench.py capture --source synthetic:2560x1440 --frames 300
+    python microbench.py preprocess --size 2560x1440 --imgsz 640
+    python microbench.py postprocess --size 2560x1440 --counts 0,1,5,10,20,50
+    python microbench.py nms --counts 100,1000,5000,10000 --top-k 1000    # exits 1 on a parity mismatch
+    python microbench.py tracing --spans 2000000 --per-frame 12
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from detections import Detections
+from frame_pool import FramePool, as_bgr, format_pool_stats
+from frame_sources import open_source, parse_resolution
+from overlay import OverlayRenderer
+from instrumentation import Instrumentation
+from postprocess import MAX_WH, match_detections, nms, postprocess
+from preprocess import Letterbox
+from tracing import NULL_TRACER, Tracer
+
+def measure_frames(step, frames):
+    """Run step() `frames` times; return per-frame times (ms) and transient MB"""
+    times = []
+    transient = []
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        step()
+        times.append((time.perf_counter() - start) * 1000)
+        _, peak = tracemalloc.get_traced_memory()
+        transient.append((peak - base) / (1024 * 1024))
+    return np.array(times), np.array(transient)
+
+def print_row(name, times, transient):
+    print(f"   {name:<10} {np.mean(times):>8.2f}ms  p95 {np.percentile(times, 95):>7.2f}ms  "
+          f"peak alloc/frame {np.mean(transient):>7.2f} MB")
+
+def bench_capture(args):
+    """Compare the allocating capture path with the pooled BGRA path"""
+    print("=" * 70)
+    print("Capture path: allocate-per-frame vs preallocated pool")
+    print("=" * 70)
+
+    source = open_source(args.source)
+    source.open()
+    print(f"📸 Source: {source.describe()} ({source.width}x{source.height}, {source.channels} ch)")
+    print(f"   Frames: {args.frames} (+{args.warmup} warmup)")
+    print()
+
+    pool = FramePool(count=args.pool_size, name="frames")
+    bgr_buffer = None
+
+    def legacy_step():
+        # Old demo path: fresh BGR array every frame
+        source.read()
+
+    def pooled_step():
+        nonlocal bgr_buffer
+        frame = source.read_into(pool)
+        bgr = as_bgr(frame, bgr_buffer)
+        if bgr is not frame:
+            bgr_buffer = bgr
+        pool.release(frame)
+
+    tracemalloc.start()
+    try:
+        for _ in range(args.warmup):
+            legacy_step()
+            pooled_step()
+        warm_allocations = pool.allocations
+
+        legacy = measure_frames(legacy_step, args.frames)
+        pooled = measure_frames(pooled_step, args.frames)
+    finally:
+        tracemalloc.stop()
+        source.close()
+
+    print_row("allocate", *legacy)
+    print_row("pooled", *pooled)
+    print()
+    print(f"📊 Pool: {format_pool_stats(pool)}")
+    print(f"   Allocations after warmup: {pool.allocations - warm_allocations}")
+    print()
+
+def legacy_preprocess(frame, imgsz):
+    """Old path: BGRA->BGR copy, then Ultralytics-style LetterBox + preprocess"""
+    bgr = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    height, width = bgr.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.resize(bgr, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right,
+                               cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    image = np.stack([image])[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(image).astype(np.float32) / 255.0
+
+def bench_preprocess(args):
+    """Compare the two-pass BGR + letterbox path with the fused Letterbox"""
+    print("=" * 70)
+    print("Preprocess: BGRA capture -> letterboxed model input")
+    print("=" * 70)
+
+    width, height, _ = parse_resolution(args.size)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    letterbox = Letterbox(args.imgsz)
+    print(f"📐 Frame: {width}x{height} BGRA -> {args.imgsz}x{args.imgsz}")
+    print(f"   Frames: {args.frames} (+{args.warmup} warmup)")
+    print()
+
+    tracemalloc.start()
+    try:
+        for _ in range(args.warmup):
+            legacy_preprocess(frame, args.imgsz)
+            letterbox(frame)
+        legacy = measure_frames(lambda: legacy_preprocess(frame, args.imgsz), args.frames)
+        fused = measure_frames(lambda: letterbox(frame), args.frames)
+    finally:
+        tracemalloc.stop()
+
+    print_row("two-pass", *legacy)
+    print_row("fused", *fused)
+    print()
+    tensor, _ = letterbox(frame)
+    max_diff = np.abs(tensor - legacy_preprocess(frame, args.imgsz)).max()
+    print(f"📊 Speedup: {np.mean(legacy[0]) / np.mean(fused[0]):.1f}x")
+    print(f"   Max abs difference vs two-pass: {max_diff:.2e}")
+    print()
+
+DEMO_NAMES = {0: 'CT', 1: 'CT_head', 2: 'T', 3: 'T_head'}
+DEMO_COLORS = {
+    'CT': (255, 255, 0),
+    'CT_head': (0, 0, 255),
+    'T': (0, 255, 255),
+    'T_head': (0, 128, 255),
+}
+
+def random_box_data(count, width, height, rng):
+    """(N, 6) [xyxy, conf, cls] rows shaped like YOLO output"""
+    size = rng.uniform(20, 200, (count, 2))
+    top_left = rng.uniform(0, 1, (count, 2)) * ([width, height] - size)
+    data = np.empty((count, 6), dtype=np.float32)
+    data[:, :2] = top_left
+    data[:, 2:4] = top_left + size
+    data[:, 4] = rng.uniform(0.4, 1.0, count)
+    data[:, 5] = rng.integers(0, len(DEMO_NAMES), count)
+    return data
+
+def to_numpy(value):
+    """Tensor -> NumPy (one device sync per call on CUDA); arrays pass through"""
+    return value.cpu().numpy() if hasattr(value, 'cpu') else np.asarray(value)
+
+def legacy_postprocess(frame, boxes_data, labels=True):
+    """Old demo path: per-box tensor reads, then one draw call per primitive"""
+    for box in boxes_data:
+        x1, y1, x2, y2 = to_numpy(box[:4]).astype(int)
+        conf = float(to_numpy(box[4]))
+        class_name = DEMO_NAMES[int(to_numpy(box[5]))]
+        color = DEMO_COLORS.get(class_name, (0, 255, 0))
+        thickness = 3 if 'head' in class_name.lower() else 2
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
+        if labels:
+            cv2.putText(frame, f"{class_name} {conf:.2f}", (x1 + 5, y1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        cv2.circle(frame, ((x1 + x2) // 2, (y1 + y2) // 2), 4, color, -1)
+
+def bench_postprocess(args):
+    """Per-frame result extraction + drawing cost against detection count"""
+    print("=" * 70)
+    print("Postprocess: result extraction + overlay vs detection count")
+    print("=" * 70)
+
+    try:
+        import torch
+    except ImportError:
+        torch = None
+
+    width, height, _ = parse_resolution(args.size)
+    frame = np.zeros((height, width, 4), dtype=np.uint8)
+    renderer = OverlayRenderer(DEMO_NAMES, DEMO_COLORS)
+    rng = np.random.default_rng(0)
+    print(f"📐 Frame: {width}x{height} BGRA, labels {'on' if args.labels else 'off'}")
+    if torch is None:
+        print("⚠️  torch not installed: results are NumPy rows, so no device syncs are measured")
+    print(f"   Frames: {args.frames} per count")
+    print()
+    print(f"   {'count':>5} {'per-box':>10} {'bulk':>10} {'speedup':>8}")
+
+    for count in [int(c) for c in args.counts.split(',')]:
+        data = random_box_data(count, width, height, rng)
+        if torch is not None:
+            data = torch.from_numpy(data).to(args.device)
+
+        def legacy_step():
+            legacy_postprocess(frame, data, args.labels)
+
+        def bulk_step():
+            detections = Detections.from_data(to_numpy(data))
+            renderer.draw(frame, detections, show_labels=args.labels)
+
+        for _ in range(args.warmup):
+            legacy_step()
+            bulk_step()
+        legacy, _ = measure_frames(legacy_step, args.frames)
+        bulk, _ = measure_frames(bulk_step, args.frames)
+        speedup = np.mean(legacy) / np.mean(bulk)
+        print(f"   {count:>5} {np.mean(legacy):>8.3f}ms {np.mean(bulk):>8.3f}ms {speedup:>7.1f}x")
+    print()
+
+def crowded_candidates(count, rng, imgsz=640, per_object=20):
+    """(xyxy, conf, cls) pre-NMS candidates: clusters of jittered boxes per player / head"""
+    objects = max(1, count // per_object)
+    centers = rng.uniform(0, imgsz, (objects, 2))
+    sizes = rng.uniform(10, 160, (objects, 2))
+    classes = rng.integers(0, len(DEMO_NAMES), objects)
+    owner = rng.integers(0, objects, count)
+    center = centers[owner] + rng.normal(0, 4, (count, 2))
+    size = sizes[owner] * rng.uniform(0.85, 1.15, (count, 2))
+    xyxy = np.concatenate([center - size / 2, center + size / 2], axis=1).astype(np.float32)
+    return xyxy, rng.uniform(0.25, 1.0, count).astype(np.float32), classes[owner].astype(np.int64)
+
+def raw_output(count, rng, anchors=8400, imgsz=640):
+    """(4 + classes, anchors) raw YOLO output with `count` anchors above conf 0.25"""
+    xyxy, conf, cls = crowded_candidates(count, rng, imgsz)
+    pred = np.zeros((4 + len(DEMO_NAMES), anchors), dtype=np.float32)
+    pred[4:] = rng.uniform(0, 0.2, pred[4:].shape)
+    slots = rng.choice(anchors, count, replace=False)
+    pred[:2, slots] = ((xyxy[:, :2] + xyxy[:, 2:]) / 2).T
+    pred[2:4, slots] = (xyxy[:, 2:] - xyxy[:, :2]).T
+    pred[:2, pred[2] == 0] = rng.uniform(0, imgsz, (2, anchors - count))
+    pred[2:4, pred[2] == 0] = rng.uniform(10, 160, (2, anchors - count))
+    pred[4 + cls, slots] = conf
+    return pred
+
+def legacy_nms(xyxy, conf, cls, iou_threshold=0.7):
+    """Old ONNX backend path: one full pass over the remaining candidates per kept box"""
+    boxes = xyxy + (cls[:, None] * MAX_WH).astype(xyxy.dtype)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = conf.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        width = np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0])
+        height = np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1])
+        inter = width.clip(0) * height.clip(0)
+        order = rest[inter / (areas[i] + areas[rest] - inter + 1e-9) <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+def ultralytics_nms():
+    """Ultralytics' non_max_suppression (its module moved between versions), or None"""
+    try:
+        from ultralytics.utils.nms import non_max_suppression
+    except ImportError:
+        try:
+            from ultralytics.utils.ops import non_max_suppression
+        except ImportError:
+            return None
+    return non_max_suppression
+
+def time_calls(fn, runs):
+    """Mean milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) * 1000 / runs
+
+def bench_nms(args):
+    """NumPy NMS speed against candidate count, and parity with torchvision / Ultralytics"""
+    print("=" * 70)
+    print("NMS: vectorized NumPy vs per-box loop vs torchvision")
+    print("=" * 70)
+
+    try:
+        import torch
+        import torchvision
+    except ImportError:
+        torch = torchvision = None
+
+    rng = np.random.default_rng(0)
+    print(f"📐 Crowded candidates (~20 per object, {len(DEMO_NAMES)} classes), IoU {args.iou}, "
+          f"top-k {args.top_k}")
+    if torchvision is None:
+        print("⚠️  torchvision not installed: parity is checked against the per-box loop")
+    print(f"   Runs: {args.runs} per count")
+    print()
+    print(f"   {'count':>6} {'loop':>9} {'numpy':>9} {'top-k':>9} {'agnostic':>9} "
+          f"{'torchvision':>11} {'kept':>5}  parity")
+
+    mismatches = 0
+    for count in [int(c) for c in args.counts.split(',')]:
+        xyxy, conf, cls = crowded_candidates(count, rng)
+        keep = nms(xyxy, conf, cls, args.iou, max_det=None)
+        loop_ms = time_calls(lambda: legacy_nms(xyxy, conf, cls, args.iou), args.runs)
+        numpy_ms = time_calls(lambda: nms(xyxy, conf, cls, args.iou, max_det=None), args.runs)
+        top = np.argsort(-conf, kind='stable')[:args.top_k]
+        top_k_ms = time_calls(lambda: nms(xyxy[top], conf[top], cls[top], args.iou, max_det=None),
+                              args.runs)
+        agnostic_ms = time_calls(lambda: nms(xyxy, conf, cls, args.iou, max_det=None,
+                                             agnostic=True), args.runs)
+        if torchvision is not None:
+            tensors = (torch.from_numpy(xyxy), torch.from_numpy(conf), torch.from_numpy(cls))
+            reference = torchvision.ops.batched_nms(*tensors, args.iou).numpy()
+            torch_ms = f"{time_calls(lambda: torchvision.ops.batched_nms(*tensors, args.iou), args.runs):>9.2f}ms"
+            agnostic_ref = torchvision.ops.nms(tensors[0], tensors[1], args.iou).numpy()
+        else:
+            reference = legacy_nms(xyxy, conf, cls, args.iou)
+            torch_ms = f"{'-':>11}"
+            agnostic_ref = legacy_nms(xyxy, conf, np.zeros_like(cls), args.iou)
+        same = (set(keep.tolist()) == set(reference.tolist())
+                and set(nms(xyxy, conf, cls, args.iou, None, agnostic=True).tolist())
+                == set(agnostic_ref.tolist()))
+        mismatches += not same
+        print(f"   {count:>6} {loop_ms:>7.2f}ms {numpy_ms:>7.2f}ms {top_k_ms:>7.2f}ms "
+              f"{agnostic_ms:>7.2f}ms {torch_ms} {len(keep):>5}  {'✅' if same else '❌'}")
+    print()
+
+    non_max_suppression = ultralytics_nms() if torch is not None else None
+    if non_max_suppression is None:
+        print("⚠️  Ultralytics not installed: raw-output parity skipped")
+    else:
+        # Full decode + NMS on the exported output layout against Ultralytics
+        matched = total = 0
+        for count in [int(c) for c in args.counts.split(',')]:
+            pred = raw_output(min(count, 8000), rng)
+            ours = postprocess(pred, 0.25, args.iou)
+            data = non_max_suppression(torch.from_numpy(pred[None]), 0.25, args.iou)[0].numpy()
+            theirs = Detections.from_data(data)
+            matched += min(match_detections(ours, theirs), match_detections(theirs, ours))
+            total += max(len(ours), len(theirs))
+        print(f"📊 Decode + NMS vs Ultralytics non_max_suppression: {matched}/{total} boxes match")
+        mismatches += matched != total
+    print(f"   Parity: {'✅ all counts match' if not mismatches else f'❌ {mismatches} mismatch(es)'}")
+    print()
+    # Non-zero exit status, so a parity regression fails a script / CI step
+    return 1 if mismatches else 0
+
+def bench_tracing(args):
+    """Cost of one timed span with and without the timeline tracer"""
+    print("=" * 70)
+    print("Tracing: per-span overhead")
+    print("=" * 70)
+    tracer = Tracer(args.buffer)
+    variants = [
+        ('bare', None),
+        ('null tracer', NULL_TRACER.span),
+        ('tracer', tracer.span),
+        ('instr', Instrumentation(['stage']).span),
+        ('instr+trace', Instrumentation(['stage'], tracer=tracer).span),
+    ]
+    print(f"   Spans: {args.spans}, ring {args.buffer} events")
+    print(f"   Per-frame cost assumes {args.per_frame} spans against a 16.7ms (60 FPS) budget")
+    print()
+    baseline = None
+    for name, span in variants:
+        start = time.perf_counter()
+        if span is None:
+            for i in range(args.spans):
+                pass
+        else:
+            for i in range(args.spans):
+                with span('stage', i):
+                    pass
+        ns = (time.perf_counter() - start) / args.spans * 1e9
+        if baseline is None:
+            baseline = ns
+            print(f"   {name:<12} {ns:>8.0f}ns (loop)")
+            continue
+        per_frame = (ns - baseline) * args.per_frame / 1000
+        print(f"   {name:<12} {ns - baseline:>8.0f}ns/span  {per_frame:>6.1f}us/frame "
+              f"({per_frame / 16_700:.3%} of frame)")
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        events = tracer.export(path)
+        export_ms = (time.perf_counter() - start) * 1000
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+    finally:
+        os.remove(path)
+    print()
+    print(f"   Export: {events} events in {export_ms:.0f}ms ({size_mb:.1f} MB)")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description="Model-free micro-benchmarks")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    capture = sub.add_parser('capture', help="frame capture / buffer allocation")
+    capture.add_argument('--source', default='synthetic:2560x1440')
+    capture.add_argument('--frames', type=int, default=200)
+    capture.add_argument('--warmup', type=int, default=10)
+    capture.add_argument('--pool-size', type=int, default=4)
+    capture.set_defaults(func=bench_capture)
+
+    preprocess = sub.add_parser('preprocess', help="fused BGRA -> letterbox tensor")
+    preprocess.add_argument('--size', default='2560x1440')
+    preprocess.add_argument('--imgsz', type=int, default=640)
+    preprocess.add_argument('--frames', type=int, default=200)
+    preprocess.add_argument('--warmup', type=int, default=10)
+    preprocess.set_defaults(func=bench_preprocess)
+
+    postprocess = sub.add_parser('postprocess', help="result extraction + overlay drawing")
+    postprocess.add_argument('--size', default='2560x1440')
+    postprocess.add_argument('--counts', default='0,1,5,10,20,50',
+                             help="comma-separated detection counts")
+    postprocess.add_argument('--frames', type=int, default=200)
+    postprocess.add_argument('--warmup', type=int, default=10)
+    postprocess.add_argument('--no-labels', dest='labels', action='store_false',
+                             help="time boxes and centre dots only")
+    postprocess.add_argument('--device', default='cpu',
+                             help="torch device holding the fake results (e.g. cuda)")
+    postprocess.set_defaults(func=bench_postprocess)
+
+    nms_parser = sub.add_parser('nms', help="NumPy NMS vs candidate count, parity checks")
+    nms_parser.add_argument('--counts', default='100,500,1000,2000,5000,10000',
+                            help="comma-separated pre-NMS candidate counts")
+    nms_parser.add_argument('--iou', type=float, default=0.7)
+    nms_parser.add_argument('--top-k', type=int, default=1000,
+                            help="pre-NMS cap timed in the top-k column")
+    nms_parser.add_argument('--runs', type=int, default=20)
+    nms_parser.set_defaults(func=bench_nms)
+
+    tracing = sub.add_parser('tracing', help="span timing / trace ring overhead")
+    tracing.add_argument('--spans', type=int, default=1_000_000)
+    tracing.add_argument('--buffer', type=int, default=200_000, help="ring size in events")
+    tracing.add_argument('--per-frame', type=int, default=12,
+                         help="spans recorded per frame, for the per-frame estimate")
+    tracing.set_defaults(func=bench_tracing)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
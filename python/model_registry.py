@@ -0,0 +1,349 @@
+"""
+Model registry
+An indexed manifest of every trained and exported model artifact (weights
+hash, size, format, validation metrics and measured latency per backend,
+image size and machine), so entry points resolve "the model to use" with
+a lookup instead of a directory scan and a guess
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import time
+from pathlib import Path
+
+import yaml
+
+MANIFEST_NAME = 'models.json'
+MANIFEST_VERSION = 1
+
+# Artifact suffix (or directory name ending) -> export format
+FORMATS = {
+    '.pt': 'pt',
+    '.onnx': 'onnx',
+    '.engine': 'engine',
+    '.torchscript': 'torchscript',
+    '.tflite': 'tflite',
+    '.mlpackage': 'coreml',
+    '.mlmodel': 'coreml',
+    '_openvino_model': 'openvino',
+    '_saved_model': 'saved_model',
+}
+
+class RegistryError(Exception):
+    """Raised when no registered model matches a request"""
+
+def load_config():
+    """Load configuration from config.yaml"""
+    with open('config.yaml', 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def natural_key(text):
+    """Sort key that orders embedded numbers numerically (train2 < train10)"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', str(text))]
+
+def artifact_format(path):
+    """Export format of a model file or directory, or None if it is not one"""
+    path = Path(path)
+    for ending, fmt in FORMATS.items():
+        if path.name.endswith(ending):
+            return fmt
+    return None
+
+def artifact_variant(path):
+    """Tag after 'best_' (best_int8.onnx -> 'int8'), or None for a plain artifact"""
+    name = Path(path).name
+    for ending in FORMATS:
+        if name.endswith(ending):
+            stem = name[:-len(ending)]
+            return stem.split('_', 1)[1] if '_' in stem else None
+    return None
+
+def hash_artifact(path):
+    """Content hash of a model file (or every file of an exported directory)"""
+    path = Path(path)
+    h = hashlib.blake2b(digest_size=20)
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+    for file in files:
+        if path.is_dir():
+            h.update(file.relative_to(path).as_posix().encode())
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _stat(path):
+    path = Path(path)
+    if path.is_dir():
+        files = [p.stat() for p in path.rglob('*') if p.is_file()]
+        return sum(s.st_size for s in files), max((s.st_mtime_ns for s in files), default=0)
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+class ModelRegistry:
+    """Manifest of model artifacts under the runs directory
+
+    scan() indexes every `best.*` artifact found in a `weights` folder
+    below `root` (runs/train/weights, runs/detect/train7/weights, ...),
+    hashing only files whose size or mtime changed. Records are keyed by
+    path and carry the run name, format, hash, size, the .pt an export
+    came from, validation metrics and benchmark results; validate.py,
+    benchmark.py and export_model.py add those as they run. The manifest
+    is plain JSON at <root>/models.json.
+    """
+
+    def __init__(self, root='runs', manifest=None):
+        self.root = Path(root)
+        self.manifest = Path(manifest) if manifest else self.root / MANIFEST_NAME
+        self.models = {}
+        self.loaded = False
+
+    @classmethod
+    def from_config(cls):
+        """Registry for config.yaml's runs directory (./runs if there is no config)"""
+        try:
+            root = load_config()['paths']['runs']
+        except (OSError, KeyError, TypeError):
+            root = 'runs'
+        return cls(root)
+
+    # Manifest I/O
+
+    def load(self):
+        if self.manifest.exists():
+            try:
+                data = json.loads(self.manifest.read_text(encoding='utf-8'))
+            except ValueError:
+                data = {}
+            if data.get('version') == MANIFEST_VERSION:
+                self.models = data.get('models', {})
+        self.loaded = True
+        return self
+
+    def save(self):
+        self.manifest.parent.mkdir(parents=True, exist_ok=True)
+        data = {'version': MANIFEST_VERSION, 'updated': time.time(), 'models': self.models}
+        # Write-then-rename so a crash never leaves a truncated manifest
+        tmp = self.manifest.with_name(self.manifest.name + '.tmp')
+        tmp.write_text(json.dumps(data, indent=2, sort_keys=True), encoding='utf-8')
+        os.replace(tmp, self.manifest)
+
+    def _key(self, path):
+        return Path(path).resolve().as_posix()
+
+    # Indexing
+
+    def register(self, path, source=None):
+        """Add or refresh one artifact; returns its record"""
+        if not self.loaded:
+            self.load()
+        path = Path(path)
+        fmt = artifact_format(path)
+        if fmt is None:
+            raise RegistryError(f"Not a model artifact: {path}")
+        size, mtime_ns = _stat(path)
+        key = self._key(path)
+        record = self.models.get(key)
+        if record is None or (record['size'], record['mtime_ns']) != (size, mtime_ns):
+            # New, or retrained / re-exported in place: old measurements no longer apply
+            record = {'path': str(path), 'format': fmt, 'size': size, 'mtime_ns': mtime_ns,
+                      'hash': hash_artifact(path), 'registered': time.time(),
+                      'metrics': None, 'benchmarks': []}
+        weights_dir = path.parent
+        run_dir = weights_dir.parent if weights_dir.name == 'weights' else weights_dir
+        try:
+            record['run'] = run_dir.relative_to(self.root).as_posix()
+        except ValueError:
+            record['run'] = run_dir.as_posix()
+        record['variant'] = artifact_variant(path)
+        if source is not None:
+            record['source'] = self._key(source)
+        elif fmt != 'pt' and (weights_dir / 'best.pt').exists():
+            record.setdefault('source', self._key(weights_dir / 'best.pt'))
+        self.models[key] = record
+        return record
+
+    def scan(self):
+        """Index every best.* artifact under the runs directory and drop vanished ones"""
+        if not self.loaded:
+            self.load()
+        found = set()
+        if self.root.exists():
+            for weights_dir in self.root.rglob('weights'):
+                if not weights_dir.is_dir():
+                    continue
+                for path in sorted(weights_dir.iterdir()):
+                    if path.name.startswith('best') and artifact_format(path) is not None:
+                        self.register(path)
+                        found.add(self._key(path))
+        for key in list(self.models):
+            record = self.models[key]
+            if key not in found and not Path(record['path']).exists():
+                del self.models[key]
+        self.save()
+        return self
+
+    # Recording results
+
+    def _record(self, path):
+        key = self._key(path)
+        if key not in self.models:
+            self.register(path)
+        return self.models[key]
+
+    def record_metrics(self, path, metrics):
+        """Attach validation metrics (map50, map, precision, recall, ...)"""
+        record = self._record(path)
+        record['metrics'] = dict(metrics, measured=time.time())
+        self.save()
+
+    def record_benchmark(self, path, backend, imgsz, latency_ms, device='cpu', **extra):
+        """Attach one latency measurement; replaces an older one for the same setup"""
+        record = self._record(path)
+        entry = dict(extra, backend=backend, imgsz=imgsz, device=device, host=platform.node(),
+                     latency_ms=float(latency_ms), fps=1000.0 / latency_ms if latency_ms else 0.0,
+                     measured=time.time())
+        setup = (backend, imgsz, device, entry['host'])
+        record['benchmarks'] = [b for b in record['benchmarks']
+                                if (b['backend'], b['imgsz'], b['device'], b['host']) != setup]
+        record['benchmarks'].append(entry)
+        self.save()
+
+    # Lookup
+
+    def get(self, path):
+        return self.models.get(self._key(path))
+
+    def metrics_of(self, record):
+        """Record's own metrics, else those of the .pt it was exported from
+
+        Variants such as a quantized best_int8.onnx change accuracy, so
+        they only count with metrics of their own.
+        """
+        if record.get('metrics') or record.get('variant'):
+            return record.get('metrics')
+        source = self.models.get(record.get('source'))
+        return source.get('metrics') if source else None
+
+    def artifacts(self, fmt=None):
+        """Records in run order (oldest first), optionally of one format"""
+        formats = [fmt] if isinstance(fmt, str) else fmt
+        records = [r for r in self.models.values()
+                   if formats is None or r['format'] in formats]
+        # By run folder name (train, train2, ..., train10), wherever the project dir is
+        return sorted(records, key=lambda r: (natural_key(Path(r['run']).name), r['mtime_ns']))
+
+    def latest(self, fmt='pt'):
+        """Most recent run's artifact (natural order, so train10 follows train9)
+
+        Within a run the plain export wins over variants (best.onnx over
+        best_int8.onnx); those are picked explicitly or by select().
+        """
+        records = [r for r in self.artifacts(fmt) if Path(r['path']).exists()]
+        if not records:
+            return None
+        run = [r for r in records if r['run'] == records[-1]['run']]
+        plain = [r for r in run if not r.get('variant')]
+        return (plain or run)[-1]
+
+    def select(self, fmt=None, min_map50=None, backend=None, imgsz=None, device=None,
+               objective='fastest', host=None):
+        """Pick a model: 'fastest' measured on this host, 'accurate' or 'latest'
+
+        Candidates must meet min_map50 (validation mAP50, inherited from
+        the source .pt for plain exports) and, for 'fastest', have a
+        benchmark on this host matching backend / imgsz / device if given.
+        Raises RegistryError when nothing qualifies.
+        """
+        host = host or platform.node()
+        candidates = [r for r in self.artifacts(fmt) if Path(r['path']).exists()]
+        if min_map50 is not None:
+            candidates = [r for r in candidates
+                          if (self.metrics_of(r) or {}).get('map50', -1) >= min_map50]
+        if not candidates:
+            raise RegistryError("No registered model meets the requirements"
+                                + (f" (mAP50 >= {min_map50})" if min_map50 is not None else ""))
+        if objective == 'latest':
+            return candidates[-1]
+        if objective == 'accurate':
+            return max(candidates, key=lambda r: (self.metrics_of(r) or {}).get('map50', -1))
+        if objective != 'fastest':
+            raise ValueError(f"Unknown objective: {objective}")
+
+        def matches(bench):
+            return (bench['host'] == host
+                    and (backend is None or bench['backend'] == backend)
+                    and (imgsz is None or bench['imgsz'] == imgsz)
+                    and (device is None or bench['device'] == device))
+
+        timed = [(min(b['latency_ms'] for b in r['benchmarks'] if matches(b)), r)
+                 for r in candidates if any(matches(b) for b in r['benchmarks'])]
+        if not timed:
+            raise RegistryError(f"No benchmark on {host} for the matching models; "
+                                f"run benchmark.py first")
+        return min(timed, key=lambda item: item[0])[1]
+
+def resolve_weights(spec=None, fmt='pt', min_map50=None, registry=None):
+    """Path of the model to use: an explicit path, 'latest', 'fastest' or 'accurate'
+
+    The default (None / 'latest') is the newest run's best.pt, which is what
+    the per-script find_best_weights() copies used to pick, minus their
+    lexicographic train10-before-train2 bug. Returns None when nothing
+    matches; RegistryError explains why for 'fastest' / 'accurate'.
+    """
+    if spec and spec not in ('latest', 'fastest', 'accurate'):
+        return str(spec) if Path(spec).exists() else None
+    registry = registry or ModelRegistry.from_config().scan()
+    if spec in ('fastest', 'accurate') or min_map50 is not None:
+        return registry.select(fmt, min_map50, objective=spec or 'latest')['path']
+    record = registry.latest(fmt)
+    return record['path'] if record else None
+
+def format_model_record(record, registry=None):
+    """One-line summary of a registered artifact"""
+    metrics = registry.metrics_of(record) if registry else record.get('metrics')
+    score = f"mAP50 {metrics['map50']:.3f}" if metrics else "not validated"
+    fastest = min(record['benchmarks'], key=lambda b: b['latency_ms'], default=None)
+    speed = (f"{fastest['latency_ms']:.1f}ms ({fastest['backend']}, {fastest['imgsz']}, "
+             f"{fastest['device']})" if fastest else "not benchmarked")
+    kind = record['format'] + (f"/{record['variant']}" if record.get('variant') else '')
+    return (f"{record['run']:<16} {kind:<17} {record['size'] / (1024 * 1024):7.1f} MB  "
+            f"{record['hash'][:10]}  {score:<15} {speed}")
+
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Index and query trained / exported models")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('list', help="scan the runs directory and list every artifact")
+    select = sub.add_parser('select', help="print the path of the model that fits")
+    select.add_argument('--objective', choices=['fastest', 'accurate', 'latest'], default='fastest')
+    select.add_argument('--min-map50', type=float)
+    select.add_argument('--format', dest='fmt', help="e.g. pt, onnx, engine")
+    select.add_argument('--backend', help="benchmark backend, e.g. torch or onnx")
+    select.add_argument('--imgsz', type=int)
+    select.add_argument('--device')
+    return parser.parse_args()
+
+def main():
+    """List the registry or select a model from it"""
+    args = parse_args()
+    registry = ModelRegistry.from_config().scan()
+    if args.command == 'select':
+        try:
+            record = registry.select(args.fmt, args.min_map50, args.backend, args.imgsz,
+                                     args.device, args.objective)
+        except RegistryError as e:
+            print(f"❌ {e}")
+            return 1
+        print(record['path'])
+        return 0
+
+    print(f"📚 {len(registry.models)} artifacts in {registry.manifest}")
+    for record in registry.artifacts():
+        print(f"   {format_model_record(record, registry)}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+"""
+ONNX Runtime inference backend
+Runs the best.onnx written by export_model.py on the CPU through ONNX
+Runtime, with letterboxing, box decoding and NMS in NumPy, so a deployment
+box never imports torch or ultralytics
+
+Usage:
+    python inference.py --backend onnx --source match.mp4 --threads 4
+    python onnx_backend.py onnx runs/detect/train/weights/best.onnx    # one cold-start probe
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from detections import Detections
+from postprocess import MAX_NMS, postprocess
+from preprocess import Letterbox, scale_boxes
+
+BACKENDS = ('torch', 'onnx')
+
+class BackendError(Exception):
+    """Raised when an inference backend cannot be loaded"""
+
+def parse_names(value, count=None):
+    """Class names from Ultralytics' export metadata ("{0: 'CT', ...}")"""
+    if value:
+        try:
+            return {int(k): v for k, v in ast.literal_eval(value).items()}
+        except (ValueError, SyntaxError, AttributeError):
+            pass
+    return {i: str(i) for i in range(count or 0)}
+
+class OnnxDetector:
+    """YOLO detector on an exported .onnx model, run by ONNX Runtime
+
+    Preprocessing is the fused letterbox from preprocess.py and decoding +
+    NMS are NumPy, so neither torch nor ultralytics is imported. Class
+    names and the input size come from the metadata Ultralytics writes into
+    the export; a static export ignores other sizes. intra_threads sizes
+    ONNX Runtime's per-operator thread pool (None: one per physical core).
+    top_k caps the candidates entering NMS and agnostic=True lets boxes of
+    different classes suppress each other (see postprocess.py).
+    detect(frame, imgsz) matches DetectionClient.detect, so scripts can
+    use either interchangeably.
+    """
+
+    def __init__(self, path, imgsz=None, conf=0.25, iou=0.7, intra_threads=None,
+                 inter_threads=1, providers=None, max_det=300, top_k=MAX_NMS, agnostic=False):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise BackendError("The ONNX backend needs onnxruntime: pip install onnxruntime") from e
+
+        self.path = Path(path)
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.top_k = top_k
+        self.agnostic = agnostic
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = inter_threads
+        if intra_threads:
+            options.intra_op_num_threads = intra_threads
+        try:
+            self.session = ort.InferenceSession(str(path), options,
+                                                providers=providers or ['CPUExecutionProvider'])
+        except Exception as e:
+            # onnxruntime raises its own Fail / InvalidGraph / NoSuchFile types
+            raise BackendError(f"Could not load {path}: {e}") from e
+        self.providers = self.session.get_providers()
+        self.threads = intra_threads
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dtype = np.float16 if model_input.type == 'tensor(float16)' else np.float32
+        batch, _, height, width = model_input.shape
+        self.batch = batch if isinstance(batch, int) else None
+        self.dynamic = not (isinstance(height, int) and isinstance(width, int))
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if self.dynamic:
+            exported = ast.literal_eval(metadata['imgsz'])[0] if 'imgsz' in metadata else 640
+            self.imgsz = imgsz or exported
+        else:
+            self.imgsz = height if height == width else (height, width)
+        channels = self.session.get_outputs()[0].shape[1]
+        self.names = parse_names(metadata.get('names'),
+                                 channels - 4 if isinstance(channels, int) else None)
+        self._local = threading.local()
+
+    def _letterbox(self, imgsz):
+        """This thread's Letterbox for an input size (its buffers are reused)"""
+        letterboxes = self._local.__dict__.setdefault('letterboxes', {})
+        letterbox = letterboxes.get(imgsz)
+        if letterbox is None:
+            letterbox = letterboxes[imgsz] = Letterbox(imgsz)
+        return letterbox
+
+    def preprocess(self, frame, imgsz=None):
+        """(input tensor, LetterboxMeta) for a BGR or BGRA frame"""
+        size = (imgsz or self.imgsz) if self.dynamic else self.imgsz
+        tensor, meta = self._letterbox(size)(frame)
+        return tensor.astype(self.dtype, copy=False), meta
+
+    def infer(self, tensor):
+        """Raw model output for an input tensor"""
+        return self.session.run(None, {self.input_name: tensor})[0]
+
+    def postprocess(self, output, meta):
+        """Detections in frame pixels from one image's raw output"""
+        detections = postprocess(output, self.conf, self.iou, self.max_det, self.top_k,
+                                 self.agnostic)
+        scale_boxes(detections.xyxy, meta)
+        return detections
+
+    def detect(self, frame, imgsz=None):
+        """Detections for one BGR or BGRA frame"""
+        tensor, meta = self.preprocess(frame, imgsz)
+        return self.postprocess(self.infer(tensor)[0], meta)
+
+    def detect_batch(self, frames, imgsz=None):
+        """One Detections per frame; a dynamic-batch export runs them in one call"""
+        if self.batch is not None or len(frames) == 1:
+            return [self.detect(frame, imgsz) for frame in frames]
+        # The letterbox reuses its buffer, so each frame's tensor is copied out
+        prepared = []
+        for frame in frames:
+            tensor, meta = self.preprocess(frame, imgsz)
+            prepared.append((tensor.copy(), meta))
+        outputs = self.infer(np.concatenate([tensor for tensor, _ in prepared]))
+        return [self.postprocess(output, meta) for output, (_, meta) in zip(outputs, prepared)]
+
+    def warmup(self, runs=1):
+        """Run a blank frame so the first real frame does not pay for allocations"""
+        size = self.imgsz if isinstance(self.imgsz, tuple) else (self.imgsz, self.imgsz)
+        blank = np.zeros(size + (3,), dtype=np.uint8)
+        for _ in range(runs):
+            self.detect(blank)
+
+    def describe(self):
+        size = self.imgsz if isinstance(self.imgsz, tuple) else (self.imgsz, self.imgsz)
+        threads = self.threads or 'auto'
+        return (f"ONNX Runtime {self.path.name} ({size[0]}x{size[1]}"
+                f"{', dynamic' if self.dynamic else ''}, {self.dtype.__name__}, "
+                f"{threads} threads, {self.providers[0]})")
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        # Windows: peak working set through psutil, if installed
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def probe(backend, weights, imgsz=640, runs=50, threads=None, size=(1280, 720)):
+    """Cold start, peak RSS and per-frame latency of one backend in this process
+
+    Meant to run in a fresh interpreter (see measure_backends): load_s is
+    imports plus model load, first_s adds the first detection, and the
+    latency is the whole frame -> Detections path on a `size` frame.
+    """
+    started = time.perf_counter()
+    if backend == 'onnx':
+        detector = OnnxDetector(weights, imgsz, intra_threads=threads)
+        run = detector.detect
+    else:
+        import torch
+        from ultralytics import YOLO
+
+        if threads:
+            torch.set_num_threads(threads)
+        model = YOLO(weights)
+
+        def run(frame):
+            return Detections.from_ultralytics(model(frame, imgsz=imgsz, device='cpu',
+                                                     verbose=False)[0])
+    load_s = time.perf_counter() - started
+
+    frame = np.random.default_rng(0).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    run(frame)
+    first_s = time.perf_counter() - started
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(frame)
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    return {
+        'backend': backend,
+        'weights': str(weights),
+        'imgsz': imgsz,
+        'threads': threads,
+        'load_s': load_s,
+        'first_s': first_s,
+        'rss_mb': peak_rss_mb(),
+        'mean_ms': float(times.mean()),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p95_ms': float(np.percentile(times, 95)),
+    }
+
+def measure_backends(weights, imgsz=640, runs=50, threads=None, timeout=600):
+    """probe() each backend in its own fresh interpreter; weights maps backend -> path"""
+    results = []
+    for backend, path in weights.items():
+        cmd = [sys.executable, str(Path(__file__).resolve()), backend, str(path),
+               '--imgsz', str(imgsz), '--runs', str(runs)]
+        if threads:
+            cmd += ['--threads', str(threads)]
+        try:
+            done = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            raise BackendError(f"{backend} probe timed out after {timeout}s") from e
+        lines = done.stdout.strip().splitlines()
+        if done.returncode != 0 or not lines:
+            error = (done.stderr.strip().splitlines() or ['no output'])[-1]
+            raise BackendError(f"{backend} probe failed: {error}")
+        results.append(json.loads(lines[-1]))
+    return results
+
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(
+        description="Cold-start probe for one inference backend (prints one JSON line)")
+    parser.add_argument('backend', choices=BACKENDS)
+    parser.add_argument('weights', help="best.pt for torch, best.onnx for onnx")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--runs', type=int, default=50, help="timed frames after the first")
+    parser.add_argument('--threads', type=int, help="intra-op threads (default: automatic)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        print(json.dumps(probe(args.backend, args.weights, args.imgsz, args.runs, args.threads)))
+    except BackendError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,62 @@
+"""
+Detection overlay rendering
+Draws a frame's detections straight from the Detections arrays: one bulk
+conversion to Python ints, centres computed for all boxes at once and
+per-class styles looked up from tables built once
+"""
+import cv2
+import numpy as np
+
+class OverlayRenderer:
+    """Draws Detections (boxes, centre dots, optional labels) onto frames
+
+    Colours and line widths are resolved per class at construction (head
+    classes get thicker boxes), so the per-box work is just the OpenCV
+    draw calls themselves. Labels show class, confidence and the track ID
+    when present.
+    """
+
+    def __init__(self, names, colors, default_color=(0, 255, 0), dot_radius=4, font_scale=0.5):
+        self.names = names if isinstance(names, dict) else dict(enumerate(names))
+        self.dot_radius = dot_radius
+        self.font_scale = font_scale
+        size = max(self.names) + 1 if self.names else 1
+        self._colors = [tuple(default_color)] * size
+        self._thickness = [2] * size
+        self._labels = [str(i) for i in range(size)]
+        for index, name in self.names.items():
+            self._colors[index] = tuple(colors.get(name, default_color))
+            self._thickness[index] = 3 if 'head' in name.lower() else 2
+            self._labels[index] = name
+
+    def draw(self, frame, detections, show_labels=True, scale=1.0):
+        """Draw all detections onto the frame in place
+
+        scale maps detection coordinates to the frame, e.g. 0.5 to draw
+        full-resolution detections on a half-size display frame.
+        """
+        if len(detections) == 0:
+            return frame
+        xyxy = detections.xyxy if scale == 1.0 else detections.xyxy * np.float32(scale)
+        boxes = xyxy.astype(np.int32)
+        # Whole-array maths and a single tolist() instead of NumPy scalars per box
+        centres = ((boxes[:, :2] + boxes[:, 2:]) // 2).tolist()
+        rows = boxes.tolist()
+        classes = detections.cls.tolist()
+        colors, thickness = self._colors, self._thickness
+
+        for (x1, y1, x2, y2), centre, cls in zip(rows, centres, classes):
+            color = colors[cls]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness[cls])
+            cv2.circle(frame, centre, self.dot_radius, color, -1)
+
+        if show_labels:
+            ids = detections.ids.tolist() if detections.ids is not None else None
+            for i, (conf, cls) in enumerate(zip(detections.conf.tolist(), classes)):
+                label = f"{self._labels[cls]} {conf:.2f}"
+                if ids is not None:
+                    label = f"#{ids[i]} {label}"
+                x1, y1 = rows[i][0], rows[i][1]
+                cv2.putText(frame, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                            self.font_scale, colors[cls], 2)
+        return frame
@@ -0,0 +1,172 @@
+"""
+Staged pipeline helpers for real-time detection
+Bounded drop-oldest queues and worker threads that connect capture,
+inference and render so their latencies overlap instead of adding up
+"""
+import threading
+import time
+from collections import deque
+
+class QueueClosed(Exception):
+    """Raised by LatestQueue.get() once the queue is closed and drained"""
+
+class LatestQueue:
+    """Bounded queue that drops the oldest item when full
+
+    Producers never block by default: a put() on a full queue evicts the
+    oldest entry so consumers always see the freshest data. put(block=True)
+    waits for room instead, for offline runs that must see every item
+    (e.g. a recorded session processed headless). Depth and drop counts are
+    kept for the HUD / console stats. `on_drop` is called with every evicted
+    item (e.g. to return pooled frame buffers).
+    """
+
+    def __init__(self, maxsize=1, name="queue", on_drop=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self.name = name
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+
+    def put(self, item, block=False):
+        """Add an item; if full, evict the oldest one or (block=True) wait"""
+        evicted = None
+        with self._cond:
+            while block and not self._closed and len(self._items) >= self.maxsize:
+                self._cond.wait()
+            if self._closed:
+                evicted = item
+            else:
+                if len(self._items) >= self.maxsize:
+                    evicted = self._items.popleft()
+                    self.dropped += 1
+                self._items.append(item)
+                self.put_count += 1
+                self._cond.notify()
+        if evicted is not None and self.on_drop is not None:
+            self.on_drop(evicted)
+
+    def get(self, timeout=None):
+        """Return the oldest queued item, waiting up to timeout seconds
+
+        Returns None on timeout and raises QueueClosed once the queue has
+        been closed and everything in it consumed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed(self.name)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            self.get_count += 1
+            item = self._items.popleft()
+            # Wake a producer blocked in put(block=True)
+            self._cond.notify_all()
+            return item
+
+    def get_latest(self, timeout=None):
+        """Return the newest item and discard anything older (counted as drops)"""
+        item = self.get(timeout)
+        if item is None:
+            return None
+        stale = []
+        with self._cond:
+            while self._items:
+                stale.append(item)
+                item = self._items.popleft()
+                self.dropped += 1
+                self.get_count += 1
+        if self.on_drop is not None:
+            for old in stale:
+                self.on_drop(old)
+        return item
+
+    def close(self):
+        """Stop accepting items and wake up every waiting consumer"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def drain(self):
+        """Discard everything still queued, passing it to on_drop"""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+        if self.on_drop is not None:
+            for item in items:
+                self.on_drop(item)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    def stats(self):
+        """Snapshot of queue counters"""
+        return {
+            'name': self.name,
+            'depth': len(self._items),
+            'maxsize': self.maxsize,
+            'put': self.put_count,
+            'get': self.get_count,
+            'dropped': self.dropped,
+        }
+
+class StageWorker(threading.Thread):
+    """Daemon thread running one pipeline stage
+
+    `step` is called repeatedly until it returns False, the stop event is
+    set or an upstream queue is closed. `on_exit` runs on the worker thread
+    (for thread-bound resources such as an mss handle) and the output queue
+    (if any) is closed when the stage exits so downstream stages shut down
+    in order.
+    """
+
+    def __init__(self, name, step, stop_event, output=None, on_exit=None):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.stop_event = stop_event
+        self.output = output
+        self.on_exit = on_exit
+        self.iterations = 0
+        self.busy_time = 0.0
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                keep_going = self.step()
+                self.busy_time += time.perf_counter() - start
+                self.iterations += 1
+                if keep_going is False:
+                    break
+        except QueueClosed:
+            pass
+        except Exception as e:
+            self.error = e
+            print(f"[ERROR] Stage '{self.name}' failed: {e}")
+            self.stop_event.set()
+        finally:
+            if self.on_exit is not None:
+                self.on_exit()
+            if self.output is not None:
+                self.output.close()
+
+def format_queue_stats(queues):
+    """One-line summary of queue depth and drops for console output"""
+    return " | ".join(
+        f"{q.name}: {q.depth}/{q.maxsize} drop {q.dropped}" for q in queues
+    )
@@ -0,0 +1,160 @@
+"""
+NumPy post-processing for raw YOLO outputs
+Decodes the exported (batch, 4 + classes, anchors) tensor into boxes and
+runs greedy class-aware (or agnostic) NMS without torch, for ONNX Runtime
+and any other non-torch backend
+
+Usage:
+    python microbench.py nms --counts 100,1000,5000,10000    # speed + parity
+"""
+import numpy as np
+
+from detections import Detections
+
+# Per-class coordinate offset: boxes of different classes never overlap (as Ultralytics)
+MAX_WH = 7680
+# Candidates kept before NMS, highest confidence first (Ultralytics' max_nms)
+MAX_NMS = 30000
+# Below this many candidates NMS resolves NMS_BLOCK boxes per step from a
+# small IoU matrix; above it one box per step over contiguous columns
+NMS_SWITCH = 2048
+NMS_BLOCK = 32
+
+def xywh_to_xyxy(boxes):
+    """(N, 4) centre / size boxes -> corner boxes"""
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+def box_iou(a, b):
+    """(len(a), len(b)) IoU matrix of two sets of xyxy boxes"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    wh = (rb - lt).clip(0)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def box_ios(a, b):
+    """(len(a), len(b)) intersection over the smaller box of two sets of xyxy boxes
+
+    1.0 whenever one box lies inside the other, e.g. a player cut off at
+    a tile edge inside the same player's full box, where IoU can be low.
+    """
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    wh = (rb - lt).clip(0)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (np.minimum(area_a[:, None], area_b[None, :]) + 1e-9)
+
+def _overlaps(rows, cols, x1, y1, x2, y2, area, iou_threshold):
+    """(rows, cols) mask of pairs whose IoU exceeds the threshold
+
+    Compared as inter > t * union, which avoids the division.
+    """
+    width = np.minimum(x2[rows, None], x2[None, cols]) - np.maximum(x1[rows, None], x1[None, cols])
+    height = np.minimum(y2[rows, None], y2[None, cols]) - np.maximum(y1[rows, None], y1[None, cols])
+    inter = width.clip(0) * height.clip(0)
+    return inter > iou_threshold * (area[rows, None] + area[None, cols] - inter)
+
+def nms(xyxy, conf, cls=None, iou_threshold=0.7, max_det=300, agnostic=False):
+    """Indices kept by greedy NMS, highest confidence first
+
+    Same result as torchvision's batched_nms (or nms when agnostic / no
+    classes), stopping once max_det boxes are kept (None: no limit).
+    Candidates are sorted once into contiguous coordinate columns that
+    shrink as boxes are suppressed. While many remain, each step keeps the
+    best box and drops its overlaps in one vectorized pass; once at most
+    NMS_SWITCH remain, each step takes the next NMS_BLOCK boxes, settles
+    them among themselves from a small IoU matrix, and then drops
+    everything the kept ones overlap in one pass, so a crowded frame
+    costs a few dozen NumPy calls instead of one round per kept box.
+    """
+    count = len(conf)
+    max_det = count if max_det is None else max_det
+    if count == 0 or max_det <= 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(-conf, kind='stable')
+    boxes = xyxy[order].astype(np.float32)
+    if cls is not None and not agnostic:
+        # Each class is shifted into its own coordinate range, so one
+        # pass never suppresses across classes
+        boxes += (cls[order, None] * MAX_WH).astype(np.float32)
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[:, i]) for i in range(4))
+    area = (x2 - x1) * (y2 - y1)
+    index = order
+    keep = []
+    while index.size and len(keep) < max_det:
+        if index.size > NMS_SWITCH:
+            keep.append(index[0])
+            width = np.minimum(x2[0], x2[1:])
+            width -= np.maximum(x1[0], x1[1:])
+            np.maximum(width, 0, out=width)
+            height = np.minimum(y2[0], y2[1:])
+            height -= np.maximum(y1[0], y1[1:])
+            np.maximum(height, 0, out=height)
+            inter = width * height
+            survivors = inter <= iou_threshold * (area[0] + area[1:] - inter)
+            step = 1
+        else:
+            step = min(NMS_BLOCK, index.size)
+            block = slice(0, step)
+            over = _overlaps(block, block, x1, y1, x2, y2, area, iou_threshold)
+            suppressed = np.zeros(step, dtype=bool)
+            kept = []
+            for i in range(step):
+                if not suppressed[i]:
+                    kept.append(i)
+                    suppressed |= over[i]
+            keep.extend(index[kept])
+            survivors = ~_overlaps(kept, slice(step, None), x1, y1, x2, y2, area,
+                                   iou_threshold).any(axis=0)
+        x1, y1, x2, y2 = x1[step:][survivors], y1[step:][survivors], \
+            x2[step:][survivors], y2[step:][survivors]
+        area, index = area[step:][survivors], index[step:][survivors]
+    return np.array(keep[:max_det], dtype=np.int64)
+
+def decode(pred, conf=0.25, top_k=MAX_NMS):
+    """(xyxy, conf, cls) candidates from one image's (4 + classes, anchors) output
+
+    Each anchor keeps its best class (Ultralytics' single-label predict
+    mode). Only anchors above `conf` are decoded, and at most `top_k` of
+    them, highest confidence first, go on to NMS (None: all).
+    """
+    pred = pred.astype(np.float32, copy=False)
+    scores = pred[4:]
+    cls = scores.argmax(axis=0)
+    best = np.take_along_axis(scores, cls[None], axis=0)[0]
+    candidates = np.flatnonzero(best > conf)
+    if top_k is not None and candidates.size > top_k:
+        candidates = candidates[np.argpartition(-best[candidates], top_k - 1)[:top_k]]
+    return xywh_to_xyxy(pred[:4, candidates].T), best[candidates], cls[candidates]
+
+def postprocess(pred, conf=0.25, iou=0.7, max_det=300, top_k=MAX_NMS, agnostic=False):
+    """Detections (model input pixels) from one image's raw YOLO output
+
+    Takes the exported (4 + classes, anchors) layout, or the (max_det, 6)
+    xyxy / conf / cls rows of a model exported with NMS built in.
+    """
+    if pred.shape[0] > pred.shape[1]:
+        # Exported with NMS: the rows are final
+        pred = pred[pred[:, 4] > conf].astype(np.float32, copy=False)
+        return Detections(pred[:max_det, :4], pred[:max_det, 4], pred[:max_det, 5])
+    xyxy, scores, cls = decode(pred, conf, top_k)
+    keep = nms(xyxy, scores, cls, iou, max_det, agnostic)
+    return Detections(xyxy[keep], scores[keep], cls[keep])
+
+def postprocess_batch(output, **kwargs):
+    """One Detections per image of a (batch, ...) output; kwargs as postprocess()"""
+    return [postprocess(pred, **kwargs) for pred in output]
+
+def match_detections(a, b, box_tol=1.0, conf_tol=1e-3):
+    """Number of boxes in `a` with a same-class twin in `b` (boxes and scores within tolerance)"""
+    if len(a) == 0 or len(b) == 0:
+        return 0
+    close = ((np.abs(a.xyxy[:, None] - b.xyxy[None]).max(axis=2) <= box_tol)
+             & (np.abs(a.conf[:, None] - b.conf[None]) <= conf_tol)
+             & (a.cls[:, None] == b.cls[None]))
+    return int(close.any(axis=1).sum())
@@ -0,0 +1,129 @@
+"""
+Fused model-input preprocessing
+Turns a raw BGRA (or BGR) capture straight into the letterboxed, normalized
+RGB NCHW tensor YOLO expects, with a single resize of the full-resolution
+frame and no per-frame allocations
+"""
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+class LetterboxMeta(NamedTuple):
+    """Geometry needed to map model-space boxes back to the source frame"""
+    scale: float
+    pad_x: int
+    pad_y: int
+    src_width: int
+    src_height: int
+    input_width: int
+    input_height: int
+
+class Letterbox:
+    """Reusable BGRA/BGR -> letterboxed float32 NCHW converter
+
+    Matches Ultralytics' LetterBox geometry (centred padding with value 114,
+    bilinear resize) but resizes the capture exactly once and writes into
+    buffers that are only reallocated when the source resolution changes.
+    One instance per thread: the returned tensor is overwritten by the next
+    call.
+    """
+
+    def __init__(self, imgsz=640, stride=32, auto=False, pad_value=114):
+        self.imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+        self.stride = stride
+        self.auto = auto
+        self.pad_value = pad_value
+        self._key = None
+        self._meta = None
+        self._resized = None
+        self._tensor = None
+        self._content = None
+        self.allocations = 0
+
+    def _configure(self, height, width, channels):
+        """(Re)compute geometry and buffers for a new source shape"""
+        target_h, target_w = self.imgsz
+        scale = min(target_h / height, target_w / width)
+        new_w, new_h = int(round(width * scale)), int(round(height * scale))
+
+        if self.auto:
+            # Minimal rectangle: only pad up to the next stride multiple
+            target_w = int(np.ceil(new_w / self.stride) * self.stride)
+            target_h = int(np.ceil(new_h / self.stride) * self.stride)
+
+        pad_x = (target_w - new_w) / 2
+        pad_y = (target_h - new_h) / 2
+        left, top = int(round(pad_x - 0.1)), int(round(pad_y - 0.1))
+
+        self._resized = np.empty((new_h, new_w, channels), dtype=np.uint8)
+        # Padding never changes, so it is written once here, not per frame
+        self._tensor = np.full((1, 3, target_h, target_w), self.pad_value / 255.0,
+                               dtype=np.float32)
+        self._content = self._tensor[0, :, top:top + new_h, left:left + new_w]
+        self._meta = LetterboxMeta(scale, left, top, width, height, target_w, target_h)
+        self._key = (height, width, channels)
+        self.allocations += 1
+
+    def __call__(self, frame):
+        """Return (tensor, meta) for a BGRA or BGR uint8 frame"""
+        height, width, channels = frame.shape
+        if (height, width, channels) != self._key:
+            self._configure(height, width, channels)
+
+        meta = self._meta
+        resized = self._resized
+        if (meta.scale, resized.shape[:2]) == (1.0, (height, width)):
+            resized = frame
+        else:
+            cv2.resize(frame, (resized.shape[1], resized.shape[0]), dst=resized,
+                       interpolation=cv2.INTER_LINEAR)
+
+        # BGR(A) -> RGB, HWC -> CHW and 0..255 -> 0..1 in a single pass
+        np.multiply(resized[..., 2::-1].transpose(2, 0, 1), np.float32(1.0 / 255.0),
+                    out=self._content, casting='unsafe')
+        return self._tensor, meta
+
+def scale_boxes(boxes, meta, clip=True):
+    """Map xyxy boxes from model input space back to source pixels, in place
+
+    Works on NumPy arrays and torch tensors alike (only the first four
+    columns are touched, so Ultralytics' (N, 6) box data can be passed as-is).
+    """
+    if len(boxes) == 0:
+        return boxes
+    boxes[:, [0, 2]] -= meta.pad_x
+    boxes[:, [1, 3]] -= meta.pad_y
+    boxes[:, :4] /= meta.scale
+    if clip:
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, meta.src_width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, meta.src_height)
+    return boxes
+
+def restore_boxes(results, meta):
+    """Map Ultralytics Results from a letterboxed tensor back to the source frame"""
+    import torch
+
+    orig_shape = (meta.src_height, meta.src_width)
+    # Result tensors are inference tensors; in-place edits need the same mode
+    with torch.inference_mode():
+        for result in results:
+            result.orig_shape = orig_shape
+            if result.boxes is not None:
+                scale_boxes(result.boxes.data, meta)
+                result.boxes.orig_shape = orig_shape
+    return results
+
+def predict_letterboxed(model, frame, letterbox, **kwargs):
+    """Run an Ultralytics model on a frame through the fused preprocessor
+
+    Returns the usual list of Results with boxes already mapped back to the
+    frame's coordinates. Extra kwargs are passed to model() (conf, iou,
+    half, device, ...); imgsz is taken from the letterbox.
+    """
+    import torch
+
+    tensor, meta = letterbox(frame)
+    kwargs.pop('imgsz', None)
+    results = model(torch.from_numpy(tensor), **kwargs)
+    return restore_boxes(results, meta)
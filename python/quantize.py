@@ -0,0 +1,215 @@
+"""
+INT8 post-training quantization for ONNX exports
+Turns the FP32 best.onnx from export_model.py into a static INT8 model
+calibrated on a sample of the dataset's training images (or a dynamic INT8
+one, which needs no calibration), and measures both on the CPU so shipping
+INT8 is a decision backed by mAP and latency numbers
+
+Usage:
+    python export_model.py --int8 both --calib-images 200
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from image_batch import dataset_images
+from onnx_backend import OnnxDetector
+from preprocess import Letterbox
+
+QUANT_MODES = ('static', 'dynamic')
+CALIBRATION_METHODS = ('minmax', 'entropy', 'percentile')
+
+class QuantizationError(Exception):
+    """Raised when a model cannot be quantized"""
+
+def calibration_images(data_path, count=200, seed=0, split='train'):
+    """Up to `count` image paths of a data.yaml split, sampled reproducibly"""
+    paths = dataset_images(data_path, split)
+    if not paths:
+        raise QuantizationError(f"No {split} images found for calibration in {data_path}")
+    if count and len(paths) > count:
+        picked = np.random.default_rng(seed).choice(len(paths), count, replace=False)
+        paths = [paths[i] for i in sorted(picked)]
+    return paths
+
+def quantized_path(onnx_path, mode='static'):
+    """Where the INT8 model of an export goes: best_int8.onnx, best_int8_dynamic.onnx"""
+    onnx_path = Path(onnx_path)
+    suffix = '_int8' if mode == 'static' else f'_int8_{mode}'
+    return onnx_path.with_name(onnx_path.stem + suffix + onnx_path.suffix)
+
+class CalibrationReader:
+    """Letterboxed images handed to ONNX Runtime's calibrator one at a time
+
+    Implements the get_next() / rewind() protocol of onnxruntime's
+    CalibrationDataReader with the same preprocessing as OnnxDetector, so
+    the activation ranges are those the deployed model will see. Images
+    are decoded lazily; unreadable ones are skipped.
+    """
+
+    def __init__(self, paths, input_name, imgsz=640):
+        self.paths = list(paths)
+        self.input_name = input_name
+        self.letterbox = Letterbox(imgsz)
+        self.used = 0
+        self._paths = iter(self.paths)
+
+    def get_next(self):
+        for path in self._paths:
+            image = cv2.imread(str(path))
+            if image is None:
+                continue
+            tensor, _ = self.letterbox(image)
+            self.used += 1
+            # The letterbox overwrites its tensor on the next call
+            return {self.input_name: tensor.copy()}
+        return None
+
+    def rewind(self):
+        self._paths = iter(self.paths)
+
+def head_nodes(model):
+    """Names of the detection head's decoding nodes, which stay in float
+
+    The last `/model.N/` block of an Ultralytics export ends in DFL, box
+    decoding and a Concat of pixel coordinates (0..640) with class scores
+    (0..1); one INT8 scale for both wipes out the scores. Only the box
+    and class branches (cv2.*, cv3.*) before that are quantized.
+    """
+    blocks = {}
+    for node in model.graph.node:
+        parts = node.name.split('/')
+        if len(parts) > 2 and parts[1].startswith('model.') and parts[1][6:].isdigit():
+            # '/model.23/cv2.0/.../Conv' -> branch 'cv2.0'; '/model.23/Concat_3' -> none
+            branch = parts[2] if len(parts) > 3 else ''
+            blocks.setdefault(int(parts[1][6:]), []).append((node.name, branch))
+    if not blocks:
+        return []
+    return [name for name, branch in blocks[max(blocks)] if 'cv' not in branch]
+
+def quantize_onnx(onnx_path, mode='static', images=None, output=None, method='minmax',
+                  per_channel=True):
+    """Write an INT8 copy of an FP32 .onnx export; returns its path
+
+    static: weights and activations in INT8 (QDQ format), activation
+    ranges calibrated on `images` with `method`. dynamic: INT8 weights,
+    activations quantized per inference, no calibration data. The graph
+    is shape-inferred and optimized first, as ONNX Runtime recommends.
+    """
+    try:
+        import onnx
+        from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType,
+                                              quantize_dynamic, quantize_static)
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as e:
+        raise QuantizationError("Quantization needs onnx and onnxruntime: "
+                                "pip install onnx onnxruntime") from e
+    if mode not in QUANT_MODES:
+        raise QuantizationError(f"Unknown quantization mode: {mode}")
+    if mode == 'static' and not images:
+        raise QuantizationError("Static quantization needs calibration images")
+
+    onnx_path = Path(onnx_path)
+    output = Path(output) if output else quantized_path(onnx_path, mode)
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = Path(tmp) / onnx_path.name
+        try:
+            quant_pre_process(str(onnx_path), str(prepared))
+        except Exception:
+            # Symbolic shape inference does not handle every graph; it is only an optimization
+            prepared = onnx_path
+        model = onnx.load(str(prepared))
+        exclude = head_nodes(model)
+        try:
+            if mode == 'dynamic':
+                # ONNX Runtime's CPU ConvInteger kernel takes unsigned 8-bit weights
+                quantize_dynamic(str(prepared), str(output), per_channel=per_channel,
+                                 weight_type=QuantType.QUInt8, nodes_to_exclude=exclude)
+            else:
+                model_input = model.graph.input[0]
+                dims = [d.dim_value for d in model_input.type.tensor_type.shape.dim[2:]]
+                if not all(dims):
+                    raise QuantizationError("Static quantization needs a fixed-size export "
+                                            "(export without dynamic=True)")
+                reader = CalibrationReader(images, model_input.name, tuple(dims))
+                calibrate = {'minmax': CalibrationMethod.MinMax,
+                             'entropy': CalibrationMethod.Entropy,
+                             'percentile': CalibrationMethod.Percentile}[method]
+                quantize_static(str(prepared), str(output), reader,
+                                quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                                activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                                nodes_to_exclude=exclude, calibrate_method=calibrate)
+                if reader.used == 0:
+                    output.unlink(missing_ok=True)
+                    raise QuantizationError("None of the calibration images could be read")
+        except QuantizationError:
+            raise
+        except Exception as e:
+            raise QuantizationError(f"{mode} quantization of {onnx_path.name} failed: {e}") from e
+    # Keep the class names and image size the export carries
+    _copy_metadata(onnx_path, output)
+    return output
+
+def _copy_metadata(source, target):
+    """Copy an export's metadata_props (names, imgsz, ...) onto a derived model"""
+    import onnx
+
+    source_model = onnx.load(str(source), load_external_data=False)
+    target_model = onnx.load(str(target))
+    present = {prop.key for prop in target_model.metadata_props}
+    for prop in source_model.metadata_props:
+        if prop.key not in present:
+            target_model.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(target_model, str(target))
+
+def measure_latency(path, images, runs=50, threads=None, warmup=5):
+    """Per-image CPU latency of a .onnx model on real images (whole frame -> Detections path)"""
+    detector = OnnxDetector(path, intra_threads=threads)
+    frames = [image for image in (cv2.imread(str(p)) for p in images[:runs]) if image is not None]
+    if not frames:
+        raise QuantizationError("No readable images to benchmark on")
+    detector.warmup(warmup)
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        detector.detect(frames[i % len(frames)])
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    return {
+        'imgsz': detector.imgsz,
+        'mean_ms': float(times.mean()),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p95_ms': float(np.percentile(times, 95)),
+    }
+
+def recommend(results, max_map_drop=0.01):
+    """(result to ship, reason) from FP32-first results with 'map50' and 'mean_ms'
+
+    The fastest quantized model wins if it is faster than FP32 and loses
+    at most `max_map_drop` mAP50; otherwise FP32 stays.
+    """
+    baseline = results[0]
+    eligible = [r for r in results[1:]
+                if r['mean_ms'] < baseline['mean_ms']
+                and baseline['map50'] - r['map50'] <= max_map_drop]
+    if not eligible:
+        return baseline, (f"no INT8 model is faster within a {max_map_drop:.3f} mAP50 loss; "
+                          f"keep FP32")
+    best = min(eligible, key=lambda r: r['mean_ms'])
+    return best, (f"{baseline['mean_ms'] / best['mean_ms']:.2f}x faster for "
+                  f"{best['map50'] - baseline['map50']:+.4f} mAP50")
+
+def format_comparison(results):
+    """Table lines comparing FP32 (first) with its quantized variants"""
+    baseline = results[0]
+    lines = [f"   {'Model':<24} {'Type':<8} {'Size':>8} {'mAP50':>7} {'Δ mAP50':>8} "
+             f"{'mAP50-95':>9} {'Latency':>9} {'p95':>8} {'Speedup':>8}"]
+    for r in results:
+        delta = '-' if r is baseline else f"{r['map50'] - baseline['map50']:+.4f}"
+        lines.append(f"   {r['name']:<24} {r['quantization']:<8} {r['size_mb']:6.1f}MB "
+                     f"{r['map50']:7.4f} {delta:>8} {r['map']:9.4f} {r['mean_ms']:7.1f}ms "
+                     f"{r['p95_ms']:6.1f}ms {baseline['mean_ms'] / r['mean_ms']:7.2f}x")
+    return lines
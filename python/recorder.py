@@ -0,0 +1,267 @@
+"""
+Background screenshot and session recording
+Frames are copied into pooled buffers on the caller's thread and encoded
+by writer threads, so saving a screenshot or recording a session never
+waits on JPEG / video encoding or disk I/O
+"""
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from frame_pool import FramePool, as_bgr
+from pipeline import LatestQueue, StageWorker
+
+FORMATS = ['video', 'jpeg']
+
+class RecorderError(Exception):
+    """Raised when a recording segment cannot be opened"""
+
+class FrameRecorder:
+    """Screenshots and segmented session recordings written off-thread
+
+    screenshot() queues one full frame (optionally with a render(image)
+    callback run on the writer thread, e.g. to draw the overlay). While
+    recording, record() takes frames at up to `fps` and splits the session
+    into `segment_seconds` pieces: MP4 files, or folders of JPEGs that
+    `workers` threads encode in parallel. Queues are bounded and drop the
+    oldest frame instead of blocking, so a slow disk costs recorded frames
+    (counted in `dropped`), never detection FPS.
+    """
+
+    def __init__(self, directory='recordings', fmt='video', fps=30.0, segment_seconds=60.0,
+                 queue_size=8, quality=90, codec='mp4v', workers=1):
+        if fmt not in FORMATS:
+            raise RecorderError(f"Unknown recording format: {fmt}")
+        self.directory = Path(directory)
+        self.format = fmt
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.quality = quality
+        self.codec = codec
+        # Video segments are written in order by one thread
+        self.workers = max(1, workers) if fmt == 'jpeg' else 1
+        self._pool = FramePool(count=queue_size + self.workers + 1, name="record")
+        self._frames = LatestQueue(maxsize=queue_size, name="record",
+                                   on_drop=lambda item: self._pool.release(item[0]))
+        self._shots = LatestQueue(maxsize=4, name="screenshot")
+        # A failed recording stops the record threads; screenshots keep working
+        self._stop = threading.Event()
+        self._shot_stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_start = 0.0
+        self._next_due = 0.0
+        self._index = 0
+        self._writer = None
+        self._writer_key = None
+        self._writer_path = None
+        self._folders = set()
+        self._bgr = None
+        self.sessions = 0
+        self.segments = 0
+        self.recorded = 0
+        self.screenshots = 0
+        self.bytes_written = 0
+
+    def open(self):
+        self._threads = [StageWorker("screenshot", self._screenshot_step, self._shot_stop)]
+        step = self._video_step if self.format == 'video' else self._jpeg_step
+        for i in range(self.workers):
+            on_exit = self._close_writer if self.format == 'video' else None
+            self._threads.append(StageWorker(f"record-{i}", step, self._stop, on_exit=on_exit))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    # Caller side (render loop): cheap copies only
+
+    def screenshot(self, frame, path, render=None):
+        """Queue a copy of the frame to be rendered (optional) and saved to path"""
+        self._shots.put((frame.copy(), Path(path), render))
+
+    def start(self):
+        """Begin a new session; returns its directory"""
+        with self._lock:
+            session = self.directory / time.strftime("session_%Y%m%d_%H%M%S")
+            if session.exists():
+                session = session.with_name(f"{session.name}_{self.sessions + 1}")
+            self._session = session
+            self._session_start = time.perf_counter()
+            self._next_due = self._session_start
+            self._index = 0
+            self.sessions += 1
+            return self._session
+
+    def stop(self):
+        """End the session; queued frames are still written"""
+        with self._lock:
+            self._session = None
+
+    @property
+    def recording(self):
+        return self._session is not None
+
+    def record(self, frame, timestamp=None):
+        """Offer a frame to the current session; returns True if queued
+
+        Frames arriving faster than `fps` are skipped before any copy is
+        made, so recording costs at most one memcpy per recorded frame.
+        """
+        if self._session is None or self._stop.is_set():
+            return False
+        now = time.perf_counter() if timestamp is None else timestamp
+        with self._lock:
+            if self._session is None or now < self._next_due:
+                return False
+            interval = 1.0 / self.fps
+            # Fall behind by more than a frame (stall) -> resynchronise
+            self._next_due = max(self._next_due + interval, now)
+            segment = int((now - self._session_start) // self.segment_seconds)
+            self._index += 1
+            item_info = (self._session, segment, self._index)
+        buf = self._pool.acquire(frame.shape)
+        np.copyto(buf, frame)
+        self._frames.put((buf,) + item_info)
+        return True
+
+    # Writer threads
+
+    def _screenshot_step(self):
+        item = self._shots.get(timeout=0.1)
+        if item is None:
+            return True
+        image, path, render = item
+        if render is not None:
+            image = render(image)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if cv2.imwrite(str(path), as_bgr(image), [cv2.IMWRITE_JPEG_QUALITY, self.quality]):
+            self.screenshots += 1
+            self.bytes_written += path.stat().st_size
+            print(f"[INFO] Screenshot saved: {path} ({image.shape[1]}x{image.shape[0]})")
+        else:
+            print(f"[WARNING] Screenshot failed: could not write {path}")
+        return True
+
+    def _segment_path(self, session, segment):
+        return session / f"segment_{segment + 1:03d}"
+
+    def _video_step(self):
+        item = self._frames.get(timeout=0.1)
+        if item is None:
+            # Idle: finish the file once its session has been stopped
+            if self._writer is not None and self._writer_key[0] != self._session:
+                self._close_writer()
+            return True
+        buf, session, segment, _ = item
+        try:
+            bgr = as_bgr(buf, self._bgr)
+            self._bgr = bgr if bgr is not buf else self._bgr
+            # A resolution change mid-segment starts a new file
+            if self._writer_key != (session, segment, bgr.shape):
+                self._open_writer(session, segment, bgr.shape)
+            self._writer.write(bgr)
+            self.recorded += 1
+        finally:
+            self._pool.release(buf)
+        return True
+
+    def _open_writer(self, session, segment, shape):
+        self._close_writer()
+        session.mkdir(parents=True, exist_ok=True)
+        path = self._segment_path(session, segment).with_suffix('.mp4')
+        if path.exists():
+            path = path.with_name(f"{path.stem}_{shape[1]}x{shape[0]}.mp4")
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*self.codec), self.fps,
+                                 (shape[1], shape[0]))
+        if not writer.isOpened():
+            raise RecorderError(f"Cannot open video writer for {path} ({self.codec})")
+        self._writer = writer
+        self._writer_key = (session, segment, shape)
+        self._writer_path = path
+        self.segments += 1
+        print(f"[INFO] Recording segment: {path}")
+
+    def _close_writer(self):
+        if self._writer is None:
+            return
+        self._writer.release()
+        self._writer = None
+        self._writer_key = None
+        if self._writer_path.exists():
+            self.bytes_written += self._writer_path.stat().st_size
+
+    def _jpeg_step(self):
+        item = self._frames.get(timeout=0.1)
+        if item is None:
+            return True
+        buf, session, segment, index = item
+        try:
+            folder = self._segment_path(session, segment)
+            with self._lock:
+                new = folder not in self._folders
+                self._folders.add(folder)
+                if new:
+                    self.segments += 1
+            if new:
+                print(f"[INFO] Recording segment: {folder}")
+            folder.mkdir(parents=True, exist_ok=True)
+            ok, data = cv2.imencode('.jpg', as_bgr(buf), [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                raise RecorderError(f"JPEG encoding failed for frame {index}")
+            data.tofile(str(folder / f"frame_{index:06d}.jpg"))
+            with self._lock:
+                self.recorded += 1
+                self.bytes_written += data.nbytes
+        finally:
+            self._pool.release(buf)
+        return True
+
+    # Lifecycle and stats
+
+    @property
+    def error(self):
+        """Exception that stopped a writer thread (e.g. RecorderError), if any"""
+        for thread in self._threads:
+            if thread.error is not None:
+                return thread.error
+        return None
+
+    @property
+    def dropped(self):
+        return self._frames.dropped
+
+    def close(self, timeout=10.0):
+        """Stop recording, write out everything queued and stop the threads"""
+        self.stop()
+        self._frames.close()
+        self._shots.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._frames.drain()
+
+    def stats(self):
+        """Snapshot of recorder counters"""
+        return {
+            'format': self.format,
+            'recording': self.recording,
+            'sessions': self.sessions,
+            'segments': self.segments,
+            'recorded': self.recorded,
+            'screenshots': self.screenshots,
+            'pending': self._frames.depth + self._shots.depth,
+            'dropped': self._frames.dropped,
+            'screenshots_dropped': self._shots.dropped,
+            'bytes': self.bytes_written,
+        }
+
+def format_recorder_stats(recorder):
+    """One-line summary of recorded frames and drops for console output"""
+    stats = recorder.stats()
+    state = "REC" if stats['recording'] else "idle"
+    return (f"Recorder: {state}, {stats['recorded']} frames in {stats['segments']} segments, "
+            f"{stats['screenshots']} screenshots, pending {stats['pending']}, "
+            f"dropped {stats['dropped']}, {stats['bytes'] / (1024 * 1024):.1f} MB")
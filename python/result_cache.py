@@ -0,0 +1,285 @@
+"""
+Content-addressed detection cache
+Stores post-NMS detections in a local SQLite file keyed by the image's
+content hash, the model weights' hash and the inference settings, so
+re-scoring the same screenshots with the same best.pt is a lookup instead
+of a forward pass
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from detections import Detections
+from result_sink import DETECTION_DTYPE
+
+DEFAULT_PATH = '.cache/detections.sqlite'
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, digest)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+def content_digest(data):
+    """Hex digest of raw bytes (e.g. an image file) or of a decoded array (shape included)
+
+    Image files are keyed by their bytes, whoever reads them, so pass the
+    file contents as bytes or a memoryview, never the np.fromfile array.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(data, np.ndarray):
+        h.update(str(data.shape).encode())
+        data = np.ascontiguousarray(data)
+    h.update(memoryview(data).cast('B'))
+    return h.hexdigest()
+
+def settings_namespace(model_digest, **settings):
+    """Namespace for one model + settings combination (imgsz, half, backend, ...)"""
+    key = json.dumps({'model': model_digest, **settings}, sort_keys=True, default=str)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+class ResultCache:
+    """SQLite-backed cache of detections, evicted least-recently-used by size
+
+    Entries are (namespace, image digest) -> DETECTION_DTYPE rows plus the
+    image size; a namespace covers one model hash and one set of
+    inference settings, so changing either never returns stale boxes.
+    Small JSON documents (e.g. validation metrics) share the same store.
+    When the stored bytes exceed `max_bytes` the least recently read
+    entries are deleted down to 90%. Safe to use from several threads.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=1 << 30):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            # Written by an incompatible version: start over
+            self._conn.executescript("DROP TABLE IF EXISTS entries; DROP TABLE IF EXISTS files;")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return self
+
+    # Keys
+
+    def file_digest(self, path):
+        """Content hash of a file, remembered until its size or mtime changes
+
+        Used for model weights, so a 100 MB best.pt is hashed once, not on
+        every run.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?",
+                                     (str(path),)).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        h = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                               (str(path), stat.st_size, stat.st_mtime_ns, digest))
+            self._conn.commit()
+        return digest
+
+    # Detections
+
+    def get(self, namespace, digest):
+        """(Detections, (height, width)) for a cached image, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT width, height, data FROM entries WHERE namespace = ? AND digest = ?",
+                (namespace, digest)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND digest = ?",
+                               (time.time(), namespace, digest))
+            self._dirty += 1
+        width, height, data = row
+        rows = np.frombuffer(data, dtype=DETECTION_DTYPE)
+        return Detections(rows['xyxy'], rows['conf'], rows['cls']), (height, width)
+
+    def put(self, namespace, digest, detections, shape):
+        """Store one image's Detections"""
+        self.put_many(namespace, [(digest, detections, shape)])
+
+    def put_many(self, namespace, items):
+        """Store (digest, Detections, shape) items in one transaction"""
+        now = time.time()
+        records = []
+        for digest, detections, shape in items:
+            rows = np.empty(len(detections), dtype=DETECTION_DTYPE)
+            rows['xyxy'] = detections.xyxy
+            rows['conf'] = detections.conf
+            rows['cls'] = detections.cls
+            rows['id'] = -1
+            data = rows.tobytes()
+            records.append((namespace, digest, shape[1], shape[0], data, len(data), now))
+        self._store(records)
+
+    # JSON documents
+
+    def get_json(self, namespace, key):
+        """A cached JSON document, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM entries WHERE namespace = ? AND digest = ?",
+                (namespace, key)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND digest = ?",
+                               (time.time(), namespace, key))
+            self._dirty += 1
+        return json.loads(row[0])
+
+    def put_json(self, namespace, key, document):
+        data = json.dumps(document).encode()
+        self._store([(namespace, key, None, None, data, len(data), time.time())])
+
+    # Storage
+
+    def _store(self, records):
+        if not records:
+            return
+        # The same image twice in one batch is stored once
+        records = list({(r[0], r[1]): r for r in records}.values())
+        with self._lock:
+            # Replaced entries no longer count towards the size budget
+            for namespace, digest, *_ in records:
+                old = self._conn.execute(
+                    "SELECT size FROM entries WHERE namespace = ? AND digest = ?",
+                    (namespace, digest)).fetchone()
+                if old is not None:
+                    self._bytes -= old[0]
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   records)
+            self._bytes += sum(r[5] for r in records)
+            self.stores += len(records)
+            if self._bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self._conn.commit()
+            self._dirty = 0
+
+    def _evict(self, target):
+        """Delete least recently read entries until at most `target` bytes remain"""
+        cursor = self._conn.execute(
+            "SELECT namespace, digest, size FROM entries ORDER BY accessed")
+        doomed = []
+        for namespace, digest, size in cursor:
+            if self._bytes <= target:
+                break
+            doomed.append((namespace, digest))
+            self._bytes -= size
+        cursor.close()
+        self._conn.executemany("DELETE FROM entries WHERE namespace = ? AND digest = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._bytes = 0
+
+    def close(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            if self._dirty:
+                self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            'path': str(self.path),
+            'entries': entries,
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+def format_cache_stats(cache):
+    """One-line hit/miss and size summary for console output"""
+    stats = cache.stats()
+    return (f"Cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}), {stats['entries']} entries, "
+            f"{stats['bytes'] / (1024 * 1024):.1f}/{stats['max_bytes'] / (1024 * 1024):.0f} MB, "
+            f"{stats['evictions']} evicted")
+
+def dataset_fingerprint(root):
+    """Cheap hash of every file's path, size and mtime under a dataset directory
+
+    Ultralytics' own *.cache label indexes are skipped: validation rewrites
+    them, which would otherwise invalidate the fingerprint on every run.
+    """
+    root = Path(root)
+    h = hashlib.blake2b(digest_size=20)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith('.cache'):
+                continue
+            path = Path(dirpath) / name
+            stat = path.stat()
+            h.update(f"{path.relative_to(root).as_posix()}\0{stat.st_size}\0"
+                     f"{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()
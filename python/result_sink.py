@@ -0,0 +1,212 @@
+"""
+Structured detection output
+Streams per-frame detections as newline-delimited JSON or compact binary
+records to a file, pipe or local socket. Records are encoded on the
+caller's thread and written by a background writer, so the detection loop
+never waits on disk or network I/O
+"""
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from detections import Detections
+from pipeline import LatestQueue, StageWorker
+
+FORMATS = ['ndjson', 'binary']
+FORMAT_VERSION = 1
+
+# Binary layout: MAGIC, uint32 header length, JSON header, then per frame a
+# RECORD followed by `count` DETECTION_DTYPE rows (track ID -1 if untracked)
+MAGIC = b'CS2D'
+HEADER_LENGTH = struct.Struct('<I')
+RECORD = struct.Struct('<QdH')  # frame index, unix timestamp, detection count
+DETECTION_DTYPE = np.dtype([('xyxy', '<f4', (4,)), ('conf', '<f4'),
+                            ('cls', '<i4'), ('id', '<i8')])
+
+class SinkError(Exception):
+    """Raised when a result sink target cannot be opened"""
+
+def open_target(spec):
+    """Open a writable binary stream for a command-line target
+
+    -                  - standard output
+    tcp://HOST:PORT    - TCP connection to a local consumer
+    unix:///PATH       - Unix domain socket
+    <path>             - file or named pipe (FIFO)
+    """
+    try:
+        if spec == '-':
+            # The real stdout, even if console output was redirected away from it
+            return sys.__stdout__.buffer
+        if spec.startswith('tcp://'):
+            host, _, port = spec[len('tcp://'):].rpartition(':')
+            sock = socket.create_connection((host or 'localhost', int(port)))
+            return sock.makefile('wb', buffering=1 << 16)
+        if spec.startswith('unix://'):
+            if not hasattr(socket, 'AF_UNIX'):
+                raise SinkError("Unix sockets are not available on this platform")
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(spec[len('unix://'):])
+            return sock.makefile('wb', buffering=1 << 16)
+        return open(spec, 'wb', buffering=1 << 20)
+    except (OSError, ValueError) as e:
+        raise SinkError(f"Cannot open result sink {spec}: {e}") from e
+
+def encode_ndjson(frame_index, timestamp, detections):
+    """One JSON line per frame (boxes rounded to 0.1 px)"""
+    record = {
+        'frame': frame_index,
+        't': round(timestamp, 6),
+        # Round in float64: rounded float32 values print as 0.8999999761581421
+        'boxes': np.round(detections.xyxy.astype(np.float64), 1).tolist(),
+        'cls': detections.cls.tolist(),
+        'conf': np.round(detections.conf.astype(np.float64), 3).tolist(),
+    }
+    if detections.ids is not None:
+        record['ids'] = detections.ids.tolist()
+    return (json.dumps(record, separators=(',', ':')) + '\n').encode()
+
+def encode_binary(frame_index, timestamp, detections):
+    """Fixed 18-byte record header plus 32 bytes per detection"""
+    rows = np.empty(len(detections), dtype=DETECTION_DTYPE)
+    rows['xyxy'] = detections.xyxy
+    rows['conf'] = detections.conf
+    rows['cls'] = detections.cls
+    rows['id'] = detections.ids if detections.ids is not None else -1
+    return RECORD.pack(frame_index, timestamp, len(rows)) + rows.tobytes()
+
+class ResultSink:
+    """Writes detection records to a target from a background thread
+
+    write() encodes the frame and queues the bytes; the writer thread
+    batches them through a buffered stream and flushes whenever it catches
+    up (at most every `flush_interval` seconds), so consumers reading a
+    pipe or socket see results promptly. If the writer falls more than
+    `queue_size` records behind, the oldest pending records are dropped
+    and counted unless write(block=True) is used.
+    """
+
+    def __init__(self, target, fmt='ndjson', header=None, queue_size=1024, flush_interval=0.1):
+        if fmt not in FORMATS:
+            raise SinkError(f"Unknown result format: {fmt}")
+        self.target = target
+        self.format = fmt
+        self.header = dict(header or {}, format='cs2-detections', version=FORMAT_VERSION,
+                           encoding=fmt)
+        self.flush_interval = flush_interval
+        self._encode = encode_ndjson if fmt == 'ndjson' else encode_binary
+        self._queue = LatestQueue(maxsize=queue_size, name="sink")
+        self._stop = threading.Event()
+        self._stream = None
+        self._worker = None
+        self._last_flush = 0.0
+        self.records = 0
+        self.bytes_written = 0
+
+    def open(self):
+        self._stream = open_target(self.target)
+        header = json.dumps(self.header, separators=(',', ':')).encode()
+        if self.format == 'ndjson':
+            self._stream.write(header + b'\n')
+        else:
+            self._stream.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        self._worker = StageWorker("sink", self._write_step, self._stop, on_exit=self._finish)
+        self._worker.start()
+        return self
+
+    def write(self, frame_index, timestamp, detections, block=False):
+        """Queue one frame's detections for writing"""
+        self._queue.put(self._encode(frame_index, timestamp, detections), block=block)
+
+    def _write_step(self):
+        data = self._queue.get(timeout=self.flush_interval)
+        if data is not None:
+            self._stream.write(data)
+            self.records += 1
+            self.bytes_written += len(data)
+        now = time.perf_counter()
+        if self._queue.depth == 0 and now - self._last_flush >= self.flush_interval:
+            self._stream.flush()
+            self._last_flush = now
+        return True
+
+    def _finish(self):
+        try:
+            self._stream.flush()
+            if self._stream is not sys.__stdout__.buffer:
+                self._stream.close()
+        except OSError:
+            pass
+
+    @property
+    def error(self):
+        """Exception that stopped the writer (e.g. BrokenPipeError), if any"""
+        return self._worker.error if self._worker is not None else None
+
+    @property
+    def dropped(self):
+        return self._queue.dropped
+
+    def close(self, timeout=5.0):
+        """Write out everything queued, then close the target"""
+        self._queue.close()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def stats(self):
+        """Snapshot of sink counters"""
+        return {
+            'target': self.target,
+            'format': self.format,
+            'records': self.records,
+            'bytes': self.bytes_written,
+            'pending': self._queue.depth,
+            'dropped': self._queue.dropped,
+        }
+
+def format_sink_stats(sink):
+    """One-line summary of written records for console output"""
+    stats = sink.stats()
+    return (f"Sink: {stats['records']} records, {stats['bytes'] / (1024 * 1024):.1f} MB, "
+            f"pending {stats['pending']}, dropped {stats['dropped']}")
+
+def read_results(stream):
+    """Parse a result stream written by ResultSink (either format)
+
+    Returns (header, records) where records yields
+    (frame_index, timestamp, Detections) tuples.
+    """
+    magic = stream.read(len(MAGIC))
+    if magic == MAGIC:
+        (length,) = HEADER_LENGTH.unpack(stream.read(HEADER_LENGTH.size))
+        return json.loads(stream.read(length)), _read_binary(stream)
+    header = json.loads(magic + stream.readline())
+    return header, _read_ndjson(stream)
+
+def _read_ndjson(stream):
+    for line in stream:
+        record = json.loads(line)
+        yield record['frame'], record['t'], Detections(record['boxes'], record['conf'],
+                                                       record['cls'], record.get('ids'))
+
+def _read_binary(stream):
+    while True:
+        head = stream.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        frame_index, timestamp, count = RECORD.unpack(head)
+        rows = np.frombuffer(stream.read(count * DETECTION_DTYPE.itemsize), dtype=DETECTION_DTYPE)
+        ids = rows['id'] if count and (rows['id'] >= 0).all() else None
+        yield frame_index, timestamp, Detections(rows['xyxy'], rows['conf'], rows['cls'], ids)
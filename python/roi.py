@@ -0,0 +1,93 @@
+"""
+Crosshair-centred region-of-interest inference
+Runs the model on a native-resolution window around the screen centre,
+with an optional low-rate full-frame pass to keep the periphery fresh
+"""
+import numpy as np
+
+from detections import Detections
+
+class CenterRoi:
+    """Schedules ROI and full-frame passes and merges their detections
+
+    The ROI is a `size` x `size` window centred on the crosshair, cropped
+    without scaling, so heads near the crosshair keep their native pixels
+    and the model input stays small. Every `full_every` frames (0 = never)
+    the whole frame is also run at the regular inference size; detections
+    from that pass whose centre lies outside the ROI are kept as the
+    periphery until the next full pass. A player lying across the ROI
+    border is found by both passes, the ROI box cut off at the border: a
+    periphery box is dropped when it and a same-class ROI box overlap by
+    more than `iou` of the smaller one (so a cut-off box inside its full
+    counterpart always counts), and the fresher ROI box is kept.
+    """
+
+    def __init__(self, size=640, full_every=10, stride=32, iou=0.5):
+        # Model inputs must be a multiple of the stride
+        self.size = max(stride, int(round(size / stride)) * stride)
+        self.full_every = full_every
+        self.iou = iou
+        self.frames = 0
+        self.full_passes = 0
+        self._periphery = Detections.empty()
+
+    def window(self, width, height):
+        """(x0, y0, x1, y1) of the ROI, clamped to the frame"""
+        roi_w, roi_h = min(self.size, width), min(self.size, height)
+        x0 = (width - roi_w) // 2
+        y0 = (height - roi_h) // 2
+        return x0, y0, x0 + roi_w, y0 + roi_h
+
+    def crop(self, frame):
+        """Zero-copy view of the ROI and its top-left offset"""
+        x0, y0, x1, y1 = self.window(frame.shape[1], frame.shape[0])
+        return frame[y0:y1, x0:x1], (x0, y0)
+
+    def needs_full_pass(self):
+        """True if the frame about to be processed should also run full-frame"""
+        if self.full_every <= 0:
+            return False
+        return self.frames % self.full_every == 0
+
+    def detect(self, frame, detect_fn):
+        """Run ROI (and, when due, full-frame) detection on one frame
+
+        detect_fn(image, imgsz) must return Detections in `image` pixel
+        coordinates; `image` may be a non-contiguous view.
+        """
+        height, width = frame.shape[:2]
+        roi, (x0, y0) = self.crop(frame)
+        run_full = self.needs_full_pass()
+        self.frames += 1
+
+        roi_detections = detect_fn(roi, self.size).offset(x0, y0)
+
+        if run_full:
+            self.full_passes += 1
+            full = detect_fn(frame, None)
+            x0, y0, x1, y1 = self.window(width, height)
+            centers = full.centers()
+            outside = ((centers[:, 0] < x0) | (centers[:, 0] >= x1) |
+                       (centers[:, 1] < y0) | (centers[:, 1] >= y1))
+            self._periphery = full.select(outside)
+
+        return Detections.concat([roi_detections, self._unique_periphery(roi_detections)])
+
+    def _unique_periphery(self, roi_detections):
+        """Periphery detections not already found by the ROI pass"""
+        periphery = self._periphery
+        if len(periphery) == 0 or len(roi_detections) == 0:
+            return periphery
+        a, b = periphery.xyxy[:, None], roi_detections.xyxy[None]
+        inter = ((np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])).clip(0)
+                 * (np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])).clip(0))
+        area = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+        roi_area = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+        overlap = inter > self.iou * np.minimum(area, roi_area)
+        same_class = periphery.cls[:, None] == roi_detections.cls[None, :]
+        return periphery.select(~(overlap & same_class).any(axis=1))
+
+    def reset(self):
+        """Drop cached periphery detections and force a full pass next frame"""
+        self.frames = 0
+        self._periphery = Detections.empty()
@@ -0,0 +1,188 @@
+"""
+Sliced (tiled) inference for high-resolution frames
+Splits a frame into overlapping native-resolution tiles, runs them through
+the model as one batched forward pass and merges the results across tiles,
+so small heads are not lost in a single 640 downscale
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+from detections import Detections
+from postprocess import box_ios
+from preprocess import Letterbox, scale_boxes
+
+def tile_starts(length, tile, step):
+    """Start offsets covering [0, length) with tiles of `tile` every `step`"""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+def tile_windows(width, height, tile=640, overlap=0.2):
+    """List of (x0, y0, x1, y1) tile windows with the given fractional overlap"""
+    step = max(1, int(tile * (1 - overlap)))
+    return [(x0, y0, min(x0 + tile, width), min(y0 + tile, height))
+            for y0 in tile_starts(height, tile, step)
+            for x0 in tile_starts(width, tile, step)]
+
+def merge_tiles(detections, threshold=0.5):
+    """Greedy merge of overlapping same-class detections from different tiles
+
+    A player on a tile seam comes back twice: cut off by one tile, whole
+    in the next (or in the full-frame slot). Their IoU can be well below
+    any NMS threshold, but the cut-off box lies inside the whole one. So,
+    highest confidence first, each box absorbs the same-class boxes it
+    overlaps by more than `threshold` of the smaller box, and the result
+    covers all of them (SAHI's greedy NMM) with the best box's confidence.
+    """
+    if len(detections) == 0:
+        return detections
+    order = np.argsort(-detections.conf, kind='stable')
+    xyxy, conf, cls = detections.xyxy[order], detections.conf[order], detections.cls[order]
+    overlap = (box_ios(xyxy, xyxy) > threshold) & (cls[:, None] == cls[None, :])
+    merged = np.zeros(len(order), dtype=bool)
+    boxes, keep = [], []
+    for i in range(len(order)):
+        if merged[i]:
+            continue
+        group = np.flatnonzero(overlap[i] & ~merged)
+        merged[group] = True
+        boxes.append(np.concatenate([xyxy[group, :2].min(axis=0), xyxy[group, 2:].max(axis=0)]))
+        keep.append(i)
+    return Detections(np.array(boxes, dtype=xyxy.dtype), conf[keep], cls[keep])
+
+class TiledDetector:
+    """Runs an Ultralytics model over overlapping tiles in batched passes
+
+    Tiles are cropped at native resolution and normalized straight into one
+    reused (batch, 3, tile, tile) tensor, so each frame costs
+    ceil(tiles / batch) model calls rather than one per tile. With
+    full_frame=True a letterboxed view of the whole frame rides along in
+    the same batch to catch players larger than a tile. Detections from
+    all of them are combined by merge_tiles().
+    """
+
+    def __init__(self, model, tile=640, overlap=0.2, batch=8, full_frame=True,
+                 merge_threshold=0.5, stride=32, **predict_kwargs):
+        self.model = model
+        self.tile = max(stride, int(round(tile / stride)) * stride)
+        self.overlap = overlap
+        self.batch = max(1, batch)
+        self.full_frame = full_frame
+        self.merge_threshold = merge_threshold
+        predict_kwargs.pop('imgsz', None)
+        predict_kwargs.setdefault('verbose', False)
+        self.predict_kwargs = predict_kwargs
+        self._letterbox = Letterbox(self.tile)
+        self._tensor = None
+        self._windows = None
+        self._frame_shape = None
+        self.frames = 0
+        self.latencies = deque(maxlen=1000)
+
+    def _prepare(self, height, width):
+        self._windows = tile_windows(width, height, self.tile, self.overlap)
+        slots = min(self.batch, len(self._windows) + int(self.full_frame))
+        self._tensor = np.empty((slots, 3, self.tile, self.tile), dtype=np.float32)
+        self._frame_shape = (height, width)
+
+    @property
+    def tiles_per_frame(self):
+        return len(self._windows) if self._windows else 0
+
+    @property
+    def passes_per_frame(self):
+        jobs = self.tiles_per_frame + int(self.full_frame)
+        return -(-jobs // len(self._tensor)) if self._tensor is not None else 0
+
+    def _fill(self, slot, frame, window):
+        """Normalize one tile (BGR(A) -> RGB CHW 0..1) into a batch slot"""
+        x0, y0, x1, y1 = window
+        target = self._tensor[slot]
+        if (x1 - x0, y1 - y0) != (self.tile, self.tile):
+            # Frame smaller than a tile: pad like the letterbox does
+            target.fill(114 / 255.0)
+            target = target[:, :y1 - y0, :x1 - x0]
+        crop = frame[y0:y1, x0:x1]
+        np.multiply(crop[..., 2::-1].transpose(2, 0, 1), np.float32(1.0 / 255.0),
+                    out=target, casting='unsafe')
+
+    def __call__(self, frame):
+        """Detect on one BGR or BGRA frame; returns merged Detections"""
+        start = time.perf_counter()
+        merged = self._detect(frame)
+        self.frames += 1
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return merged
+
+    def _detect(self, frame):
+        import torch
+
+        height, width = frame.shape[:2]
+        if (height, width) != self._frame_shape:
+            self._prepare(height, width)
+
+        # Work items: tile windows, plus the letterboxed full frame
+        jobs = list(self._windows)
+        if self.full_frame:
+            jobs.append(None)
+
+        parts = []
+        slots = len(self._tensor)
+        for begin in range(0, len(jobs), slots):
+            chunk = jobs[begin:begin + slots]
+            meta = None
+            for slot, window in enumerate(chunk):
+                if window is None:
+                    tensor, meta = self._letterbox(frame)
+                    self._tensor[slot] = tensor[0]
+                else:
+                    self._fill(slot, frame, window)
+
+            results = self.model(torch.from_numpy(self._tensor[:len(chunk)]), **self.predict_kwargs)
+
+            for window, result in zip(chunk, results):
+                detections = Detections.from_ultralytics(result)
+                if window is None:
+                    scale_boxes(detections.xyxy, meta)
+                    parts.append(detections)
+                else:
+                    parts.append(detections.offset(window[0], window[1]))
+
+        return merge_tiles(Detections.concat(parts), self.merge_threshold)
+
+    def compare_with_single_pass(self, frame, imgsz=640, runs=5):
+        """Mean latency (ms) of tiled vs one regular full-frame pass on a frame"""
+        from frame_pool import as_bgr
+
+        bgr = as_bgr(frame)
+        tiled, single = [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            self._detect(frame)
+            tiled.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            self.model(bgr, imgsz=imgsz, **self.predict_kwargs)
+            single.append(time.perf_counter() - start)
+        return np.mean(tiled) * 1000, np.mean(single) * 1000
+
+    def stats(self):
+        """Snapshot of tiling counters"""
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'frames': self.frames,
+            'tiles_per_frame': self.tiles_per_frame,
+            'passes_per_frame': self.passes_per_frame,
+            'mean_ms': float(latencies.mean()),
+            'p95_ms': float(np.percentile(latencies, 95)),
+        }
+
+def format_tile_stats(tiler):
+    """One-line summary of tiled inference for console output"""
+    stats = tiler.stats()
+    return (f"Tiles: {stats['tiles_per_frame']}/frame, "
+            f"{stats['passes_per_frame']} passes/frame, "
+            f"{stats['mean_ms']:.1f}ms mean, {stats['p95_ms']:.1f}ms p95")
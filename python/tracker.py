@@ -0,0 +1,324 @@
+"""
+Detect-every-N-frames tracking
+A vectorized constant-velocity Kalman tracker with IoU association carries
+boxes (and stable track IDs) across the frames between model passes, and a
+scheduler picks how often the model has to run from the measured motion
+"""
+import numpy as np
+
+from detections import Detections
+
+# State: [cx, cy, w, h, vx, vy, vw, vh], measurement: [cx, cy, w, h]
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8)
+
+def iou_matrix(a, b):
+    """(N, M) IoU between two sets of xyxy boxes"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def greedy_match(scores, threshold):
+    """Greedy one-to-one assignment, best-scoring pairs first
+
+    Returns (rows, cols) index arrays of the matched pairs scoring at
+    least `threshold`.
+    """
+    rows, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows = np.zeros(scores.shape[0], dtype=bool)
+    used_cols = np.zeros(scores.shape[1], dtype=bool)
+    matched = []
+    for i in order:
+        row, col = rows[i], cols[i]
+        if not used_rows[row] and not used_cols[col]:
+            used_rows[row] = used_cols[col] = True
+            matched.append(i)
+    matched = np.array(matched, dtype=np.intp)
+    return rows[matched], cols[matched]
+
+def xyxy_to_cxcywh(boxes):
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.concatenate([boxes[:, :2] + wh / 2, wh], axis=1)
+
+def cxcywh_to_xyxy(boxes):
+    half = boxes[:, 2:4] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+def _diagonal(std):
+    """Stack of diagonal covariance matrices from (N, D) standard deviations"""
+    cov = np.zeros(std.shape + (std.shape[1],))
+    index = np.arange(std.shape[1])
+    cov[:, index, index] = std ** 2
+    return cov
+
+class KalmanBoxTracker:
+    """Multi-object tracker with all tracks held in stacked NumPy arrays
+
+    Every track is a constant-velocity Kalman filter over box centre and
+    size; predict and correct run for all tracks at once. Detections are
+    associated by IoU (never across classes) with greedy matching. Tracks
+    that miss a detection pass are hidden but kept for `max_misses` passes
+    so a briefly occluded player gets its old ID back. Reported confidence
+    is the last detection's, scaled down as the filter's position variance
+    grows past its value at that match: by exp(-1/2) once the added
+    variance reaches (`conf_sigma` box heights)^2. A fresh track with an
+    unknown velocity loses confidence within a few frames; a steady one
+    barely does. Noise scales with box height, as in SORT / DeepSORT.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, conf_sigma=0.25,
+                 pos_noise=1 / 20, vel_noise=1 / 160):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.conf_sigma = conf_sigma
+        self.pos_noise = pos_noise
+        self.vel_noise = vel_noise
+        self._next_id = 1
+        self.reset()
+
+    def reset(self):
+        """Drop all tracks (IDs keep counting up)"""
+        self._mean = np.zeros((0, 8))
+        self._cov = np.zeros((0, 8, 8))
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._cls = np.zeros(0, dtype=np.int32)
+        self._conf = np.zeros(0, dtype=np.float32)
+        self._matched_var = np.zeros(0)
+        self._hits = np.zeros(0, dtype=np.int32)
+        self._misses = np.zeros(0, dtype=np.int32)
+        self._since = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def active(self):
+        """Mask of tracks matched on the latest detection pass"""
+        return self._misses == 0
+
+    @property
+    def ids_issued(self):
+        return self._next_id - 1
+
+    def _heights(self):
+        return np.maximum(self._mean[:, 3], 1.0)
+
+    def _position_var(self):
+        """Per-track variance of the box centre, averaged over x and y"""
+        return (self._cov[:, 0, 0] + self._cov[:, 1, 1]) / 2
+
+    def predict(self):
+        """Advance every track by one frame"""
+        if not len(self):
+            return
+        height = self._heights()[:, None]
+        noise = _diagonal(np.hstack([np.repeat(self.pos_noise * height, 4, axis=1),
+                                     np.repeat(self.vel_noise * height, 4, axis=1)]))
+        self._mean = self._mean @ _F.T
+        self._cov = _F @ self._cov @ _F.T + noise
+        # A fast-shrinking box must not invert
+        np.maximum(self._mean[:, 2:4], 1.0, out=self._mean[:, 2:4])
+        self._since += 1
+
+    def update(self, detections):
+        """Advance one frame and correct the tracks with fresh detections"""
+        self.predict()
+        boxes = detections.xyxy.astype(np.float64)
+        scores = iou_matrix(self.boxes(), boxes)
+        # CT vs T and body vs head boxes overlap; never swap them
+        scores[self._cls[:, None] != detections.cls[None, :]] = 0
+        rows, cols = greedy_match(scores, self.iou_threshold)
+
+        if len(rows):
+            self._correct(rows, boxes[cols])
+            self._conf[rows] = detections.conf[cols]
+            self._matched_var[rows] = self._position_var()[rows]
+            self._hits[rows] += 1
+            self._since[rows] = 0
+
+        missed = np.ones(len(self), dtype=bool)
+        missed[rows] = False
+        self._misses[missed] += 1
+        self._misses[rows] = 0
+        self._keep(self._misses <= self.max_misses)
+
+        new = np.ones(len(detections), dtype=bool)
+        new[cols] = False
+        self._spawn(boxes[new], detections.conf[new], detections.cls[new])
+
+    def _correct(self, rows, measured):
+        """Batched Kalman update of the given tracks with xyxy measurements"""
+        mean, cov = self._mean[rows], self._cov[rows]
+        height = np.maximum(mean[:, 3:4], 1.0)
+        innovation_cov = _H @ cov @ _H.T + _diagonal(np.repeat(self.pos_noise * height, 4, axis=1))
+        # K = P H^T S^-1, solved as S K^T = H P (S and P are symmetric)
+        gain = np.linalg.solve(innovation_cov, _H @ cov).transpose(0, 2, 1)
+        innovation = xyxy_to_cxcywh(measured) - mean @ _H.T
+        self._mean[rows] = mean + np.einsum('nij,nj->ni', gain, innovation)
+        self._cov[rows] = cov - gain @ _H @ cov
+
+    def _spawn(self, boxes, conf, cls):
+        """Start new tracks for unmatched detections"""
+        count = len(boxes)
+        if count == 0:
+            return
+        mean = np.zeros((count, 8))
+        mean[:, :4] = xyxy_to_cxcywh(boxes)
+        height = np.maximum(mean[:, 3:4], 1.0)
+        cov = _diagonal(np.hstack([np.repeat(2 * self.pos_noise * height, 4, axis=1),
+                                   np.repeat(10 * self.vel_noise * height, 4, axis=1)]))
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._next_id += count
+
+        zeros = np.zeros(count, dtype=np.int32)
+        self._mean = np.concatenate([self._mean, mean])
+        self._cov = np.concatenate([self._cov, cov])
+        self._ids = np.concatenate([self._ids, ids])
+        self._cls = np.concatenate([self._cls, cls])
+        self._conf = np.concatenate([self._conf, conf])
+        self._matched_var = np.concatenate([self._matched_var, (cov[:, 0, 0] + cov[:, 1, 1]) / 2])
+        self._hits = np.concatenate([self._hits, zeros + 1])
+        self._misses = np.concatenate([self._misses, zeros])
+        self._since = np.concatenate([self._since, zeros])
+
+    def _keep(self, mask):
+        for name in ('_mean', '_cov', '_ids', '_cls', '_conf', '_matched_var', '_hits', '_misses',
+                     '_since'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def boxes(self):
+        """(N, 4) predicted xyxy boxes of all tracks, hidden ones included"""
+        return cxcywh_to_xyxy(self._mean[:, :4])
+
+    def confidences(self):
+        """Detection confidence scaled by the position uncertainty added since the last match"""
+        added = np.maximum(self._position_var() - self._matched_var, 0)
+        added /= (self.conf_sigma * self._heights()) ** 2
+        return self._conf * np.exp(-added / 2).astype(np.float32)
+
+    def detections(self):
+        """Visible tracks as Detections with track IDs"""
+        active = self.active
+        return Detections(self.boxes()[active], self.confidences()[active],
+                          self._cls[active], self._ids[active])
+
+    def motion(self):
+        """Fastest visible track speed, in box heights per frame"""
+        moving = self.active & (self._hits > 1)
+        if not moving.any():
+            return 0.0
+        speed = np.hypot(self._mean[moving, 4], self._mean[moving, 5])
+        return float((speed / self._heights()[moving]).max())
+
+    def min_confidence(self):
+        """Lowest propagated confidence among visible tracks (None if none)"""
+        active = self.active
+        if not active.any():
+            return None
+        return float(self.confidences()[active].min())
+
+class DetectionScheduler:
+    """Decides which frames get a full model pass
+
+    After each pass the interval grows by one frame while the fastest track
+    moves less than `low_motion` box heights per frame and halves once it
+    moves more than `high_motion`, within [min_interval, max_interval]. A
+    pass is also forced early as soon as a visible track's propagated
+    confidence falls below `min_conf`, e.g. a player that appeared at the
+    start of a long gap. With nothing tracked the interval
+    relaxes too, so a player entering the view is picked up within
+    `max_interval` frames.
+    """
+
+    def __init__(self, min_interval=1, max_interval=6, low_motion=0.02,
+                 high_motion=0.08, min_conf=0.25):
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.low_motion = low_motion
+        self.high_motion = high_motion
+        self.min_conf = min_conf
+        self.reset()
+        self.frames = 0
+        self.detect_frames = 0
+        self.forced = 0
+
+    def reset(self):
+        """Run the model on the next frame and restart adaptation"""
+        self.interval = self.min_interval
+        self._since_detect = self.max_interval
+
+    def due(self, tracker):
+        """True if the frame about to be processed needs a model pass"""
+        self.frames += 1
+        self._since_detect += 1
+        run = self._since_detect >= self.interval
+        if not run:
+            lowest = tracker.min_confidence()
+            run = lowest is not None and lowest < self.min_conf
+            self.forced += run
+        if run:
+            self.detect_frames += 1
+            self._since_detect = 0
+        return run
+
+    def adapt(self, motion):
+        """Update the interval from the motion measured after a pass"""
+        if motion > self.high_motion:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif motion < self.low_motion:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+class TrackingDetector:
+    """Runs detect_fn on scheduled frames and the tracker on the rest
+
+    detect_fn(frame) must return Detections in frame coordinates; the
+    returned Detections always carry track IDs.
+    """
+
+    def __init__(self, detect_fn, tracker=None, scheduler=None):
+        self.detect_fn = detect_fn
+        self.tracker = tracker or KalmanBoxTracker()
+        self.scheduler = scheduler or DetectionScheduler()
+        self._frame_shape = None
+
+    def __call__(self, frame):
+        if frame.shape[:2] != self._frame_shape:
+            # New resolution: old boxes no longer line up
+            self._frame_shape = frame.shape[:2]
+            self.reset()
+        if self.scheduler.due(self.tracker):
+            self.tracker.update(self.detect_fn(frame))
+            self.scheduler.adapt(self.tracker.motion())
+        else:
+            self.tracker.predict()
+        return self.tracker.detections()
+
+    def reset(self):
+        """Drop all tracks and detect on the next frame"""
+        self.tracker.reset()
+        self.scheduler.reset()
+
+    def stats(self):
+        """Snapshot of tracking counters"""
+        scheduler = self.scheduler
+        return {
+            'frames': scheduler.frames,
+            'detect_frames': scheduler.detect_frames,
+            'forced': scheduler.forced,
+            'interval': scheduler.interval,
+            'tracks': int(self.tracker.active.sum()),
+            'ids_issued': self.tracker.ids_issued,
+        }
+
+def format_track_stats(tracking):
+    """One-line summary of the tracker and detection schedule"""
+    stats = tracking.stats()
+    ratio = stats['detect_frames'] / stats['frames'] if stats['frames'] else 0.0
+    return (f"Tracks: {stats['tracks']} (IDs {stats['ids_issued']}), "
+            f"detect {stats['detect_frames']}/{stats['frames']} ({ratio:.0%}), "
+            f"every {stats['interval']}")
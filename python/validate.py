@@ -2,8 +2,9 @@
 Validate trained model on test set
 """
 import sys
-import yaml
+import argparse
 from pathlib import Path
+import cv2
 import supervision as sv
 
 # Add YOLOv12 to path
@@ -12,32 +13,30 @@ if yolov12_path.exists():
     sys.path.insert(0, str(yolov12_path))
 
 from ultralytics import YOLO
+from detections import Detections
+from image_batch import dataset_images
+from model_registry import ModelRegistry, RegistryError, resolve_weights
+from onnx_backend import BACKENDS, BackendError, OnnxDetector
+from postprocess import match_detections
+from result_cache import DEFAULT_PATH as CACHE_PATH, ResultCache, dataset_fingerprint, format_cache_stats, settings_namespace
 
-def load_config():
-    """Load configuration from config.yaml"""
-    with open('config.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
-
-def find_best_weights():
-    """Find the best trained model weights"""
-    config = load_config()
-    runs_dir = Path(config['paths']['runs']) / "detect"
-    
-    if not runs_dir.exists():
-        print("❌ No trained model found!")
-        return None
-    
-    train_dirs = sorted(runs_dir.glob("train*"))
-    if not train_dirs:
-        return None
-    
-    latest_run = train_dirs[-1]
-    best_weights = latest_run / "weights" / "best.pt"
-    
-    if best_weights.exists():
-        return str(best_weights)
-    
-    return None
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Validate the trained model on the test set")
+    parser.add_argument('--weights', metavar='PATH|latest',
+                        help="model to validate (default: latest run's best.pt); metrics are "
+                             "recorded in the model registry")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="onnx: validate the exported best.onnx and check the NumPy "
+                             "post-processing against Ultralytics on validation images")
+    parser.add_argument('--parity-images', type=int, default=50, metavar='N',
+                        help="with --backend onnx, validation images used for the parity check")
+    parser.add_argument('--cache', nargs='?', const=CACHE_PATH, metavar='PATH',
+                        help="reuse metrics when the weights and dataset are unchanged "
+                             f"(SQLite, default {CACHE_PATH})")
+    parser.add_argument('--cache-size', type=float, default=1024, metavar='MB',
+                        help="cache size limit; least recently used entries are evicted")
+    return parser.parse_args()
 
 def get_dataset_path():
     """Get dataset path"""
@@ -51,25 +50,63 @@ def get_dataset_path():
     
     return str(data_yamls[0])
 
+def run_validation(model, data_path, **val_args):
+    """Run Ultralytics validation and keep the metrics as plain numbers"""
+    results = model.val(data=data_path, **val_args)
+    return {
+        'map50': float(results.box.map50),
+        'map': float(results.box.map),
+        'precision': float(results.box.mp),
+        'recall': float(results.box.mr),
+        'per_class': [[name, float(ap)] for name, ap in zip(results.names.values(), results.box.ap)],
+    }
+
+def check_postprocess_parity(model, weights_path, data_path, samples=50):
+    """Compare the ONNX backend's NumPy post-processing with Ultralytics' on validation images
+
+    Both run the same .onnx at predict defaults (conf 0.25, IoU 0.7); only
+    letterboxing, decoding and NMS differ. Returns (matched boxes, total
+    boxes, identical images, images).
+    """
+    detector = OnnxDetector(weights_path)
+    matched = total = identical = images = 0
+    for path in dataset_images(data_path, 'val')[:samples]:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        ours = detector.detect(image)
+        theirs = Detections.from_ultralytics(model(image, verbose=False)[0])
+        pairs = min(match_detections(ours, theirs), match_detections(theirs, ours))
+        matched += pairs
+        total += max(len(ours), len(theirs))
+        identical += pairs == len(ours) == len(theirs)
+        images += 1
+    return matched, total, identical, images
+
 def validate_model():
     """Validate model on test set"""
+    args = parse_args()
+    
     print("=" * 70)
     print("YOLOv12 Model Validation")
     print("=" * 70)
     print()
     
     # Find model
-    weights_path = find_best_weights()
+    fmt = 'onnx' if args.backend == 'onnx' else 'pt'
+    try:
+        weights_path = resolve_weights(args.weights, fmt)
+    except RegistryError as e:
+        print(f"❌ {e}")
+        return
     if not weights_path:
         print("❌ No trained model found!")
-        print("   Please train a model first: python train.py")
+        if fmt == 'onnx':
+            print("   Please export one first: python export_model.py (ONNX)")
+        else:
+            print("   Please train a model first: python train.py")
         return
     
-    print(f"🤖 Loading model: {weights_path}")
-    model = YOLO(weights_path)
-    print("✅ Model loaded successfully!")
-    print()
-    
     # Get dataset
     data_path = get_dataset_path()
     if not data_path:
@@ -79,11 +116,32 @@ def validate_model():
     print(f"📊 Dataset: {data_path}")
     print()
     
-    # Validate
-    print("🔍 Running validation...")
-    print()
-    
-    results = model.val(data=data_path)
+    # Unchanged weights + dataset files -> the previous run's metrics
+    cache = namespace = metrics = None
+    if args.cache:
+        cache = ResultCache(args.cache, int(args.cache_size * 1024 * 1024)).open()
+        namespace = settings_namespace(cache.file_digest(weights_path), task='val',
+                                       data=cache.file_digest(data_path),
+                                       files=dataset_fingerprint(Path(data_path).parent))
+        metrics = cache.get_json(namespace, 'metrics')
+    
+    model = None
+    if metrics is not None:
+        print("♻️  Weights and dataset unchanged: using cached validation metrics")
+    else:
+        print(f"🤖 Loading model: {weights_path}")
+        model = YOLO(weights_path, task='detect')
+        print("✅ Model loaded successfully!")
+        print()
+        
+        # Validate
+        print("🔍 Running validation...")
+        print()
+        
+        metrics = run_validation(model, data_path)
+        if cache is not None:
+            cache.put_json(namespace, 'metrics', metrics)
+        ModelRegistry.from_config().record_metrics(weights_path, dict(metrics, data=data_path))
     
     print()
     print("=" * 70)
@@ -93,17 +151,36 @@ def validate_model():
     
     # Print metrics
     print(f"📈 Metrics:")
-    print(f"   mAP50: {results.box.map50:.4f}")
-    print(f"   mAP50-95: {results.box.map:.4f}")
-    print(f"   Precision: {results.box.mp:.4f}")
-    print(f"   Recall: {results.box.mr:.4f}")
+    print(f"   mAP50: {metrics['map50']:.4f}")
+    print(f"   mAP50-95: {metrics['map']:.4f}")
+    print(f"   Precision: {metrics['precision']:.4f}")
+    print(f"   Recall: {metrics['recall']:.4f}")
     print()
     
     # Per-class metrics
     print(f"📊 Per-Class Metrics:")
-    for i, (name, ap) in enumerate(zip(results.names.values(), results.box.ap)):
+    for name, ap in metrics['per_class']:
         print(f"   {name}: AP={ap:.4f}")
     print()
+    
+    if args.backend == 'onnx' and args.parity_images > 0:
+        # The deployed ONNX backend decodes and suppresses boxes in NumPy
+        if model is None:
+            model = YOLO(weights_path, task='detect')
+        try:
+            matched, total, identical, images = check_postprocess_parity(
+                model, weights_path, data_path, args.parity_images)
+        except BackendError as e:
+            print(f"⚠️  Parity check skipped: {e}")
+        else:
+            status = '✅' if matched == total else '⚠️ '
+            print(f"{status} NumPy post-processing vs Ultralytics: {matched}/{total} boxes match, "
+                  f"{identical}/{images} validation images identical")
+            print()
+    
+    if cache is not None:
+        print(f"   {format_cache_stats(cache)}")
+        cache.close()
 
 if __name__ == "__main__":
     validate_model()
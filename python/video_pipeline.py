@@ -0,0 +1,237 @@
+"""
+Pipelined offline video processing
+A decoder thread prefetches frames into a bounded queue, the model runs on
+batches of frames and an encoder thread annotates and writes the output,
+so decode, inference and encode overlap and throughput is set by the model
+"""
+import threading
+import time
+
+import numpy as np
+
+from frame_pool import FramePool
+from pipeline import LatestQueue, QueueClosed, StageWorker
+from preprocess import Letterbox, restore_boxes
+from tracing import NULL_TRACER
+
+class BatchedDetector:
+    """Runs an Ultralytics model on several frames per forward pass
+
+    prepare() runs on the decoder thread: with fused=True every frame is
+    letterboxed straight into one pooled (batch, 3, imgsz, imgsz) tensor,
+    so the inference thread only launches the model. Without it the frames
+    are passed to the model as a list and Ultralytics preprocesses them.
+    Calling the detector returns one Results per frame, boxes in frame
+    pixels.
+    """
+
+    def __init__(self, model, imgsz=640, batch=8, fused=True, buffers=4, **predict_kwargs):
+        self.model = model
+        self.imgsz = imgsz
+        self.batch = max(1, batch)
+        self.fused = fused
+        self.predict_kwargs = predict_kwargs
+        self._letterbox = Letterbox(imgsz) if fused else None
+        self._pool = FramePool(count=buffers, dtype=np.float32, name="batch")
+
+    def prepare(self, frames):
+        """Batch input for the frames: (tensor, metas) when fused, else None"""
+        if not self.fused:
+            return None
+        tensor = None
+        metas = []
+        for i, frame in enumerate(frames):
+            single, meta = self._letterbox(frame)
+            if tensor is None:
+                tensor = self._pool.acquire((self.batch,) + single.shape[1:])
+            tensor[i] = single[0]
+            metas.append(meta)
+        return tensor, metas
+
+    def __call__(self, frames, inputs=None):
+        if inputs is None:
+            return self.model(list(frames), imgsz=self.imgsz, verbose=False, **self.predict_kwargs)
+        import torch
+
+        tensor, metas = inputs
+        try:
+            results = self.model(torch.from_numpy(tensor[:len(frames)]), verbose=False,
+                                 **self.predict_kwargs)
+            for result, meta in zip(results, metas):
+                restore_boxes([result], meta)
+            return results
+        finally:
+            self._pool.release(tensor)
+
+class VideoPipeline:
+    """Decode -> batched detect -> encode, one thread per stage, in frame order
+
+    The decoder reads `batch` frames at a time, runs prepare(frames) on
+    them (e.g. letterboxing) and queues the batch; up to `prefetch` batches
+    wait ahead of the model. detect(frames, inputs) must return one result
+    per frame. Finished frames go to sink(index, frame, result) on the
+    encoder thread, or, with sink=None, are read on the calling thread via
+    results() (for cv2.imshow, which must stay on the main thread). Queues
+    block instead of dropping, so every frame is processed, and with a
+    single thread per stage frames leave in the order they were decoded.
+    """
+
+    def __init__(self, capture, detect, batch=8, prefetch=4, prepare=None, sink=None,
+                 tracer=NULL_TRACER):
+        self.capture = capture
+        self.detect = detect
+        self.batch = max(1, batch)
+        self.prepare = prepare
+        self.sink = sink
+        self.tracer = tracer
+        self._decoded = LatestQueue(maxsize=max(1, prefetch), name="decoded")
+        self._detected = LatestQueue(maxsize=max(1, prefetch), name="detected")
+        self._stop = threading.Event()
+        self._threads = []
+        self._next_index = 0
+        self.frames = 0
+        self.batches = 0
+        self.decode_time = 0.0
+        self.detect_time = 0.0
+        self.encode_time = 0.0
+        self.started = 0.0
+        self.finished = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._threads = [
+            StageWorker("decode", self._decode_step, self._stop, output=self._decoded),
+            StageWorker("detect", self._detect_step, self._stop, output=self._detected),
+        ]
+        if self.sink is not None:
+            self._threads.append(StageWorker("encode", self._encode_step, self._stop))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    # Stages
+
+    def _decode_step(self):
+        frames = []
+        start = time.perf_counter()
+        while len(frames) < self.batch:
+            frame_start = time.perf_counter()
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+            self.tracer.add('decode', frame_start, time.perf_counter(),
+                            self._next_index + len(frames))
+            frames.append(frame)
+        if frames:
+            inputs = None
+            if self.prepare is not None:
+                with self.tracer.span('prepare', self._next_index):
+                    inputs = self.prepare(frames)
+            self.decode_time += time.perf_counter() - start
+            self._decoded.put((self._next_index, frames, inputs), block=True)
+            self._next_index += len(frames)
+        # A short batch means the video has ended
+        return len(frames) == self.batch
+
+    def _detect_step(self):
+        item = self._decoded.get(timeout=0.1)
+        if item is None:
+            return True
+        first, frames, inputs = item
+        start = time.perf_counter()
+        results = self.detect(frames, inputs)
+        end = time.perf_counter()
+        self.tracer.add('detect', start, end, first)
+        if len(results) != len(frames):
+            raise RuntimeError(f"detect returned {len(results)} results for {len(frames)} frames")
+        self.detect_time += end - start
+        self.batches += 1
+        self._detected.put((first, frames, results), block=True)
+        return True
+
+    def _encode_step(self):
+        item = self._detected.get(timeout=0.1)
+        if item is None:
+            return True
+        start = time.perf_counter()
+        for index, frame, result in self._items(item):
+            self.sink(index, frame, result)
+        self.encode_time += time.perf_counter() - start
+        return True
+
+    def _items(self, item):
+        first, frames, results = item
+        for offset, (frame, result) in enumerate(zip(frames, results)):
+            self.frames += 1
+            yield first + offset, frame, result
+
+    # Caller side
+
+    def results(self):
+        """Yield (index, frame, result) in order on the calling thread (sink=None)"""
+        try:
+            while not self._stop.is_set():
+                item = self._detected.get(timeout=0.1)
+                if item is not None:
+                    yield from self._items(item)
+        except QueueClosed:
+            pass
+        self.finished = time.perf_counter()
+
+    def wait(self, progress=None, interval=0.5):
+        """Block until every frame is written; progress(pipeline) is called periodically"""
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(interval)
+                if progress is not None:
+                    progress(self)
+                if self._stop.is_set():
+                    # A stage failed: unblock the others instead of waiting on full queues
+                    self.close()
+        self.finished = time.perf_counter()
+        return self.error is None
+
+    def close(self, timeout=5.0):
+        """Stop early (e.g. user quit): stages finish their current batch and exit"""
+        self._stop.set()
+        self._decoded.close()
+        self._detected.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self.finished = self.finished or time.perf_counter()
+
+    @property
+    def error(self):
+        """Exception that stopped a stage, if any"""
+        for thread in self._threads:
+            if thread.error is not None:
+                return thread.error
+        return None
+
+    def stats(self):
+        """Snapshot of throughput and per-stage busy time"""
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        frames = max(1, self.frames)
+        return {
+            'frames': self.frames,
+            'batches': self.batches,
+            'mean_batch': self.frames / self.batches if self.batches else 0.0,
+            'elapsed_s': elapsed,
+            'fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'decode_ms': self.decode_time * 1000 / frames,
+            'detect_ms': self.detect_time * 1000 / frames,
+            'encode_ms': self.encode_time * 1000 / frames,
+            'queued': self._decoded.depth + self._detected.depth,
+        }
+
+def format_video_pipeline_stats(pipeline):
+    """One-line summary of pipelined video throughput for console output"""
+    stats = pipeline.stats()
+    stages = {'decode': stats['decode_ms'], 'detect': stats['detect_ms'],
+              'encode': stats['encode_ms']}
+    bottleneck = max(stages, key=stages.get)
+    return (f"{stats['frames']} frames in {stats['elapsed_s']:.1f}s ({stats['fps']:.1f} FPS), "
+            f"batch {stats['mean_batch']:.1f} | per frame: decode {stats['decode_ms']:.1f}ms, "
+            f"detect {stats['detect_ms']:.1f}ms, encode {stats['encode_ms']:.1f}ms "
+            f"(bound by {bottleneck})")
@@ -0,0 +1,248 @@
+"""
+Parallel segment processing for long recordings
+Splits a video at keyframes into one time segment per worker process, runs
+each segment through the pipelined batched detector with its own model
+and thread budget, then stitches the annotated segments and detections
+back together in order
+"""
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+
+import cv2
+
+from result_sink import ResultSink, read_results
+
+class SegmentError(Exception):
+    """Raised when a video cannot be split, processed or merged"""
+
+def keyframe_times(path, timeout=120):
+    """Keyframe timestamps (seconds) from ffprobe, or None if unavailable"""
+    if shutil.which('ffprobe') is None:
+        return None
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+           '-show_entries', 'frame=pts_time,best_effort_timestamp_time', '-of', 'json', str(path)]
+    try:
+        output = subprocess.run(cmd, capture_output=True, timeout=timeout, check=True).stdout
+        frames = json.loads(output).get('frames', [])
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+    times = []
+    for frame in frames:
+        value = frame.get('pts_time', frame.get('best_effort_timestamp_time'))
+        if value not in (None, 'N/A'):
+            times.append(float(value))
+    return sorted(times) or None
+
+def plan_segments(total_frames, count, fps=30.0, keyframes=None):
+    """Split [0, total_frames) into about `count` (start, end) frame ranges
+
+    Cuts are spread evenly and, when keyframe times are known, moved to the
+    nearest keyframe so every worker's first seek lands on a decodable frame
+    and no frames are decoded twice.
+    """
+    count = max(1, min(count, total_frames))
+    cuts = [round(total_frames * i / count) for i in range(1, count)]
+    if keyframes:
+        key_frames = sorted({int(round(t * fps)) for t in keyframes})
+        cuts = [min(key_frames, key=lambda k: abs(k - cut)) for cut in cuts]
+    bounds = [0] + sorted({cut for cut in cuts if 0 < cut < total_frames}) + [total_frames]
+    return [(start, end) for start, end in zip(bounds, bounds[1:])]
+
+class SegmentCapture:
+    """cv2.VideoCapture limited to frames [start, end)"""
+
+    def __init__(self, path, start, end):
+        self.cap = cv2.VideoCapture(str(path))
+        if not self.cap.isOpened():
+            raise SegmentError(f"Could not open video: {path}")
+        if start:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        self.remaining = end - start
+
+    def read(self):
+        if self.remaining <= 0:
+            return False, None
+        ret, frame = self.cap.read()
+        if ret:
+            self.remaining -= 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+def process_segment(job):
+    """Worker process entry: detect (and annotate) one segment; returns its stats"""
+    threads = job['threads']
+    # Before torch is imported, so its OpenMP pool is sized to the budget too
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    cv2.setNumThreads(threads)
+    import torch
+    from ultralytics import YOLO
+
+    from detections import Detections
+    from video_pipeline import BatchedDetector, VideoPipeline
+
+    torch.set_num_threads(threads)
+    started = time.perf_counter()
+    model = YOLO(job['weights'])
+    load_s = time.perf_counter() - started
+
+    start, end = job['start'], job['end']
+    capture = SegmentCapture(job['source'], start, end)
+    detector = BatchedDetector(model, job['imgsz'], job['batch'], fused=job['fused'],
+                               buffers=job['prefetch'] + 2)
+    sink = ResultSink(job['results'], 'binary', header={'source': str(job['source']),
+                                                        'start': start, 'end': end}).open()
+    writer = None
+    annotators = None
+    if job['video']:
+        import supervision as sv
+
+        writer = cv2.VideoWriter(job['video'], cv2.VideoWriter_fourcc(*'mp4v'), job['fps'],
+                                 (job['width'], job['height']))
+        if not writer.isOpened():
+            raise SegmentError(f"Cannot open video writer for {job['video']}")
+        annotators = (sv.BoundingBoxAnnotator(), sv.LabelAnnotator())
+
+    def detect(frames, inputs):
+        return [Detections.from_ultralytics(result) for result in detector(frames, inputs)]
+
+    def sink_frame(offset, frame, detections):
+        index = start + offset
+        sink.write(index, index / job['fps'], detections, block=True)
+        if writer is not None:
+            shown = detections.to_supervision(model.names)
+            frame = annotators[0].annotate(scene=frame, detections=shown)
+            writer.write(annotators[1].annotate(scene=frame, detections=shown))
+
+    pipeline = VideoPipeline(capture, detect, job['batch'], job['prefetch'], detector.prepare,
+                             sink=sink_frame).start()
+    try:
+        pipeline.wait()
+    finally:
+        pipeline.close()
+        capture.release()
+        sink.close()
+        if writer is not None:
+            writer.release()
+    if pipeline.error is not None:
+        raise SegmentError(f"Segment {job['index'] + 1} failed: {pipeline.error}")
+
+    stats = pipeline.stats()
+    stats.update(index=job['index'], pid=os.getpid(), start=start, end=end, load_s=load_s,
+                 expected=end - start)
+    return stats
+
+def merge_results(parts, target, fmt='ndjson', header=None):
+    """Concatenate per-segment result files into one stream; returns the record count"""
+    with ResultSink(target, fmt, header=header, queue_size=4096) as sink:
+        for part in parts:
+            with open(part, 'rb') as f:
+                _, records = read_results(f)
+                for frame_index, timestamp, detections in records:
+                    sink.write(frame_index, timestamp, detections, block=True)
+    return sink.records
+
+def merge_videos(parts, output, fps, size):
+    """Join annotated segments: stream copy with ffmpeg if present, else re-encode"""
+    if shutil.which('ffmpeg') is not None:
+        listing = Path(parts[0]).with_name('segments.txt')
+        listing.write_text(''.join(f"file '{Path(p).resolve().as_posix()}'\n" for p in parts))
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', str(listing),
+               '-c', 'copy', str(output)]
+        if subprocess.run(cmd).returncode == 0:
+            return 'ffmpeg'
+    writer = cv2.VideoWriter(str(output), cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    if not writer.isOpened():
+        raise SegmentError(f"Cannot open video writer for {output}")
+    try:
+        for part in parts:
+            cap = cv2.VideoCapture(str(part))
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                writer.write(frame)
+            cap.release()
+    finally:
+        writer.release()
+    return 'opencv'
+
+def run_segments(source, weights, workers, output=None, results=None, threads=None, imgsz=640,
+                 batch=8, prefetch=4, fused=True, results_format='ndjson'):
+    """Process a video file in parallel segments; returns per-segment stats in order"""
+    source = Path(source)
+    cap = cv2.VideoCapture(str(source))
+    if not cap.isOpened():
+        raise SegmentError(f"Could not open video: {source}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total_frames <= 0:
+        raise SegmentError(f"Frame count unknown for {source}; cannot split it")
+
+    keyframes = keyframe_times(source)
+    segments = plan_segments(total_frames, workers, fps, keyframes)
+    threads = threads or max(1, (os.cpu_count() or 1) // len(segments))
+    print(f"   Resolution: {width}x{height} | FPS: {fps:.2f} | Total Frames: {total_frames}")
+    print(f"   {len(segments)} segments cut at "
+          f"{'keyframes (ffprobe)' if keyframes else 'even intervals (no ffprobe)'}, "
+          f"{threads} thread(s) per worker")
+
+    work_dir = Path(output or results or source).parent / f".{source.stem}_segments"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for index, (start, end) in enumerate(segments):
+        jobs.append({
+            'index': index, 'source': str(source), 'start': start, 'end': end,
+            'weights': weights, 'imgsz': imgsz, 'batch': batch, 'prefetch': prefetch,
+            'fused': fused, 'threads': threads, 'fps': fps, 'width': width, 'height': height,
+            'results': str(work_dir / f"segment_{index:03d}.bin"),
+            'video': str(work_dir / f"segment_{index:03d}.mp4") if output else None,
+        })
+
+    stats = [None] * len(jobs)
+    started = time.perf_counter()
+    # spawn: CUDA and OpenCV's threads do not survive fork
+    with ProcessPoolExecutor(len(jobs), mp_context=get_context('spawn')) as pool:
+        futures = {pool.submit(process_segment, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except SegmentError:
+                raise
+            except Exception as e:
+                raise SegmentError(f"Segment {job['index'] + 1} failed: {e}") from e
+            stats[job['index']] = result
+            print(f"   Segment {job['index'] + 1}/{len(jobs)} (frames {job['start']}-{job['end']}): "
+                  f"{result['frames']} frames in {result['elapsed_s']:.1f}s "
+                  f"({result['fps']:.1f} FPS, model load {result['load_s']:.1f}s)")
+    elapsed = time.perf_counter() - started
+
+    short = [s for s in stats if s['frames'] != s['expected']]
+    if short:
+        print(f"   ⚠️  {len(short)} segment(s) decoded fewer frames than expected "
+              f"(e.g. segment {short[0]['index'] + 1}: {short[0]['frames']}/{short[0]['expected']})")
+
+    if results:
+        records = merge_results([job['results'] for job in jobs], results, results_format,
+                                header={'source': str(source), 'fps': fps})
+        print(f"✅ Detections saved to: {results} ({records} frames)")
+    if output:
+        method = merge_videos([job['video'] for job in jobs], output, fps, (width, height))
+        print(f"✅ Saved to: {output} (merged with {method})")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    frames = sum(s['frames'] for s in stats)
+    print(f"   Total: {frames} frames in {elapsed:.1f}s ({frames / elapsed:.1f} FPS, "
+          f"{len(jobs)} workers, mean {frames / elapsed / len(jobs):.1f} FPS per worker)")
+    return stats
@@ -0,0 +1,8 @@
+"""
+Shared test setup: the modules under test live in python/ and import each
+other by bare name, as the scripts do
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "python"))
@@ -0,0 +1,60 @@
+"""
+Frame-change gate: skips static frames, never a small moving player
+"""
+import numpy as np
+import pytest
+
+from change_gate import FrameChangeGate
+
+def noisy_background(seed=0, size=(1440, 2560)):
+    rng = np.random.default_rng(seed)
+    return rng.integers(60, 120, size + (3,), dtype=np.uint8)
+
+def noise_frames(shape, count=4, amplitude=3, seed=1):
+    """Codec-like noise of a few grey levels on every pixel, as int16 offsets"""
+    rng = np.random.default_rng(seed)
+    return [rng.integers(-amplitude, amplitude + 1, shape).astype(np.int16) for _ in range(count)]
+
+def with_noise(frame, noise):
+    return (frame + noise).clip(0, 255).astype(np.uint8)
+
+def test_small_moving_player_is_never_skipped():
+    background = noisy_background()
+    noise = noise_frames(background.shape)
+    gate = FrameChangeGate(threshold=2.0, max_skip=1000)
+    inferred = 0
+    for i in range(60):
+        frame = background.copy()
+        # A 12x24 px player crossing 590 px in 60 frames (~10 px per frame)
+        x = 1000 + i * 10
+        frame[700:724, x:x + 12] = (30, 40, 200)
+        inferred += gate.should_infer(with_noise(frame, noise[i % len(noise)]))
+    assert inferred == 60
+
+def test_static_frames_are_skipped_until_max_skip():
+    background = noisy_background()
+    noise = noise_frames(background.shape)
+    gate = FrameChangeGate(threshold=2.0, max_skip=10)
+    decisions = [gate.should_infer(with_noise(background, noise[i % len(noise)]))
+                 for i in range(23)]
+    # The first frame and every 11th after it (max_skip skipped frames in between)
+    assert [i for i, infer in enumerate(decisions) if infer] == [0, 11, 22]
+
+def test_reset_forces_the_next_frame():
+    frame = noisy_background()
+    gate = FrameChangeGate(threshold=2.0)
+    assert gate.should_infer(frame)
+    assert not gate.should_infer(frame)
+    gate.reset()
+    assert gate.should_infer(frame)
+    assert not gate.should_infer(frame)
+
+def test_sub_grey_level_changes_are_not_rounded_away():
+    frame = np.full((360, 640, 3), 100, dtype=np.uint8)
+    gate = FrameChangeGate(threshold=0.5)
+    assert gate.should_infer(frame)
+    changed = frame.copy()
+    # 48 of one block's 64 pixels up by one grey level: a block mean of 0.75
+    changed[0:6, 0:8] += 1
+    assert gate.should_infer(changed)
+    assert gate.last_score == pytest.approx(0.75)
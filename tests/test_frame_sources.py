@@ -0,0 +1,17 @@
+"""
+Frame source specs: bad command-line input is a SourceError, not a traceback
+"""
+import pytest
+
+from frame_sources import SourceError, SyntheticSource, open_source
+
+@pytest.mark.parametrize('spec', ['synthetic:abc', 'synthetic:1920', 'synthetic:1920x',
+                                  'synthetic:0x1080', 'synthetic:640x480@fast'])
+def test_malformed_synthetic_spec(spec):
+    with pytest.raises(SourceError):
+        open_source(spec)
+
+def test_synthetic_spec():
+    source = open_source('synthetic:320x240@30')
+    assert isinstance(source, SyntheticSource)
+    assert (source.width, source.height, source.fps) == (320, 240, 30)
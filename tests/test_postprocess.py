@@ -0,0 +1,110 @@
+"""
+NumPy decoding and NMS against a brute-force greedy reference (and torchvision, if installed)
+"""
+import numpy as np
+import pytest
+
+from postprocess import NMS_BLOCK, NMS_SWITCH, decode, nms, postprocess
+
+# Either side of the block size and of the switch to one-box steps
+COUNTS = [0, 1, 2, 5, NMS_BLOCK - 1, NMS_BLOCK, NMS_BLOCK + 1, 100, 500,
+          NMS_SWITCH - 1, NMS_SWITCH, NMS_SWITCH + 1, 6000]
+
+def crowded(count, seed=0, classes=4, imgsz=640):
+    """(xyxy, conf, cls) clusters of jittered boxes, ~20 candidates per object"""
+    rng = np.random.default_rng(seed)
+    objects = max(1, count // 20)
+    centers = rng.uniform(0, imgsz, (objects, 2))
+    sizes = rng.uniform(10, 160, (objects, 2))
+    owner = rng.integers(0, objects, count)
+    center = centers[owner] + rng.normal(0, 4, (count, 2))
+    size = sizes[owner] * rng.uniform(0.85, 1.15, (count, 2))
+    xyxy = np.concatenate([center - size / 2, center + size / 2], axis=1).astype(np.float32)
+    cls = rng.integers(0, classes, objects)[owner]
+    return xyxy, rng.uniform(0.25, 1.0, count).astype(np.float32), cls
+
+def greedy_nms(xyxy, conf, cls, iou_threshold, agnostic=False):
+    """Textbook greedy NMS: keep the best box, suppress same-class boxes above the IoU"""
+    boxes = xyxy.astype(np.float64)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    suppressed = np.zeros(len(conf), dtype=bool)
+    keep = []
+    for i in np.argsort(-conf, kind='stable'):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        width = (np.minimum(boxes[i, 2], boxes[:, 2]) - np.maximum(boxes[i, 0], boxes[:, 0])).clip(0)
+        height = (np.minimum(boxes[i, 3], boxes[:, 3]) - np.maximum(boxes[i, 1], boxes[:, 1])).clip(0)
+        inter = width * height
+        iou = inter / (area[i] + area - inter)
+        same = True if agnostic else cls == cls[i]
+        suppressed |= (iou > iou_threshold) & same
+    return np.array(keep, dtype=np.int64)
+
+@pytest.mark.parametrize('agnostic', [False, True])
+@pytest.mark.parametrize('count', COUNTS)
+def test_nms_matches_greedy_reference(count, agnostic):
+    xyxy, conf, cls = crowded(count, seed=count)
+    keep = nms(xyxy, conf, cls, 0.7, max_det=None, agnostic=agnostic)
+    reference = greedy_nms(xyxy, conf, cls, 0.7, agnostic)
+    # Same boxes, in the same (descending confidence) order
+    np.testing.assert_array_equal(keep, reference)
+
+@pytest.mark.parametrize('iou', [0.3, 0.5, 0.9])
+def test_nms_thresholds(iou):
+    xyxy, conf, cls = crowded(1000, seed=1)
+    np.testing.assert_array_equal(nms(xyxy, conf, cls, iou, max_det=None),
+                                  greedy_nms(xyxy, conf, cls, iou))
+
+def test_nms_max_det_keeps_the_best():
+    xyxy, conf, cls = crowded(3000, seed=2)
+    reference = greedy_nms(xyxy, conf, cls, 0.7)
+    for max_det in (0, 1, 10, len(reference), len(reference) + 5):
+        np.testing.assert_array_equal(nms(xyxy, conf, cls, 0.7, max_det=max_det),
+                                      reference[:max_det])
+
+@pytest.mark.parametrize('count', [0, 1, 100, NMS_SWITCH + 1, 6000])
+def test_nms_matches_torchvision(count):
+    torch = pytest.importorskip('torch')
+    torchvision = pytest.importorskip('torchvision')
+    xyxy, conf, cls = crowded(count, seed=count)
+    tensors = torch.from_numpy(xyxy), torch.from_numpy(conf), torch.from_numpy(cls)
+    np.testing.assert_array_equal(nms(xyxy, conf, cls, 0.7, max_det=None),
+                                  torchvision.ops.batched_nms(*tensors, 0.7).numpy())
+    np.testing.assert_array_equal(nms(xyxy, conf, cls, 0.7, max_det=None, agnostic=True),
+                                  torchvision.ops.nms(tensors[0], tensors[1], 0.7).numpy())
+
+def raw_output(count, anchors=8400, classes=4, seed=0):
+    """(4 + classes, anchors) exported layout with `count` anchors above conf 0.25"""
+    rng = np.random.default_rng(seed)
+    xyxy, conf, cls = crowded(count, seed, classes)
+    pred = np.zeros((4 + classes, anchors), dtype=np.float32)
+    pred[:2] = rng.uniform(0, 640, (2, anchors))
+    pred[2:4] = rng.uniform(10, 160, (2, anchors))
+    pred[4:] = rng.uniform(0, 0.2, (classes, anchors))
+    slots = rng.choice(anchors, count, replace=False)
+    pred[:2, slots] = ((xyxy[:, :2] + xyxy[:, 2:]) / 2).T
+    pred[2:4, slots] = (xyxy[:, 2:] - xyxy[:, :2]).T
+    pred[4 + cls, slots] = conf
+    return pred, slots
+
+def test_decode_keeps_confident_anchors():
+    pred, slots = raw_output(500)
+    xyxy, conf, cls = decode(pred, conf=0.25, top_k=None)
+    assert len(conf) == len(slots)
+    assert (conf > 0.25).all()
+    np.testing.assert_allclose(xyxy[:, 2:] - xyxy[:, :2], pred[2:4, np.sort(slots)].T, rtol=1e-5)
+
+def test_decode_top_k_keeps_the_most_confident():
+    pred, _ = raw_output(2000, seed=3)
+    _, every, _ = decode(pred, top_k=None)
+    _, top, _ = decode(pred, top_k=100)
+    np.testing.assert_array_equal(np.sort(top), np.sort(every)[-100:])
+
+def test_postprocess_matches_decode_then_greedy():
+    pred, _ = raw_output(3000, seed=4)
+    detections = postprocess(pred, conf=0.25, iou=0.7, max_det=300)
+    xyxy, conf, cls = decode(pred, 0.25)
+    reference = greedy_nms(xyxy, conf, cls, 0.7)[:300]
+    np.testing.assert_array_equal(detections.xyxy, xyxy[reference])
+    np.testing.assert_array_equal(detections.cls, cls[reference])
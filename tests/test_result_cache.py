@@ -0,0 +1,47 @@
+"""
+Result cache keys: an image file must map to one entry whichever path reads it
+"""
+import cv2
+import numpy as np
+import pytest
+
+from detections import Detections
+from image_batch import DetectionTable, read_image, run_image_batch
+from result_cache import ResultCache, content_digest, settings_namespace
+
+@pytest.fixture
+def image_file(tmp_path):
+    path = tmp_path / "frame.jpg"
+    image = np.random.default_rng(0).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    cv2.imwrite(str(path), image)
+    return path
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(tmp_path / "cache.sqlite").open()
+    yield cache
+    cache.close()
+
+def test_batch_digest_is_file_digest(image_file):
+    _, digest, _ = read_image(image_file, lookup=lambda digest: None)
+    assert digest == content_digest(image_file.read_bytes())
+
+def test_single_image_and_batch_share_an_entry(image_file, cache, tmp_path):
+    pytest.importorskip("supervision")
+    inference = pytest.importorskip("inference")
+    namespace = settings_namespace("weights", imgsz=640)
+    boxes = Detections(np.array([[1, 2, 30, 40]], dtype=np.float32),
+                       np.array([0.9], dtype=np.float32), np.array([1]))
+
+    with DetectionTable(tmp_path / "results.csv") as table:
+        run_image_batch([image_file], lambda images: [boxes] * len(images), table,
+                        cache=cache, namespace=namespace)
+
+    class Model:
+        names = {0: 'CT', 1: 'T'}
+
+    # A hit never reaches the model, so a bare object with class names will do
+    inference.run_inference_image(Model(), image_file, tmp_path / "annotated.jpg",
+                                  cache=cache, namespace=namespace)
+    assert cache.hits == 1
+    assert cache.stats()['entries'] == 1
@@ -0,0 +1,39 @@
+"""
+ROI + periphery merging: one object found by both passes is reported once
+"""
+import numpy as np
+
+from detections import Detections
+from roi import CenterRoi
+
+def boxes(*rows):
+    data = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return Detections(data[:, :4], data[:, 4], data[:, 5].astype(np.int64))
+
+def run(roi, full, roi_boxes):
+    """One frame with a full pass; detect_fn answers per pass"""
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    def detect_fn(image, imgsz):
+        if image.shape[:2] == frame.shape[:2]:
+            return full
+        return roi_boxes.offset(-640, -220)
+
+    return roi.detect(frame, detect_fn)
+
+def test_player_across_roi_border_is_kept_once():
+    roi = CenterRoi(640, full_every=1)   # window (640, 220) - (1280, 860)
+    # Mostly outside on the right: the ROI pass only sees a sliver of it
+    full = boxes([1200, 400, 1500, 700, 0.9, 2])
+    cut = boxes([1200, 400, 1280, 700, 0.8, 2])
+    merged = run(roi, full, cut)
+    assert len(merged) == 1
+    np.testing.assert_array_equal(merged.xyxy, cut.xyxy)
+
+def test_distinct_periphery_objects_survive():
+    roi = CenterRoi(640, full_every=1)
+    full = boxes([1200, 400, 1500, 700, 0.9, 2],     # same place, other class
+                 [100, 100, 200, 300, 0.9, 0])       # far away
+    inside = boxes([1200, 400, 1280, 700, 0.8, 0])
+    merged = run(roi, full, inside)
+    assert len(merged) == 3
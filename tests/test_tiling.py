@@ -0,0 +1,30 @@
+"""
+Cross-tile merging: a player cut by a tile seam is reported once, as a whole box
+"""
+import numpy as np
+
+from detections import Detections
+from tiling import merge_tiles
+
+def boxes(*rows):
+    data = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return Detections(data[:, :4], data[:, 4], data[:, 5].astype(np.int64))
+
+def test_box_cut_at_tile_edge_is_merged():
+    # IoU 0.4: plain NMS at 0.5 keeps both
+    merged = merge_tiles(boxes([100, 100, 200, 200, 0.7, 1],
+                               [100, 100, 140, 200, 0.8, 1]))
+    assert len(merged) == 1
+    # The whole player's extent, at the best confidence
+    np.testing.assert_array_equal(merged.xyxy, [[100, 100, 200, 200]])
+    np.testing.assert_allclose(merged.conf, [0.8])
+
+def test_other_classes_and_separate_players_are_kept():
+    merged = merge_tiles(boxes([100, 100, 200, 200, 0.9, 1],
+                               [100, 100, 140, 200, 0.8, 0],    # same place, other class
+                               [190, 100, 290, 200, 0.7, 1]))   # neighbour, 10% overlap
+    assert len(merged) == 3
+    np.testing.assert_array_equal(np.sort(merged.cls), [0, 1, 1])
+
+def test_merge_of_nothing():
+    assert len(merge_tiles(Detections.empty())) == 0
@@ -0,0 +1,61 @@
+"""
+Detect-every-N tracking: propagated confidence and the forced model passes it triggers
+"""
+import numpy as np
+
+from detections import Detections
+from tracker import DetectionScheduler, KalmanBoxTracker, TrackingDetector
+
+class Scene:
+    """detect_fn over a steady player walking right, plus a newcomer from `arrives` on"""
+
+    def __init__(self, conf=0.9, newcomer_conf=0.42, arrives=None):
+        self.conf = conf
+        self.newcomer_conf = newcomer_conf
+        self.arrives = arrives
+        self.frame = 0
+        self.passes = []
+
+    def __call__(self, frame):
+        self.passes.append(self.frame)
+        x = 100 + 2 * self.frame
+        rows = [([x, 300, x + 40, 400], self.conf)]
+        if self.arrives is not None and self.frame >= self.arrives:
+            rows.append(([900, 300, 940, 400], self.newcomer_conf))
+        return Detections([box for box, _ in rows], [conf for _, conf in rows], [0] * len(rows))
+
+def run(scene, frames, **scheduler):
+    # The demo's defaults: --detect-every 6, --track-min-conf 0.25
+    scheduler = {'max_interval': 6, 'min_conf': 0.25, **scheduler}
+    tracking = TrackingDetector(scene, KalmanBoxTracker(), DetectionScheduler(**scheduler))
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+    for scene.frame in range(frames):
+        tracking(image)
+    return tracking
+
+def test_steady_track_is_not_forced():
+    tracking = run(Scene(conf=0.4), 60)
+    assert tracking.scheduler.forced == 0
+    assert tracking.scheduler.interval == 6
+
+def test_new_weak_track_forces_a_pass_before_the_interval():
+    # Interval has grown to 6 by the time the newcomer is picked up
+    scene = Scene(arrives=30)
+    tracking = run(scene, 60)
+    spawned = next(f for f in scene.passes if f >= 30)
+    following = next(f for f in scene.passes if f > spawned)
+    assert tracking.scheduler.forced >= 1
+    assert following - spawned < 6
+
+def test_confidence_falls_with_uncertainty_not_with_time_alone():
+    tracker = KalmanBoxTracker()
+    tracker.update(Detections([[100, 300, 140, 400]], [0.8], [0]))
+    assert tracker.confidences()[0] == np.float32(0.8)
+    previous = 0.8
+    for _ in range(5):
+        tracker.predict()
+        conf = tracker.confidences()[0]
+        assert conf < previous
+        previous = conf
+    # Unknown velocity: a fresh track is far less certain after 5 frames
+    assert previous < 0.8 * 0.5